@@ -0,0 +1,98 @@
+#!/usr/bin/env python
+'''
+Compares a configuration standard pushed in full and with --diff-only.
+
+A local ciscosim server delays its answers by --rtt seconds. The standard is
+--lines NTP/SNMP/logging lines plus an interface section, first pushed to
+two switches. Then --changed lines are modified and the standard is pushed
+in full to one switch, and with --diff-only to the other one: reading its
+running configuration, again once up to date, then from the snapshot left
+by the previous run.
+
+    python benchmarks/bench_diff.py --lines 400 --changed 5 --rtt 0.02
+'''
+
+import argparse
+import logging
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from ciscosim import DeviceSimulator  # noqa
+from ciscomation.ciscomate import run_commands  # noqa
+
+
+def standard(lines, changed):
+    block = ['configure terminal']
+    for index in range(lines):
+        version = 2 if index < changed else 1
+        block.append(
+            [
+                'ntp server 10.{}.{}.{}',
+                'snmp-server host 10.{}.{}.{} version 2c public',
+                'logging host 10.{}.{}.{}',
+            ][index % 3].format(version, index // 250, index % 250)
+        )
+    block += [
+        'interface GigabitEthernet1/0/1',
+        ' description uplink',
+        ' switchport mode trunk',
+        'exit',
+        'end'
+    ]
+    return block
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--lines', type=int, default=400)
+    parser.add_argument('--changed', type=int, default=5)
+    parser.add_argument('--rtt', type=float, default=0.02)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.CRITICAL)
+    logging.getLogger('paramiko').setLevel(logging.CRITICAL)
+    simulator = DeviceSimulator('0.0.0.0', rtt=args.rtt, output_lines=0)
+    simulator.start()
+    workdir = tempfile.mkdtemp()
+    config_cache = {'directory': workdir, 'ttl': 3600}
+    try:
+        for host in ('127.0.0.1', '127.0.0.2'):
+            run_commands(
+                host, 'bench', 'bench', port=simulator.port,
+                commands=standard(args.lines, 0),
+                diff_only=True
+            )
+        diff_kwargs = {'diff_only': True, 'config_cache': config_cache}
+        runs = [
+            ('full push', '127.0.0.1', {}),
+            ('diff-only', '127.0.0.2', diff_kwargs),
+            ('up to date', '127.0.0.2', diff_kwargs),
+            ('snapshot', '127.0.0.2', diff_kwargs),
+        ]
+        block = standard(args.lines, args.changed)
+        for label, host, kwargs in runs:
+            start = time.time()
+            result = run_commands(
+                host, 'bench', 'bench', port=simulator.port,
+                commands=list(block), **kwargs
+            )[host]
+            elapsed = time.time() - start
+            assert result['all_commands_ok'], result['logs']
+            if label == 'snapshot':
+                assert [log for log in result['logs'] if 'snapshot' in log[1]]
+            print('{:<13} sent={:<5} skipped={:<5} {:8.2f}s'.format(
+                label,
+                result.get('lines_sent', len(block) - 3),
+                result.get('lines_skipped', 0),
+                elapsed
+            ))
+    finally:
+        shutil.rmtree(workdir)
+
+
+if __name__ == '__main__':
+    main()
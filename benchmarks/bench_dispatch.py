@@ -0,0 +1,97 @@
+#!/usr/bin/env python
+'''
+Compares mp_manager dispatch modes on simulated hosts.
+
+Every simulated host sleeps for a given latency instead of talking SSH. Most
+hosts are fast, a few are very slow (a long show tech or a dead host reaching
+the timeout), which is the case where static round robin sharding leaves
+workers idle while one shard is still busy.
+
+    python benchmarks/bench_dispatch.py --hosts 800 --procnum 16
+'''
+
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from ciscomation.ciscomation_mp import mp_manager  # noqa
+
+
+def simulated_host(host, latency):
+    '''
+    Stands for run_commands, sleeps latency seconds and returns the same
+    result structure.
+    '''
+    time.sleep(latency)
+    return {
+        host: {
+            'driver': 'ios',
+            'status_ok': True,
+            'all_commands_ok': True,
+            'commands': [{'show version': 'simulated'}],
+            'logs': []
+        }
+    }
+
+
+def skewed_latencies(hosts, fast, slow, slow_ratio, seed):
+    '''
+    Returns a list of latencies, slow_ratio of them being slow.
+    '''
+    rand = random.Random(seed)
+    latencies = []
+    for _ in range(hosts):
+        if rand.random() < slow_ratio:
+            latencies.append(slow * rand.uniform(0.5, 1.0))
+        else:
+            latencies.append(fast * rand.uniform(0.5, 1.5))
+    return latencies
+
+
+def run(dispatch, latencies, procnum):
+    args_list = [
+        {
+            'args': ['host-{}'.format(index), latency],
+            'kwargs': {}
+        }
+        for index, latency in enumerate(latencies)
+    ]
+    start = time.time()
+    results = mp_manager(
+        simulated_host,
+        args_list,
+        threads_count=procnum,
+        dispatch=dispatch
+    )
+    elapsed = time.time() - start
+    assert len(results) == len(latencies)
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--hosts', type=int, default=800)
+    parser.add_argument('--procnum', type=int, default=16)
+    parser.add_argument('--fast', type=float, default=0.05)
+    parser.add_argument('--slow', type=float, default=3.0)
+    parser.add_argument('--slow-ratio', type=float, default=0.03)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+    latencies = skewed_latencies(
+        args.hosts, args.fast, args.slow, args.slow_ratio, args.seed
+    )
+    ideal = max(sum(latencies) / args.procnum, max(latencies))
+    print('{} hosts, {} processes, total work {:.2f}s, lower bound {:.2f}s'
+          .format(args.hosts, args.procnum, sum(latencies), ideal))
+    for dispatch in ('roundrobin', 'shared'):
+        elapsed = run(dispatch, latencies, args.procnum)
+        print('{:<12} {:8.2f}s  ({:.2f}x lower bound)'.format(
+            dispatch, elapsed, elapsed / ideal))
+
+
+if __name__ == '__main__':
+    main()
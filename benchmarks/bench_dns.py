@@ -0,0 +1,76 @@
+#!/usr/bin/env python
+'''
+Measures xml_to_maintenance name resolution with a slow stubbed resolver.
+
+hostname_resolves is replaced by a stub sleeping --latency seconds per
+lookup. The maintenance is read with one lookup at a time (the former
+behaviour), with --dns-workers concurrent lookups, then again with the DNS
+cache warmed up by the previous run.
+
+    python benchmarks/bench_dns.py --hosts 2000 --latency 0.01
+'''
+
+import argparse
+import logging
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from ciscomation import ciscomation_xml  # noqa
+from ciscomation.ciscomation_cache import TTLCache  # noqa
+
+
+def write_maintenance(filename, hosts):
+    with open(filename, 'w') as xmlfile:
+        xmlfile.write('<?xml version="1.0" encoding="UTF-8"?>\n<switches>\n')
+        for index in range(hosts):
+            xmlfile.write(
+                '<switch><name>sw-{}.bench.net</name><commands>\n'
+                'show version\n</commands></switch>\n'.format(index)
+            )
+        xmlfile.write('</switches>\n')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--hosts', type=int, default=2000)
+    parser.add_argument('--latency', type=float, default=0.01)
+    parser.add_argument('--dns-workers', type=int, default=32)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.CRITICAL)
+
+    def stub_resolves(hostname):
+        time.sleep(args.latency)
+        return (True, '192.0.2.1')
+
+    ciscomation_xml.hostname_resolves = stub_resolves
+    workdir = tempfile.mkdtemp()
+    try:
+        xmlfile = os.path.join(workdir, 'maintenance.xml')
+        write_maintenance(xmlfile, args.hosts)
+        cache = os.path.join(workdir, 'dns.json')
+        runs = [
+            ('sequential', 1, False),
+            ('concurrent', args.dns_workers, False),
+            ('cold cache', args.dns_workers, True),
+            ('warm cache', args.dns_workers, True),
+        ]
+        for label, workers, use_cache in runs:
+            start = time.time()
+            dns_cache = TTLCache(cache, ttl=3600) if use_cache else None
+            maint = ciscomation_xml.xml_to_maintenance(
+                xmlfile, dns_workers=workers, dns_cache=dns_cache
+            )
+            assert len(maint['actions']) == args.hosts
+            print('{:<12} workers={:<4} {:8.2f}s'.format(
+                label, workers, time.time() - start))
+    finally:
+        shutil.rmtree(workdir)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,198 @@
+#!/usr/bin/env python
+'''
+End to end throughput of run_commands, run_maint and mp_manager.
+
+A local ciscosim server, in its own process, stands for --sizes fleets of
+simulated IOS and NX-OS hosts (distinct loopback addresses 127.0.x.y), with
+latency, jitter, rejected logins and hung hosts as asked. Every host runs
+show commands and a small configuration change. run_commands is driven in a
+plain loop, up to --serial-max hosts, run_maint and mp_manager with
+--procnum workers.
+
+For every run the script prints hosts/s, the p95 of the time spent on a
+host (sum of its timings), the peak RSS of the benchmark process and its
+children, the simulator excluded (Linux only), and the hosts logged in whose
+software version was not found.
+
+    python benchmarks/bench_e2e.py --sizes 10 100 1000 --procnum 32
+'''
+
+import argparse
+import logging
+import multiprocessing
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from bench_engines import RssSampler  # noqa
+from ciscosim import DeviceSimulator  # noqa
+from ciscomation.ciscomate import run_commands  # noqa
+from ciscomation.ciscomate import run_maint  # noqa
+from ciscomation.ciscomation_mp import mp_manager  # noqa
+from ciscomation.ciscomation_timing import percentiles  # noqa
+
+COMMANDS = [
+    'show clock',
+    'show interfaces status',
+    'configure terminal',
+    'interface GigabitEthernet1/0/1',
+    ' description e2e benchmark',
+    'end',
+]
+
+
+def serve(port, settings):
+    simulator = DeviceSimulator('0.0.0.0', port, **settings)
+    simulator.serve_forever()
+
+
+def addresses(hosts):
+    return [
+        '127.0.{}.{}'.format(index // 250, index % 250 + 1)
+        for index in range(hosts)
+    ]
+
+
+def run(scenario, hosts, args, simulator_pid):
+    '''
+    Runs scenario on hosts simulated hosts, returns the feedbacks and the
+    elapsed seconds.
+    '''
+    start = time.time()
+    if scenario == 'run_commands':
+        feedbacks = [
+            run_commands(
+                address, 'bench', 'bench', commands=list(COMMANDS),
+                port=args.port, address=address
+            )[address]
+            for address in addresses(hosts)
+        ]
+    elif scenario == 'run_maint':
+        feedbacks = run_maint(
+            {
+                'mp_compat': True,
+                'actions': [
+                    {
+                        'swname': address,
+                        'ip': address,
+                        'pause': False,
+                        'commands': list(COMMANDS)
+                    }
+                    for address in addresses(hosts)
+                ]
+            },
+            ('bench', 'bench'),
+            procnum=args.procnum,
+            engine=args.engine,
+            port=args.port
+        ).values()
+    else:
+        feedbacks = [
+            data.values()[0]
+            for data in mp_manager(
+                run_commands,
+                [
+                    {
+                        'args': [address, 'bench', 'bench'],
+                        'kwargs': {
+                            'commands': list(COMMANDS),
+                            'port': args.port,
+                            'address': address
+                        }
+                    }
+                    for address in addresses(hosts)
+                ],
+                threads_count=args.procnum
+            )
+        ]
+    return feedbacks, time.time() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--sizes', type=int, nargs='+',
+                        default=[10, 100, 1000])
+    parser.add_argument('--scenarios', nargs='+',
+                        default=['run_commands', 'run_maint', 'mp_manager'])
+    parser.add_argument('--procnum', type=int, default=32)
+    parser.add_argument('--engine', default='mp',
+                        help='engine of the run_maint scenario')
+    parser.add_argument('--serial-max', type=int, default=100,
+                        help='largest size run with run_commands in a loop')
+    parser.add_argument('--port', type=int, default=2222)
+    parser.add_argument('--latency', type=float, default=0.02)
+    parser.add_argument('--jitter', type=float, default=0.02)
+    parser.add_argument('--output-lines', type=int, default=50)
+    parser.add_argument('--nxos-ratio', type=float, default=0.3)
+    parser.add_argument('--auth-failure-ratio', type=float, default=0.0)
+    parser.add_argument('--hang-ratio', type=float, default=0.0)
+    parser.add_argument('--hang-time', type=float, default=20.0)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.CRITICAL)
+    logging.getLogger('paramiko').setLevel(logging.CRITICAL)
+    simulator = multiprocessing.Process(
+        target=serve,
+        args=(
+            args.port,
+            {
+                'latency': args.latency,
+                'jitter': args.jitter,
+                'output_lines': args.output_lines,
+                'nxos_ratio': args.nxos_ratio,
+                'auth_failure_ratio': args.auth_failure_ratio,
+                'hang_ratio': args.hang_ratio,
+                'hang_time': args.hang_time
+            }
+        )
+    )
+    simulator.daemon = True
+    simulator.start()
+    time.sleep(2)
+    try:
+        for hosts in args.sizes:
+            for scenario in args.scenarios:
+                if scenario == 'run_commands' and hosts > args.serial_max:
+                    print('{:<13} hosts={:<5} skipped, above --serial-max'
+                          .format(scenario, hosts))
+                    continue
+                sampler = RssSampler(simulator.pid)
+                sampler.start()
+                feedbacks, elapsed = run(scenario, hosts, args, simulator.pid)
+                sampler.running = False
+                sampler.join()
+                host_times = [
+                    sum(feedback.get('timings', {}).values())
+                    for feedback in feedbacks
+                ]
+                failed = len([
+                    feedback for feedback in feedbacks
+                    if not feedback['all_commands_ok']
+                ])
+                nxos = len([
+                    feedback for feedback in feedbacks
+                    if feedback['driver'] == 'nxos'
+                ])
+                # logged in hosts whose show version was not understood
+                no_version = len([
+                    feedback for feedback in feedbacks
+                    if feedback['status_ok'] and feedback['version'] is None
+                ])
+                print(
+                    '{:<13} hosts={:<5} {:8.2f}s {:8.1f} hosts/s  p95 host '
+                    '{:6.2f}s  peak rss {:8.1f} MiB  nxos {}  no version {}  '
+                    'failed {}'
+                    .format(
+                        scenario, hosts, elapsed, hosts / elapsed,
+                        percentiles(host_times, (95,))[0],
+                        sampler.peak / 1024.0, nxos, no_version, failed
+                    )
+                )
+                sys.stdout.flush()
+    finally:
+        simulator.terminate()
+
+
+if __name__ == '__main__':
+    main()
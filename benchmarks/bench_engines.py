@@ -0,0 +1,163 @@
+#!/usr/bin/env python
+'''
+Compares throughput and memory of the mp, threads and async engines.
+
+A local ciscosim server stands for the devices. Every job is a real
+run_commands call (SSH login, autoinit, show version, commands), hosts are
+distinct loopback addresses 127.0.x.y. Peak RSS is the sum over the benchmark
+process and its children, the simulator excluded (Linux only).
+
+    python benchmarks/bench_engines.py --hosts 100 --procnum 32 --sessions 100
+'''
+
+import argparse
+import logging
+import multiprocessing
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from ciscosim import DeviceSimulator  # noqa
+from ciscomation.ciscomate import run_commands  # noqa
+from ciscomation.ciscomation_async import async_manager  # noqa
+from ciscomation.ciscomation_mp import mp_manager  # noqa
+from ciscomation.ciscomation_threads import cancellable_sleep  # noqa
+from ciscomation.ciscomation_threads import thread_manager  # noqa
+
+COMMANDS = ['show clock', '--sleep-1', 'show interfaces status']
+
+
+def serve(port, latency):
+    simulator = DeviceSimulator('0.0.0.0', port, latency)
+    simulator.serve_forever()
+
+
+def process_tree_rss(root, exclude):
+    '''
+    Sums the resident memory in KiB of root and all its descendants except
+    the exclude pid.
+    '''
+    parents = {}
+    rss = {}
+    for pid in os.listdir('/proc'):
+        if not pid.isdigit():
+            continue
+        try:
+            with open('/proc/{}/stat'.format(pid)) as stat:
+                fields = stat.read().rsplit(')', 1)[1].split()
+        except IOError:
+            continue
+        parents[int(pid)] = int(fields[1])
+        rss[int(pid)] = int(fields[21]) * os.sysconf('SC_PAGE_SIZE') / 1024
+    total = 0
+    for pid in rss:
+        current = pid
+        while current in parents and current != root:
+            current = parents[current]
+            if current == exclude:
+                break
+        if current == root and pid != exclude:
+            total += rss[pid]
+    return total
+
+
+class RssSampler(threading.Thread):
+    '''
+    Keeps the peak of process_tree_rss while running.
+    '''
+    def __init__(self, exclude):
+        threading.Thread.__init__(self)
+        self.daemon = True
+        self.exclude = exclude
+        self.peak = 0
+        self.running = True
+
+    def run(self):
+        while self.running:
+            self.peak = max(
+                self.peak, process_tree_rss(os.getpid(), self.exclude)
+            )
+            time.sleep(0.2)
+
+
+def jobs(hosts, port, engine):
+    args_list = []
+    for index in range(hosts):
+        kwargs = {
+            'commands': list(COMMANDS),
+            'port': port,
+        }
+        if engine != 'mp':
+            kwargs['sleeper'] = cancellable_sleep
+        args_list.append(
+            {
+                'args': [
+                    '127.0.{}.{}'.format(index // 250, index % 250 + 1),
+                    'bench',
+                    'bench'
+                ],
+                'kwargs': kwargs
+            }
+        )
+    return args_list
+
+
+def run(engine, hosts, procnum, port, simulator_pid):
+    sampler = RssSampler(simulator_pid)
+    sampler.start()
+    start = time.time()
+    if engine == 'async':
+        results = async_manager(
+            run_commands, jobs(hosts, port, engine), sessions=procnum
+        )
+    elif engine == 'threads':
+        results = thread_manager(
+            run_commands, jobs(hosts, port, engine), threads_count=procnum
+        )
+    else:
+        results = mp_manager(
+            run_commands, jobs(hosts, port, engine), threads_count=procnum
+        )
+    elapsed = time.time() - start
+    sampler.running = False
+    sampler.join()
+    failed = len([
+        data for data in results if not data.values()[0]['all_commands_ok']
+    ])
+    print('{:<7} procnum={:<5} {:7.2f}s {:7.1f} hosts/s  peak rss {:8.1f} MiB'
+          '  failed {}'.format(engine, procnum, elapsed, hosts / elapsed,
+                               sampler.peak / 1024.0, failed))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--hosts', type=int, default=100)
+    parser.add_argument('--procnum', type=int, default=32)
+    parser.add_argument('--sessions', type=int, default=0,
+                        help='extra async run with this many sessions')
+    parser.add_argument('--latency', type=float, default=0.05)
+    parser.add_argument('--port', type=int, default=2222)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.CRITICAL)
+    logging.getLogger('paramiko').setLevel(logging.CRITICAL)
+    simulator = multiprocessing.Process(
+        target=serve, args=(args.port, args.latency)
+    )
+    simulator.daemon = True
+    simulator.start()
+    time.sleep(2)
+    try:
+        run('mp', args.hosts, args.procnum, args.port, simulator.pid)
+        run('threads', args.hosts, args.procnum, args.port, simulator.pid)
+        run('async', args.hosts, args.procnum, args.port, simulator.pid)
+        if args.sessions:
+            run('async', args.hosts, args.sessions, args.port, simulator.pid)
+    finally:
+        simulator.terminate()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,143 @@
+#!/usr/bin/env python
+'''
+Makespan of run_maint in xml order and longest first, on a mixed fleet.
+
+A local ciscosim server stands for --hosts simulated switches, --slow-ratio
+of them being chassis answering --slow-factor times slower, put last in the
+xml. Every switch runs the same commands, so only the duration history tells
+the chassis apart. The maintenance is run:
+
+- in xml order, which also fills a fresh duration history,
+- longest first without history, estimated from the number of commands,
+- longest first with the history of the first run.
+
+The three are repeated --runs times after a warm up run, the best makespan
+of each is printed.
+
+    python benchmarks/bench_ljf.py --hosts 96 --slow-ratio 0.05 --procnum 16
+'''
+
+import argparse
+import logging
+import multiprocessing
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from ciscosim import DeviceSimulator  # noqa
+from ciscosim import sim_hostname  # noqa
+from ciscomation.ciscomate import run_maint  # noqa
+from ciscomation.ciscomation_history import HISTORY_FILE  # noqa
+
+COMMANDS = [
+    'show clock',
+    'show interfaces status',
+    'show vlan brief',
+    'show cdp neighbors',
+]
+
+
+def serve(port, settings):
+    simulator = DeviceSimulator('0.0.0.0', port, **settings)
+    simulator.serve_forever()
+
+
+def maintenance(hosts, slow_ratio):
+    '''
+    Returns the maintenance of hosts switches, the slow ones last.
+    '''
+    addresses = [
+        '127.0.{}.{}'.format(index // 250, index % 250 + 1)
+        for index in range(hosts)
+    ]
+    addresses.sort(
+        key=lambda address: DeviceSimulator.picked(
+            sim_hostname(address), slow_ratio, 'slow'
+        )
+    )
+    return {
+        'mp_compat': True,
+        'actions': [
+            {
+                'swname': address,
+                'ip': address,
+                'pause': False,
+                'commands': list(COMMANDS)
+            }
+            for address in addresses
+        ]
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--hosts', type=int, default=96)
+    parser.add_argument('--slow-ratio', type=float, default=0.05)
+    parser.add_argument('--slow-factor', type=float, default=20.0)
+    parser.add_argument('--procnum', type=int, default=16)
+    parser.add_argument('--engine', default='mp')
+    parser.add_argument('--port', type=int, default=2222)
+    parser.add_argument('--latency', type=float, default=0.05)
+    parser.add_argument('--runs', type=int, default=3)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.CRITICAL)
+    logging.getLogger('paramiko').setLevel(logging.CRITICAL)
+    simulator = multiprocessing.Process(
+        target=serve,
+        args=(
+            args.port,
+            {
+                'latency': args.latency,
+                'slow_ratio': args.slow_ratio,
+                'slow_factor': args.slow_factor
+            }
+        )
+    )
+    simulator.daemon = True
+    simulator.start()
+    time.sleep(2)
+    cache_dir = tempfile.mkdtemp()
+    history = {'filename': os.path.join(cache_dir, HISTORY_FILE)}
+    cases = (
+        ('xml order', history, False),
+        ('longest first, no history', None, True),
+        ('longest first, history', history, True),
+    )
+    best = {}
+    failed = dict((label, 0) for label, _, _ in cases)
+    try:
+        for warm_up, (label, settings, longest_first) in [
+            (True, cases[0])
+        ] + [(False, case) for case in cases * args.runs]:
+            start = time.time()
+            results = run_maint(
+                maintenance(args.hosts, args.slow_ratio),
+                ('bench', 'bench'),
+                procnum=args.procnum,
+                engine=args.engine,
+                port=args.port,
+                history=settings,
+                longest_first=longest_first
+            )
+            elapsed = time.time() - start
+            if warm_up:
+                continue
+            best[label] = min(best.get(label, elapsed), elapsed)
+            failed[label] += len([
+                feedback for feedback in results.values()
+                if not feedback['all_commands_ok']
+            ])
+        for label, _, _ in cases:
+            print('{:<27} makespan {:7.2f}s  failed {}'.format(
+                label, best[label], failed[label]))
+    finally:
+        simulator.terminate()
+        shutil.rmtree(cache_dir)
+
+
+if __name__ == '__main__':
+    main()
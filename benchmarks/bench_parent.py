@@ -0,0 +1,101 @@
+#!/usr/bin/env python
+'''
+Measures the CPU time spent by the mp_manager parent per result.
+
+Children return results shaped like run_commands ones, with --commands
+outputs of --output-kb KiB each and --logs log entries, without any SSH.
+Only the parent collects them, so its CPU time (user + system, threads
+included, children excluded) is the cost of the result collection path.
+
+    python benchmarks/bench_parent.py --hosts 2000 --output-kb 64
+'''
+
+import argparse
+import logging
+import os
+import resource
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from ciscomation.ciscomation_mp import mp_manager  # noqa
+
+
+def large_result(host, commands, output_kb, logs):
+    '''
+    Stands for run_commands, returns a result with large outputs.
+    '''
+    line = 'GigabitEthernet1/0/1 is up, line protocol is up (connected)\n'
+    output = line * (output_kb * 1024 // len(line))
+    return {
+        host: {
+            'driver': 'ios',
+            'version': '15.2(2)E6',
+            'status_ok': True,
+            'all_commands_ok': True,
+            'commands': [
+                {'show command {}'.format(index): output}
+                for index in range(commands)
+            ],
+            'logs': [
+                ('info', '{} log entry {}'.format(host, index))
+                for index in range(logs)
+            ]
+        }
+    }
+
+
+def parent_cpu():
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    return usage.ru_utime + usage.ru_stime
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--hosts', type=int, default=2000)
+    parser.add_argument('--procnum', type=int, default=8)
+    parser.add_argument('--commands', type=int, default=4)
+    parser.add_argument('--output-kb', type=int, default=64)
+    parser.add_argument('--logs', type=int, default=20)
+    parser.add_argument('--log-level', default='info')
+    args = parser.parse_args()
+    logfile = tempfile.NamedTemporaryFile(suffix='.log')
+    logging.basicConfig(
+        filename=logfile.name, level=args.log_level.upper()
+    )
+    args_list = [
+        {
+            'args': [
+                'host-{}'.format(index),
+                args.commands,
+                args.output_kb,
+                args.logs
+            ],
+            'kwargs': {}
+        }
+        for index in range(args.hosts)
+    ]
+    received = []
+    start = time.time()
+    cpu = parent_cpu()
+    mp_manager(
+        large_result,
+        args_list,
+        threads_count=args.procnum,
+        on_result=lambda data: received.append(data.keys()[0])
+    )
+    cpu = parent_cpu() - cpu
+    elapsed = time.time() - start
+    assert len(received) == args.hosts
+    logging.shutdown()
+    log_lines = sum(1 for line in open(logfile.name))
+    print('{} hosts, {} x {} KiB outputs: parent cpu {:.2f}s ({:.2f} ms per '
+          'host), elapsed {:.2f}s, {} log lines'.format(
+              args.hosts, args.commands, args.output_kb, cpu,
+              cpu * 1000 / args.hosts, elapsed, log_lines))
+
+
+if __name__ == '__main__':
+    main()
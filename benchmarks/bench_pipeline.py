@@ -0,0 +1,80 @@
+#!/usr/bin/env python
+'''
+Compares a block of show commands sent one by one and in a pipeline.
+
+A local ciscosim server delays its answers by --rtt seconds, like a switch
+behind a long WAN link. The same block runs plain, then between
+--pipeline-start and --pipeline-stop with each --windows value, and the
+recorded outputs must be the same.
+
+    python benchmarks/bench_pipeline.py --commands 200 --rtt 0.05
+'''
+
+import argparse
+import logging
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from ciscosim import DeviceSimulator  # noqa
+from ciscomation.ciscomate import run_commands  # noqa
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--commands', type=int, default=200)
+    parser.add_argument('--rtt', type=float, default=0.05)
+    parser.add_argument('--windows', type=int, nargs='+', default=[20, 200])
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.CRITICAL)
+    logging.getLogger('paramiko').setLevel(logging.CRITICAL)
+    simulator = DeviceSimulator(rtt=args.rtt)
+    simulator.start()
+    commands = [
+        'show interface Gi1/0/{}'.format(index)
+        for index in range(args.commands)
+    ]
+    runs = [('one by one', None, commands)]
+    for window in args.windows:
+        runs.append(
+            (
+                'pipeline',
+                window,
+                ['--pipeline-start'] + commands + ['--pipeline-stop']
+            )
+        )
+    reference = None
+    for label, window, block in runs:
+        kwargs = {'port': simulator.port, 'commands': block}
+        if window:
+            kwargs['pipeline_window'] = window
+        start = time.time()
+        result = run_commands('127.0.0.1', 'bench', 'bench', **kwargs)
+        elapsed = time.time() - start
+        host_result = result['127.0.0.1']
+        assert host_result['all_commands_ok'], host_result['logs']
+        if reference is None:
+            reference = host_result['commands']
+        assert host_result['commands'] == reference
+        print('{:<12} window={:<5} {:8.2f}s'.format(
+            label, window or '-', elapsed))
+    # a failing command is flagged and stops the host after its window
+    block = (
+        ['--pipeline-start'] + commands[:5] + ['show bogus'] +
+        commands[5:10] + ['--pipeline-stop', 'show clock']
+    )
+    result = run_commands(
+        '127.0.0.1', 'bench', 'bench', port=simulator.port, commands=block,
+        pipeline_window=20
+    )['127.0.0.1']
+    assert not result['status_ok'] and not result['all_commands_ok']
+    assert result['commands'][5] == {'show bogus': None}
+    assert len(result['commands']) == 11
+    print('error in pipeline flagged on {}'.format(
+        result['commands'][5].keys()[0]))
+
+
+if __name__ == '__main__':
+    main()
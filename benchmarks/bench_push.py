@@ -0,0 +1,83 @@
+#!/usr/bin/env python
+'''
+Compares a large configuration block typed line by line and pushed as a file.
+
+A local ciscosim server delays its answers by --rtt seconds. The block is an
+access list of --lines entries, typed in configuration mode, then uploaded
+with --file-push-start over SCP and over SFTP. The simulated running
+configuration must receive every line each time.
+
+    python benchmarks/bench_push.py --lines 1000 --rtt 0.02
+'''
+
+import argparse
+import logging
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from ciscosim import DeviceSimulator  # noqa
+from ciscomation.ciscomate import run_commands  # noqa
+
+HOSTNAME = 'sim-127-0-0-1'
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--lines', type=int, default=1000)
+    parser.add_argument('--rtt', type=float, default=0.02)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.CRITICAL)
+    logging.getLogger('paramiko').setLevel(logging.CRITICAL)
+    simulator = DeviceSimulator(rtt=args.rtt, output_lines=0)
+    simulator.start()
+    acl = ['ip access-list extended BENCH'] + [
+        ' permit tcp host 10.0.{}.{} any eq 443'.format(index // 250,
+                                                      index % 250)
+        for index in range(args.lines)
+    ]
+    runs = [
+        ('typed', 'scp', ['configure terminal'] + acl + ['end']),
+        (
+            'file push',
+            'scp',
+            ['--file-push-start'] + acl + ['--file-push-stop']
+        ),
+        (
+            'file push',
+            'sftp',
+            ['--file-push-start'] + acl + ['--file-push-stop']
+        ),
+    ]
+    for label, transfer, block in runs:
+        simulator.running = {}
+        start = time.time()
+        result = run_commands(
+            '127.0.0.1', 'bench', 'bench', port=simulator.port,
+            commands=block, file_transfer=transfer
+        )['127.0.0.1']
+        elapsed = time.time() - start
+        assert result['all_commands_ok'], result['logs']
+        if label == 'file push':
+            assert simulator.running[HOSTNAME] == acl
+            assert not simulator.files
+        print('{:<10} {:<5} {:8.2f}s'.format(
+            label, transfer if label == 'file push' else '-', elapsed))
+    # an invalid line is reported on the copy command
+    block = (
+        ['--file-push-start'] + acl[:10] + [' bogus entry'] +
+        ['--file-push-stop', 'show clock']
+    )
+    result = run_commands(
+        '127.0.0.1', 'bench', 'bench', port=simulator.port, commands=block
+    )['127.0.0.1']
+    assert not result['status_ok'] and not result['all_commands_ok']
+    assert result['commands'][-1].values() == [None]
+    print('error in pushed file flagged on {}'.format(
+        result['commands'][-1].keys()[0]))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,123 @@
+#!/usr/bin/env python
+'''
+Peak memory of a maintenance of large outputs, spilled to disk or not.
+
+A local ciscosim server stands for --hosts simulated switches answering show
+tech-support with --large-lines lines. Every switch runs it --repeats times,
+the results are written by a ResultWriter and the cmd and summary reports
+built from them, as ciscomate does. The maintenance is run with every output
+kept in memory, then with the outputs above --threshold bytes spilled. The
+elapsed time and the peak RSS of the benchmark process and its children,
+the simulator excluded, are printed (Linux only).
+
+    python benchmarks/bench_spill.py --hosts 32 --large-lines 200000
+'''
+
+import argparse
+import logging
+import multiprocessing
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from bench_engines import RssSampler  # noqa
+from ciscosim import DeviceSimulator  # noqa
+from ciscomation.ciscomate import run_maint  # noqa
+from ciscomation.ciscomation_report import ResultWriter  # noqa
+from ciscomation.ciscomation_report import build_reports  # noqa
+
+
+def serve(port, settings):
+    simulator = DeviceSimulator('0.0.0.0', port, **settings)
+    simulator.serve_forever()
+
+
+def maintenance(hosts, repeats):
+    return {
+        'mp_compat': True,
+        'actions': [
+            {
+                'swname': address,
+                'ip': address,
+                'pause': False,
+                'commands': ['show clock'] + ['show tech-support'] * repeats
+            }
+            for address in [
+                '127.0.{}.{}'.format(index // 250, index % 250 + 1)
+                for index in range(hosts)
+            ]
+        ]
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--hosts', type=int, default=32)
+    parser.add_argument('--repeats', type=int, default=2)
+    parser.add_argument('--large-lines', type=int, default=200000)
+    parser.add_argument('--threshold', type=int, default=1024 * 1024)
+    parser.add_argument('--procnum', type=int, default=8)
+    parser.add_argument('--engine', default='mp')
+    parser.add_argument('--port', type=int, default=2222)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.CRITICAL)
+    logging.getLogger('paramiko').setLevel(logging.CRITICAL)
+    simulator = multiprocessing.Process(
+        target=serve,
+        args=(args.port, {'large_lines': args.large_lines})
+    )
+    simulator.daemon = True
+    simulator.start()
+    time.sleep(2)
+    workdir = tempfile.mkdtemp()
+    try:
+        for label, threshold in (
+            ('in memory', 0),
+            ('spilled', args.threshold)
+        ):
+            dumpfile = os.path.join(workdir, '{}.jsonl'.format(threshold))
+            spill = None
+            if threshold:
+                spill = {
+                    'directory': os.path.join(workdir, 'outputs'),
+                    'threshold': threshold
+                }
+            sampler = RssSampler(simulator.pid)
+            sampler.start()
+            start = time.time()
+            writer = ResultWriter(dumpfile)
+            try:
+                run_maint(
+                    maintenance(args.hosts, args.repeats),
+                    ('bench', 'bench'),
+                    procnum=args.procnum,
+                    engine=args.engine,
+                    port=args.port,
+                    on_result=writer.write,
+                    spill=spill
+                )
+            finally:
+                writer.close()
+            build_reports(
+                dumpfile,
+                cmdfile=os.path.join(workdir, 'cmd.txt'),
+                summaryfile=os.path.join(workdir, 'summary.txt')
+            )
+            elapsed = time.time() - start
+            sampler.running = False
+            sampler.join()
+            print('{:<10} {:8.2f}s  peak rss {:8.1f} MiB  dump {:8.1f} MiB'
+                  .format(label, elapsed, sampler.peak / 1024.0,
+                          os.path.getsize(dumpfile) / 1048576.0))
+            sys.stdout.flush()
+    finally:
+        simulator.terminate()
+        shutil.rmtree(workdir)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,73 @@
+#!/usr/bin/env python
+'''
+Measures the cold start of the ciscomate entry point and of its workers.
+
+Each case runs --runs times in a fresh interpreter, the best and median wall
+times are printed:
+
+- ciscomate -h, parsing the arguments only,
+- the import of ciscomation.ciscomate, what a worker started with the spawn
+  method (Windows) pays before its first host,
+- mp_manager starting --procnum forked children and getting a trivial
+  result from each.
+
+    python benchmarks/bench_startup.py --runs 10
+'''
+
+import argparse
+import os
+import subprocess
+import sys
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+MP_STARTUP = '''
+import sys
+sys.path.insert(0, {root!r})
+from ciscomation.ciscomation_mp import mp_manager
+from bench_startup import noop
+mp_manager(noop, [{{'args': [index], 'kwargs': {{}}}}
+                  for index in range({procnum})], threads_count={procnum})
+'''
+
+
+def noop(index):
+    return {'host-{}'.format(index): {'logs': []}}
+
+
+def measure(command, runs):
+    times = []
+    for _ in range(runs):
+        start = time.time()
+        subprocess.check_call(
+            command, cwd=ROOT, stdout=open(os.devnull, 'wb'),
+            env=dict(os.environ, PYTHONPATH=os.path.dirname(
+                os.path.abspath(__file__)))
+        )
+        times.append(time.time() - start)
+    times.sort()
+    return times[0], times[len(times) // 2]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--runs', type=int, default=10)
+    parser.add_argument('--procnum', type=int, default=16)
+    args = parser.parse_args()
+    cases = [
+        ('ciscomate -h', [sys.executable, '-m', 'ciscomation.ciscomate',
+                          '-h']),
+        ('import ciscomate', [sys.executable, '-c',
+                              'import ciscomation.ciscomate']),
+        ('mp_manager start', [sys.executable, '-c', MP_STARTUP.format(
+            root=ROOT, procnum=args.procnum)]),
+    ]
+    for label, command in cases:
+        best, median = measure(command, args.runs)
+        print('{:<18} best {:6.3f}s  median {:6.3f}s'.format(
+            label, best, median))
+
+
+if __name__ == '__main__':
+    main()
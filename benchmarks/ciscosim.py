@@ -0,0 +1,518 @@
+#!/usr/bin/env python
+'''
+Local SSH server standing for Cisco devices, used by the benchmarks.
+
+Every connection gets an IOS like shell: a hostname# prompt, echo of the
+typed commands, a show version banner, an IOS error for commands containing
+'bogus' and a canned output for any other command, returned after a
+configurable latency plus a random jitter. show tech-support returns
+--large-lines lines. --rtt delays everything sent by the server without
+holding the next commands, like a long network path.
+
+The simulated device is chosen by the local address the client connected
+to, so every 127.x.y.z is a different host. --nxos-ratio of them are NX-OS
+switches (Nexus banner and show version, bootflash: file system),
+--auth-failure-ratio of them reject every login, --hang-ratio of them
+accept the TCP connection but never speak SSH and --slow-ratio of them,
+like big chassis, answer --slow-factor times slower. With --password, only that
+password is accepted. Configuration mode shows the (config)# and sub mode
+prompts.
+
+Files can be uploaded with SCP or SFTP, then merged with
+copy <file> running-config and removed with delete /force <file>. Lines
+typed in configuration mode and merged files show up in show running-config.
+
+    python benchmarks/ciscosim.py --port 2222 --latency 0.05
+'''
+
+import Queue
+import argparse
+import logging
+import random
+import re
+import socket
+import threading
+import time
+import paramiko
+
+SHOW_VERSION = (
+    'Cisco IOS Software, C2960X Software (C2960X-UNIVERSALK9-M), '
+    'Version 15.2(2)E6, RELEASE SOFTWARE (fc1)\r\n'
+    'ROM: Bootstrap program is C2960X boot loader\r\n'
+    '{hostname} uptime is 1 year, 2 weeks, 3 days, 4 hours, 5 minutes\r\n'
+)
+NXOS_BANNER = (
+    'Cisco Nexus Operating System (NX-OS) Software\r\n'
+    'TAC support: http://www.cisco.com/tac\r\n'
+)
+NXOS_SHOW_VERSION = NXOS_BANNER + (
+    '\r\n'
+    'Software\r\n'
+    '  BIOS: version 07.69\r\n'
+    '  NXOS: version 9.3(8)\r\n'
+    '  NXOS image file is: bootflash:///nxos.9.3.8.bin\r\n'
+    '\r\n'
+    'Hardware\r\n'
+    '  cisco Nexus9000 C93180YC-EX chassis\r\n'
+    '\r\n'
+    '  Device name: {hostname}\r\n'
+    'Kernel uptime is 412 day(s), 3 hour(s), 2 minute(s), 1 second(s)\r\n'
+)
+INVALID_INPUT = (
+    '                ^\r\n'
+    "% Invalid input detected at '^' marker.\r\n"
+)
+RUNNING_CONFIG = (
+    'Building configuration...\r\n'
+    '\r\n'
+    'Current configuration : 2048 bytes\r\n'
+    '!\r\n'
+    'hostname {hostname}\r\n'
+    '!\r\n'
+    'interface GigabitEthernet1/0/1\r\n'
+    ' description uplink\r\n'
+    '!\r\n'
+)
+CONF_COMMANDS = ('configure terminal', 'conf t')
+COPY_RE = re.compile(r'^copy (\S+) running-config$')
+DELETE_RE = re.compile(r'^delete (?:/force (\S+)|(\S+) no-prompt)$')
+# configuration sub modes entered by top level lines, (config-xx)# prompts
+SUB_MODES = (
+    (re.compile(r'^interface '), 'if'),
+    (re.compile(r'^router '), 'router'),
+    (re.compile(r'^line '), 'line'),
+    (re.compile(r'^vlan \d'), 'vlan'),
+    (re.compile(r'^ip access-list extended '), 'ext-nacl'),
+    (re.compile(r'^ip access-list standard '), 'std-nacl'),
+)
+
+
+class DeviceServer(paramiko.ServerInterface):
+    '''
+    Accepts the logins the simulator accepts, one interactive shell per
+    session, and SCP uploads to the files of the simulated device.
+    '''
+    def __init__(self, simulator, hostname):
+        self.simulator = simulator
+        self.hostname = hostname
+        self.shell_ready = threading.Event()
+
+    def check_channel_request(self, kind, chanid):
+        if kind == 'session':
+            return paramiko.OPEN_SUCCEEDED
+        return paramiko.OPEN_FAILED_ADMINISTRATIVELY_PROHIBITED
+
+    def get_allowed_auths(self, username):
+        return 'password'
+
+    def check_auth_password(self, username, password):
+        if self.simulator.accepts(self.hostname, password):
+            return paramiko.AUTH_SUCCESSFUL
+        return paramiko.AUTH_FAILED
+
+    def check_channel_pty_request(self, channel, term, width, height,
+                                  pixelwidth, pixelheight, modes):
+        return True
+
+    def check_channel_shell_request(self, channel):
+        self.shell_ready.set()
+        return True
+
+    def check_channel_exec_request(self, channel, command):
+        if not command.startswith('scp -t '):
+            return False
+        sink = threading.Thread(
+            target=self.scp_sink, args=(channel, command[7:].strip())
+        )
+        sink.daemon = True
+        sink.start()
+        return True
+
+    def scp_sink(self, channel, path):
+        '''
+        Receives one file with the sink side of the SCP protocol.
+        '''
+        try:
+            channel.sendall('\0')
+            header = ''
+            while not header.endswith('\n'):
+                data = channel.recv(1)
+                if not data:
+                    return
+                header += data
+            size = int(header.split(' ')[1])
+            channel.sendall('\0')
+            content = ''
+            while len(content) < size + 1:
+                data = channel.recv(size + 1 - len(content))
+                if not data:
+                    return
+                content += data
+            self.simulator.store(self.hostname, path, content[:size])
+            channel.sendall('\0')
+        except (socket.error, EOFError, paramiko.SSHException):
+            pass
+        finally:
+            channel.close()
+
+
+class SimulatorSFTPHandle(paramiko.SFTPHandle):
+    '''
+    File being written by a SFTP client, stored when closed.
+    '''
+    def __init__(self, flags, store):
+        paramiko.SFTPHandle.__init__(self, flags)
+        self.chunks = {}
+        self.store = store
+
+    def write(self, offset, data):
+        self.chunks[offset] = data
+        return paramiko.SFTP_OK
+
+    def close(self):
+        self.store(''.join(
+            self.chunks[offset] for offset in sorted(self.chunks)
+        ))
+        paramiko.SFTPHandle.close(self)
+
+
+class SimulatorSFTPServer(paramiko.SFTPServerInterface):
+    '''
+    SFTP subsystem only accepting uploads.
+    '''
+    def __init__(self, server, *args, **kwargs):
+        paramiko.SFTPServerInterface.__init__(self, server, *args, **kwargs)
+        self.server = server
+
+    def open(self, path, flags, attr):
+        return SimulatorSFTPHandle(
+            flags,
+            lambda data: self.server.simulator.store(
+                self.server.hostname, path, data
+            )
+        )
+
+
+def sim_hostname(address):
+    '''
+    Returns the name of the simulated host reached at address.
+    '''
+    return 'sim-{}'.format(address.replace('.', '-'))
+
+
+class DeviceSimulator(object):
+    '''
+    Threaded SSH server, one thread per session.
+
+    Parameters
+    ----------
+    address : str
+        address to listen on.
+
+    port : int
+        port to listen on, 0 picks a free one.
+
+    latency : float
+        seconds waited before answering each command.
+
+    output_lines : int
+        number of lines returned by commands other than show version.
+
+    rtt : float
+        seconds everything sent by the server is delayed.
+
+    jitter : float
+        up to jitter seconds randomly added to latency.
+
+    large_lines : int
+        number of lines returned by show tech-support.
+
+    nxos_ratio : float
+        share of the hosts being NX-OS switches.
+
+    auth_failure_ratio : float
+        share of the hosts rejecting every login.
+
+    hang_ratio : float
+        share of the hosts never answering the SSH handshake.
+
+    hang_time : float
+        seconds a hung host keeps the connection before closing it.
+
+    slow_ratio : float
+        share of the hosts answering slow_factor times slower.
+
+    slow_factor : float
+        latency and jitter multiplier of the slow hosts.
+
+    password : str
+        only password accepted by the hosts, None accepts any.
+    '''
+    def __init__(self, address='127.0.0.1', port=0, latency=0.0,
+                 output_lines=20, rtt=0.0, jitter=0.0, large_lines=10000,
+                 nxos_ratio=0.0, auth_failure_ratio=0.0, hang_ratio=0.0,
+                 hang_time=60.0, password=None, slow_ratio=0.0,
+                 slow_factor=10.0):
+        self.latency = latency
+        self.output_lines = output_lines
+        self.rtt = rtt
+        self.jitter = jitter
+        self.large_lines = large_lines
+        self.nxos_ratio = nxos_ratio
+        self.auth_failure_ratio = auth_failure_ratio
+        self.hang_ratio = hang_ratio
+        self.hang_time = hang_time
+        self.slow_ratio = slow_ratio
+        self.slow_factor = slow_factor
+        self.password = password
+        self.files = {}
+        self.running = {}
+        self.lock = threading.Lock()
+        self.host_key = paramiko.RSAKey.generate(1024)
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.sock.bind((address, port))
+        self.sock.listen(1024)
+        self.address, self.port = self.sock.getsockname()
+
+    def serve_forever(self):
+        while True:
+            client, peer = self.sock.accept()
+            session = threading.Thread(target=self.session, args=(client,))
+            session.daemon = True
+            session.start()
+
+    def start(self):
+        '''
+        Serves in a daemon thread and returns.
+        '''
+        server = threading.Thread(target=self.serve_forever)
+        server.daemon = True
+        server.start()
+
+    @staticmethod
+    def picked(hostname, ratio, trait):
+        '''
+        Tells whether hostname has trait, ratio of the hosts having it. The
+        same host always gets the same answer.
+        '''
+        return bool(ratio) and random.Random(
+            '{}/{}'.format(trait, hostname)
+        ).random() < ratio
+
+    def is_nxos(self, hostname):
+        return self.picked(hostname, self.nxos_ratio, 'nxos')
+
+    def accepts(self, hostname, password):
+        if self.picked(hostname, self.auth_failure_ratio, 'auth'):
+            return False
+        return self.password is None or password == self.password
+
+    def answer(self, hostname, command):
+        '''
+        Returns the output of a command.
+        '''
+        if not command or command.startswith('term'):
+            return ''
+        if command == 'show version':
+            if self.is_nxos(hostname):
+                return NXOS_SHOW_VERSION.format(hostname=hostname)
+            return SHOW_VERSION.format(hostname=hostname)
+        if command.startswith('show tech'):
+            return ''.join(
+                'show tech-support line {:06d}\r\n'.format(index)
+                for index in range(self.large_lines)
+            )
+        if command == 'show running-config':
+            with self.lock:
+                lines = list(self.running.get(hostname, []))
+            return RUNNING_CONFIG.format(hostname=hostname) + ''.join(
+                line + '\r\n' for line in lines
+            ) + 'end\r\n'
+        if 'bogus' in command:
+            return INVALID_INPUT
+        return ''.join(
+            '{} line {:04d}\r\n'.format(command, index)
+            for index in range(self.output_lines)
+        )
+
+    def store(self, hostname, path, data):
+        with self.lock:
+            self.files[(hostname, path)] = data
+
+    def copy_to_running(self, hostname, path):
+        '''
+        Merges an uploaded file into the running configuration of hostname
+        and returns the output of the copy.
+        '''
+        with self.lock:
+            data = self.files.get((hostname, path))
+        if data is None:
+            return '%Error opening {} (No such file or directory)\r\n'.format(
+                path)
+        output = ''
+        for line in data.splitlines():
+            if 'bogus' in line:
+                output += INVALID_INPUT
+            else:
+                with self.lock:
+                    self.running.setdefault(hostname, []).append(line)
+        return output + '{} bytes copied in 0.052 secs\r\n'.format(len(data))
+
+    def delete(self, hostname, path):
+        with self.lock:
+            if self.files.pop((hostname, path), None) is not None:
+                return ''
+        return '%Error deleting {} (No such file or directory)\r\n'.format(
+            path)
+
+    def delayed_sender(self, channel):
+        '''
+        Returns a function sending data on channel rtt seconds later.
+        '''
+        if not self.rtt:
+            return channel.sendall
+        outgoing = Queue.Queue()
+
+        def sender():
+            while True:
+                when, data = outgoing.get()
+                time.sleep(max(0, when - time.time()))
+                channel.sendall(data)
+
+        thread = threading.Thread(target=sender)
+        thread.daemon = True
+        thread.start()
+        return lambda data: outgoing.put((time.time() + self.rtt, data))
+
+    def session(self, client):
+        if not client.getpeername()[0].startswith('127.'):
+            client.close()
+            return
+        hostname = sim_hostname(client.getsockname()[0])
+        if self.picked(hostname, self.hang_ratio, 'hang'):
+            time.sleep(self.hang_time)
+            client.close()
+            return
+        transport = paramiko.Transport(client)
+        transport.add_server_key(self.host_key)
+        transport.set_subsystem_handler(
+            'sftp', paramiko.SFTPServer, SimulatorSFTPServer
+        )
+        server = DeviceServer(self, hostname)
+        try:
+            transport.start_server(server=server)
+            channel = transport.accept(20)
+            if channel is None:
+                return
+            server.shell_ready.wait(10)
+            send = self.delayed_sender(channel)
+            slowness = 1
+            if self.picked(hostname, self.slow_ratio, 'slow'):
+                slowness = self.slow_factor
+            if self.is_nxos(hostname):
+                send(NXOS_BANNER)
+            send('\r\n{}#'.format(hostname))
+            pending = ''
+            copying = None
+            configuring = False
+            # configuration sub mode, None at the (config)# level
+            sub_mode = None
+            while True:
+                data = channel.recv(1024)
+                if not data:
+                    return
+                pending += data.replace('\r\n', '\r').replace('\n', '\r')
+                while '\r' in pending:
+                    line, pending = pending.split('\r', 1)
+                    command = line.strip()
+                    send(line + '\r\n')
+                    if self.latency or self.jitter:
+                        time.sleep(
+                            slowness * (
+                                self.latency + random.uniform(0, self.jitter)
+                            )
+                        )
+                    copy = COPY_RE.match(command)
+                    delete = DELETE_RE.match(command)
+                    if copying:
+                        send(self.copy_to_running(hostname, copying))
+                        copying = None
+                    elif copy:
+                        copying = copy.group(1)
+                        send('Destination filename [running-config]? ')
+                        continue
+                    elif delete:
+                        send(self.delete(
+                            hostname, delete.group(1) or delete.group(2)
+                        ))
+                    elif command in CONF_COMMANDS and not configuring:
+                        configuring = True
+                        sub_mode = None
+                    elif command == 'end':
+                        configuring = False
+                    elif configuring and 'bogus' in command:
+                        send(INVALID_INPUT)
+                    elif configuring and command == 'exit':
+                        if sub_mode is None:
+                            configuring = False
+                        sub_mode = None
+                    elif configuring:
+                        if line == line.lstrip():
+                            sub_mode = None
+                            for regex, mode in SUB_MODES:
+                                if regex.match(command):
+                                    sub_mode = mode
+                        with self.lock:
+                            self.running.setdefault(
+                                hostname, []).append(line)
+                    else:
+                        send(self.answer(hostname, command))
+                    if not configuring:
+                        send('\r\n{}#'.format(hostname))
+                    elif sub_mode is None:
+                        send('\r\n{}(config)#'.format(hostname))
+                    else:
+                        send('\r\n{}(config-{})#'.format(hostname, sub_mode))
+        except (socket.error, EOFError, paramiko.SSHException):
+            pass
+        finally:
+            transport.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--address', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=2222)
+    parser.add_argument('--latency', type=float, default=0.0)
+    parser.add_argument('--output-lines', type=int, default=20)
+    parser.add_argument('--rtt', type=float, default=0.0)
+    parser.add_argument('--jitter', type=float, default=0.0)
+    parser.add_argument('--large-lines', type=int, default=10000)
+    parser.add_argument('--nxos-ratio', type=float, default=0.0)
+    parser.add_argument('--auth-failure-ratio', type=float, default=0.0)
+    parser.add_argument('--hang-ratio', type=float, default=0.0)
+    parser.add_argument('--hang-time', type=float, default=60.0)
+    parser.add_argument('--password', default=None)
+    parser.add_argument('--slow-ratio', type=float, default=0.0)
+    parser.add_argument('--slow-factor', type=float, default=10.0)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.ERROR)
+    simulator = DeviceSimulator(
+        args.address, args.port, args.latency, args.output_lines, args.rtt,
+        jitter=args.jitter,
+        large_lines=args.large_lines,
+        nxos_ratio=args.nxos_ratio,
+        auth_failure_ratio=args.auth_failure_ratio,
+        hang_ratio=args.hang_ratio,
+        hang_time=args.hang_time,
+        password=args.password,
+        slow_ratio=args.slow_ratio,
+        slow_factor=args.slow_factor
+    )
+    print('Listening on {}:{}'.format(simulator.address, simulator.port))
+    simulator.serve_forever()
+
+
+if __name__ == '__main__':
+    main()
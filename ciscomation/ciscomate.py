@@ -1,29 +1,65 @@
 #!/usr/bin/env python
 
 import logging
-import configargparse
 import datetime
 import time
 import json
 import getpass
 import traceback
 import sys
-import copy
 import re
-import pandas as pd
+import socket
 from logging.config import dictConfig
-from configargparse import YAMLConfigFileParser
-from Exscript.protocols import SSH2
-from Exscript.protocols.Exception import LoginFailure
-from Exscript.protocols.Exception import InvalidCommandException
-from Exscript import Account
+# Exscript, configargparse, progressbar and openpyxl are imported where they
+# are used, ciscomate -h and the workers do not pay for them
 from ciscomation.ciscomation_mp import mp_manager
+from ciscomation.ciscomation_mp import DISPATCH_MODES
+from ciscomation.ciscomation_diff import diff_only_commands
+from ciscomation.ciscomation_login import LoginLimiter
+from ciscomation.ciscomation_login import get_limiter
+from ciscomation.ciscomation_login import install_limiter
+from ciscomation.ciscomation_pool import close_connection
+from ciscomation.ciscomation_pool import get_pool
+from ciscomation.ciscomation_push import TRANSFERS
+from ciscomation.ciscomation_push import push_file
+from ciscomation.ciscomation_report import ResultWriter
+from ciscomation.ciscomation_report import TABLE_FORMATS
+from ciscomation.ciscomation_report import build_reports
+from ciscomation.ciscomation_report import resume_journal
+from ciscomation.ciscomation_sched import FAILURE_FIELDS
+from ciscomation.ciscomation_sched import GroupLimits
+from ciscomation.ciscomation_sched import WaveGate
+from ciscomation.ciscomation_sched import parse_group_limits
+from ciscomation.ciscomation_spill import OutputSpill
+from ciscomation.ciscomation_spill import SPILL_THRESHOLD
+from ciscomation.ciscomation_spill import trim_response
+from ciscomation.ciscomation_async import async_manager
+from ciscomation.ciscomation_cache import CACHE_DIR
+from ciscomation.ciscomation_cache import SnapshotCache
+from ciscomation.ciscomation_cache import TTLCache
+from ciscomation.ciscomation_cache import cache_path
+from ciscomation.ciscomation_cache import flush_caches
+from ciscomation.ciscomation_cache import get_cache
+from ciscomation.ciscomation_history import HISTORY_FILE
+from ciscomation.ciscomation_history import DurationHistory
+from ciscomation.ciscomation_threads import cancellable_sleep
+from ciscomation.ciscomation_threads import thread_manager
+from ciscomation.ciscomation_timing import CommandTimer
+from ciscomation.ciscomation_timing import clock
+from ciscomation.ciscomation_timing import elapsed
+from ciscomation.ciscomation_parse import parse_outputs
 from ciscomation.ciscomation_exc import CiscomationLoginFailed
 from ciscomation.ciscomation_exc import CiscomationException
 from ciscomation.ciscomation_xml import xml_to_maintenance
-from progressbar import Bar, ETA, FileTransferSpeed, Percentage, ProgressBar
 
 __SCRIPT__ = 'ciscomation'
+VERSION_RE = re.compile(r'Version ([^\s,]+)')
+# NX-OS names the software 'NXOS: version' or, before 7.0, 'system: version',
+# the BIOS version coming first
+NXOS_VERSION_RE = re.compile(r'(?:NXOS|system):\s+version\s+(\S+)', re.I)
+# commands sent ahead of the answers in a --pipeline-start block
+PIPELINE_WINDOW = 20
+ENGINES = ('mp', 'async', 'threads')
 
 
 def exc_txt(sys_exc_info):
@@ -39,6 +75,8 @@ def init_progess_bar(bar_name, num_elts):
     '''
     Function to initiate a progress bar.
     '''
+    from progressbar import Bar, ETA, FileTransferSpeed, Percentage
+    from progressbar import ProgressBar
     widgets = [
         bar_name,
         Percentage(),
@@ -69,7 +107,61 @@ def pause():
         exit(1)
 
 
-def set_connection(host, login, password, driver='ios'):
+def detect_platform(response):
+    '''
+    Reads the output of show version.
+
+    Returns
+    -------
+    driver, platform, version: tuple
+        Exscript driver name, 'IOS', 'IOS-XE' or 'NX-OS', and software
+        version. driver and platform are None for unknown devices, version
+        is None when not found.
+
+    Examples
+    --------
+    >>> detect_platform(
+    ...     'Cisco Nexus Operating System (NX-OS) Software\\r\\n'
+    ...     '  BIOS: version 07.69\\r\\n'
+    ...     '  NXOS: version 9.3(8)\\r\\n'
+    ... )
+    ('nxos', 'NX-OS', '9.3(8)')
+    '''
+    version = VERSION_RE.search(response)
+    if version:
+        version = version.group(1)
+    if ' IOS ' in response:
+        if ' IOS-XE ' in response or ' IOS XE ' in response:
+            return ('ios', 'IOS-XE', version)
+        return ('ios', 'IOS', version)
+    elif ' (NX-OS) ' in response:
+        nxos_version = NXOS_VERSION_RE.search(response)
+        if nxos_version:
+            version = nxos_version.group(1)
+        return ('nxos', 'NX-OS', version)
+    elif ' IOS-XE ' in response:
+        return ('ios', 'IOS-XE', version)
+    return (None, None, version)
+
+
+def use_driver(connection, driver):
+    '''
+    Sets the Exscript driver of a connection, with the extra error prompts
+    of NX-OS.
+    '''
+    connection.set_driver(driver)
+    if driver == 'nxos':
+        # copied, appending to the driver list would grow it for every host
+        connection.set_error_prompt(
+            list(connection.get_driver().error_re) + [
+                re.compile(r'^% invalid command', re.I),
+                re.compile(r'^% invalid parameter', re.I)
+            ]
+        )
+
+
+def set_connection(host, login, password, driver='ios', port=None,
+                   address=None, driver_cache=None, timings=None):
     '''
     set_connection configures Exscript SSH2 Connection and validate the device
     type.
@@ -88,54 +180,143 @@ def set_connection(host, login, password, driver='ios'):
     driver : str, optional
         base driver to test.
 
+    port : int, optional
+        SSH port, defaults to 22.
+
+    address : str, optional
+        already resolved address of host, connecting to it skips DNS.
+
+    driver_cache : ciscomation_cache.TTLCache, optional
+        host -> driver, platform and version found by a previous show
+        version. Known hosts skip the detection, unless the OS guessed by
+        Exscript at login contradicts the cache.
+
+    Every login attempt waits for the login limiter of the process, if any,
+    see :func:`ciscomation_login.install_limiter`, which also counts the
+    rejected ones.
+
+    timings : dict, optional
+        filled with the seconds spent in every phase, dns, connect,
+        login_wait (for the login limiter), login and driver, as they end.
+
     Returns
     -------
     connection: Exscript.protocols.SSH2
         SSH2 object usable with proper driver.
+
+    specific_version: str
+        software version of the device, None if unknown.
+
+    logs: list
     '''
     logs = []
     LOGGER = logging.getLogger(__SCRIPT__)
+    from Exscript import Account
+    from Exscript.protocols import SSH2
+    from Exscript.protocols.Exception import LoginFailure
+    if timings is None:
+        timings = {}
+    limiter = get_limiter()
+    if limiter is not None:
+        limiter.check()
+    if not address:
+        started = clock()
+        address = socket.getaddrinfo(
+            str(host).strip(), port or 22, 0, socket.SOCK_STREAM
+        )[0][4][0]
+        timings['dns'] = elapsed(started)
+    started = clock()
     connection = SSH2(driver=driver, debug=0, verify_fingerprint=False,
                       connect_timeout=7, timeout=100, termtype='vt100')
-    connection.connect(str(host).strip())
+    connection.connect(str(address).strip(), port)
+    timings['connect'] = elapsed(started)
     account = Account(login, password)
+    started = clock()
+    waited = 0
     for attempt in range(4):
+        if limiter is not None:
+            waiting = clock()
+            try:
+                limiter.acquire()
+            except CiscomationLoginFailed:
+                # breaker tripped, the session opened above is not used
+                close_connection(connection)
+                raise
+            waited += elapsed(waiting)
+        rejected = False
         try:
             connection.authenticate(account)
-            break
         except LoginFailure:
-            time.sleep(0.5 + (float(attempt) / 2))
-            LOGGER.error(
-                'Login attempt number %d failed for host %s.',
-                attempt + 1,
-                host
-            )
-            if attempt == 3:
-                raise CiscomationLoginFailed(
-                    (
-                        '4 Login Failure be careful your login'
-                        ' could be locked'
-                    )
+            rejected = True
+        finally:
+            if limiter is not None:
+                # one rejected switch, not one per attempt
+                limiter.done(rejected and attempt == 3)
+        if not rejected:
+            break
+        time.sleep(0.5 + (float(attempt) / 2))
+        LOGGER.error(
+            'Login attempt number %d failed for host %s.',
+            attempt + 1,
+            host
+        )
+        if attempt == 3:
+            close_connection(connection)
+            raise CiscomationLoginFailed(
+                (
+                    '4 Login Failure be careful your login'
+                    ' could be locked'
                 )
+            )
+    if limiter is not None:
+        timings['login_wait'] = waited
+    timings['login'] = round(elapsed(started) - waited, 4)
     logs.append(('info', 'Login on switch {}'.format(str(host))))
+    started = clock()
     connection.autoinit()
     specific_version = None
-    try:
-        connection.execute('show version')
-        if ' IOS ' in connection.response:
-            connection.set_driver('ios')
-        elif ' (NX-OS) ' in connection.response:
-            connection.set_driver('nxos')
-            connection.get_error_prompt().append(
-                re.compile(r'^% invalid command', re.I)
+    cached = driver_cache.get(str(host)) if driver_cache else None
+    if cached and cached.get('version') is None:
+        # stored before the version of NX-OS hosts was recognized
+        driver_cache.invalidate(str(host))
+        cached = None
+    if cached:
+        guess = connection.guess_os()
+        if guess in ('ios', 'nxos') and guess != cached['driver']:
+            logs.append(
+                (
+                    'warning',
+                    '{} cached driver {} does not match {}, detecting '
+                    'again.'.format(host, cached['driver'], guess)
+                )
             )
-            connection.get_error_prompt().append(
-                re.compile(r'^% invalid parameter', re.I)
+            driver_cache.invalidate(str(host))
+            cached = None
+    if cached:
+        use_driver(connection, cached['driver'])
+        specific_version = cached['version']
+        logs.append(
+            ('debug', '{} driver taken from cache'.format(str(host)))
+        )
+    else:
+        try:
+            connection.execute('show version')
+            detected, platform, specific_version = detect_platform(
+                connection.response
             )
-        elif ' IOS-XE ' in connection.response:
+            use_driver(connection, detected or 'ios')
+            if detected and driver_cache:
+                driver_cache.set(
+                    str(host),
+                    {
+                        'driver': detected,
+                        'platform': platform,
+                        'version': specific_version
+                    }
+                )
+        except:
             connection.set_driver('ios')
-    except:
-        connection.set_driver('ios')
+    timings['driver'] = elapsed(started)
     logs.append(
         (
             'info', 'Using driver {} for host {}'.format(
@@ -148,7 +329,11 @@ def set_connection(host, login, password, driver='ios'):
 
 def run_commands(host, login, password, driver=None, commands=["show version"],
                  abort_on_error=True, conf_mode=False, save=False,
-                 continue_on_login_failure=True, pause_end=False):
+                 continue_on_login_failure=True, pause_end=False,
+                 port=None, sleeper=time.sleep, address=None, pool=None,
+                 driver_cache=None, pipeline_window=PIPELINE_WINDOW,
+                 file_transfer='scp', job=None, diff_only=False,
+                 config_cache=None, spill=None, unresolved=False):
     '''
     run_commands, run a list of commands
 
@@ -176,6 +361,70 @@ def run_commands(host, login, password, driver=None, commands=["show version"],
     conf_mode: bool
         Defaults to False, if True the configuration mode will be enabled
 
+    port: int, optional
+        SSH port, defaults to 22.
+
+    sleeper: callable, optional
+        Called with the number of seconds for --sleep-xx keywords, defaults
+        to time.sleep. Engines running many sessions in one process give
+        a function that only blocks the current session.
+
+    address: str, optional
+        already resolved address of host, connecting to it skips DNS.
+
+    pool: dict, optional
+        settings of the session pool of the process, see
+        :func:`ciscomation_pool.get_pool`. When given, a session left by a
+        previous call for the same host and credentials is reused, and the
+        session is given back to the pool at the end if the run went fine.
+
+    driver_cache: dict, optional
+        'filename' and 'ttl' of the driver cache, see
+        :func:`ciscomation_cache.get_cache` and :func:`set_connection`.
+
+    pipeline_window: int, optional
+        number of commands of a --pipeline-start block sent before reading
+        their answers, see :func:`pipeline_execute`.
+
+    file_transfer: str, optional
+        'scp' or 'sftp', how --file-push-start blocks are uploaded, see
+        :func:`ciscomation_push.push_file`.
+
+    job: int, optional
+        index of the switch in the maintenance, kept in the result as 'job'
+        to resume an interrupted maintenance, see
+        :func:`ciscomation_report.resume_journal`.
+
+    diff_only: bool, optional
+        if True, configuration lines already on the switch are not sent,
+        see :func:`ciscomation_diff.diff_commands`. Numbers of lines sent
+        and skipped are kept in the result as 'lines_sent' and
+        'lines_skipped'.
+
+    config_cache: dict, optional
+        'directory' and 'ttl' of the running configuration snapshots used
+        by diff_only instead of reading them on the switch, see
+        :class:`ciscomation_cache.SnapshotCache`.
+
+    spill: dict, optional
+        'directory' and 'threshold' of the outputs written to disk instead
+        of being kept in the result, see
+        :class:`ciscomation_spill.OutputSpill`.
+
+    unresolved: bool, optional
+        if True, the name of host did not resolve, see
+        :func:`ciscomation_xml.resolve_switches`. No connection is made,
+        the host is returned failed.
+
+    Seconds spent in every phase of the session are kept in the result as
+    'timings', see :func:`set_connection`, plus diff for diff_only and
+    commands for the whole execution. 'command_times' holds the seconds of
+    every entry of 'commands', see :class:`ciscomation_timing.CommandTimer`.
+
+    Outputs of commands following a --parse <template> line are parsed
+    once the commands are done, their rows kept in the result as 'parsed',
+    see :func:`ciscomation_parse.parse_outputs`.
+
     Returns
     -------
     result: dict
@@ -186,6 +435,7 @@ def run_commands(host, login, password, driver=None, commands=["show version"],
             result = {
                 host: {
                     'driver' : 'ios',
+                    'version': '15.2(2)E6',
                     'status_ok': True,
                     'commands': [
                         {
@@ -195,7 +445,9 @@ def run_commands(host, login, password, driver=None, commands=["show version"],
                         "no ip access-list standard SNMP_RO": ""
                         }
                     ],
-                    'logs': []
+                    'logs': [],
+                    'timings': {'connect': 0.0123, 'login': 0.2345, ...},
+                    'command_times': [0.0012, 0.0034]
                 }
             }
 
@@ -203,28 +455,51 @@ def run_commands(host, login, password, driver=None, commands=["show version"],
     result = {
         host: {
             'driver': 'default',
+            'version': None,
             'status_ok': True,
             'all_commands_ok': False,
             'commands': [],
-            'logs': []
+            'logs': [],
+            'timings': {},
+            'command_times': []
         }
     }
-    state = {
-        'print-next': False,
-        'multiline': False,
-        'ignore-error': False,
-        'multilines': []
-    }
+    if job is not None:
+        result[host]['job'] = job
+    if unresolved:
+        result[host]['status_ok'] = False
+        result[host]['logs'].append(
+            (
+                'critical',
+                '{} Connection Failed : could not resolve it'.format(host)
+            )
+        )
+        return result
     # %% Setting up connection
+    pool_key = (host, address, port, login, password)
+    pooled = None
+    if pool is not None:
+        pooled = get_pool(**pool).acquire(pool_key)
+    if driver_cache is not None:
+        driver_cache = get_cache(**driver_cache)
+    snapshots = None
+    if config_cache is not None:
+        snapshots = SnapshotCache(**config_cache)
     try:
-        connection, specific_version, conlogs = set_connection(
-            host, login, password, driver='ios'
-        )
-        result[host]['logs'].extend(conlogs)
-        if specific_version:
-            result[host]['driver'] = specific_version
+        if pooled:
+            connection, specific_version, created = pooled
+            conlogs = [('info', 'Reusing session on switch {}'.format(host))]
         else:
-            result[host]['driver'] = connection.get_driver().name
+            created = time.time()
+            connection, specific_version, conlogs = set_connection(
+                host, login, password, driver='ios', port=port,
+                address=address,
+                driver_cache=driver_cache,
+                timings=result[host]['timings']
+            )
+        result[host]['logs'].extend(conlogs)
+        result[host]['driver'] = connection.get_driver().name
+        result[host]['version'] = specific_version
     except CiscomationLoginFailed as exc:
         result[host]['status_ok'] = False
         result[host]['logs'].append(
@@ -252,6 +527,65 @@ def run_commands(host, login, password, driver=None, commands=["show version"],
             )
         )
         return result
+    started = clock()
+    timer = CommandTimer(result[host])
+    parses = []
+    try:
+        execute_commands(
+            connection, result, host, driver, commands, abort_on_error,
+            conf_mode, save, pause_end, sleeper, pipeline_window,
+            file_transfer, diff_only, snapshots, timer, parses,
+            OutputSpill(host, job=job, **(spill or {}))
+        )
+        timer.lap()
+        result[host]['timings']['commands'] = elapsed(started)
+        if parses:
+            parse_outputs(host, result[host], parses)
+    except BaseException:
+        if pool is not None:
+            close_connection(connection)
+        raise
+    if pool is not None:
+        if result[host]['status_ok']:
+            get_pool(**pool).release(
+                pool_key, connection, specific_version, created
+            )
+        else:
+            close_connection(connection)
+    return result
+
+
+def execute_commands(connection, result, host, driver, commands,
+                     abort_on_error, conf_mode, save, pause_end, sleeper,
+                     pipeline_window=PIPELINE_WINDOW, file_transfer='scp',
+                     diff_only=False, snapshots=None, timer=None,
+                     parses=None, spill=None):
+    '''
+    Runs commands on an established connection and fills result, see
+    run_commands for the parameters. timer, a
+    :class:`ciscomation_timing.CommandTimer`, gets a lap before every
+    command, the caller doing the last one. parses, a list, gets the
+    (seq, command, template) of every command following a --parse line,
+    seq being the index of its entry in 'commands'. spill,
+    a :class:`ciscomation_spill.OutputSpill`, gets every output before it
+    is kept in result.
+    '''
+    from Exscript.protocols.Exception import InvalidCommandException
+    state = {
+        'print-next': False,
+        'multiline': False,
+        'ignore-error': False,
+        'multilines': [],
+        'pipeline': False,
+        'pipelined': [],
+        'prompt': None,
+        'file-push': False,
+        'pushlines': [],
+        'parse': None
+    }
+    # kept out of state, which is logged for every command
+    if spill is None:
+        spill = OutputSpill(host)
     # %% enforcing driver if specified if needed adding conf mode and saving
     if driver:
         connection.set_driver(driver)
@@ -285,9 +619,53 @@ def run_commands(host, login, password, driver=None, commands=["show version"],
             ('error', '{} Unknown driver.'.format(host))
         )
         return result
+    # %% Removing configuration lines already present
+    if diff_only:
+        started = clock()
+        try:
+            commands, sent, skipped, fetched = diff_only_commands(
+                connection, host, commands, snapshots
+            )
+            result[host]['timings']['diff'] = elapsed(started)
+        except Exception as exc:
+            result[host]['status_ok'] = False
+            result[host]['logs'].append(
+                (
+                    'critical',
+                    '{} Reading running-config Failed : {}'.format(
+                        host,
+                        str(exc)
+                    )
+                )
+            )
+            result[host]['logs'].append(
+                (
+                    'debug',
+                    '{} details:\n{}'.format(host, exc_txt(sys.exc_info()))
+                )
+            )
+            return result
+        result[host]['lines_sent'] = sent
+        result[host]['lines_skipped'] = skipped
+        result[host]['logs'].append(
+            (
+                'info',
+                (
+                    '{} Diff-only sends {} configuration lines, skips {} '
+                    'already present{}'
+                ).format(
+                    host,
+                    sent,
+                    skipped,
+                    '' if fetched else ' in snapshot'
+                )
+            )
+        )
     # %% Executing commands
     result[host]['all_commands_ok'] = True
     for command in commands:
+        if timer is not None:
+            timer.lap()
         result[host]['logs'].append(
             (
                 'debug',
@@ -304,7 +682,98 @@ def run_commands(host, login, password, driver=None, commands=["show version"],
         keyword = command.strip()
         ######################################################################
         # detecting special keywords
-        if keyword == '--multiline-stop':
+        if (state['pipeline'] and keyword.startswith('--') and
+                keyword not in ('--ignore-error', '--pipeline-stop') and
+                not keyword.startswith('--parse ')):
+            # other keywords apply once the commands before them are done
+            if flush_pipeline(connection, result, host, state,
+                              abort_on_error, spill):
+                return result
+        if keyword == '--pipeline-stop':
+            state['pipeline'] = False
+            result[host]['logs'].append(
+                (
+                    'debug',
+                    '{} Leaving pipeline'.format(host)
+                )
+            )
+            if flush_pipeline(connection, result, host, state,
+                              abort_on_error, spill):
+                return result
+            continue
+        elif keyword == '--file-push-stop':
+            state['file-push'] = False
+            result[host]['logs'].append(
+                (
+                    'debug',
+                    '{} Leaving file push'.format(host)
+                )
+            )
+            pushlines = state['pushlines']
+            state['pushlines'] = []
+            try:
+                copy, output, error = push_file(
+                    connection, pushlines, file_transfer
+                )
+            except Exception as exc:
+                result[host]['status_ok'] = False
+                result[host]['logs'].append(
+                    (
+                        'critical',
+                        (
+                            '{} File push Failed with unknown Exception : '
+                            '{}'
+                        ).format(host, str(exc))
+                    )
+                )
+                result[host]['logs'].append(
+                    (
+                        'debug',
+                        '{} details:\n{}'.format(host, exc_txt(sys.exc_info()))
+                    )
+                )
+                if abort_on_error and not state['ignore-error']:
+                    return result
+                continue
+            if error is None:
+                result[host]['commands'].append(
+                    {
+                        copy: output
+                    }
+                )
+                result[host]['logs'].append(
+                    (
+                        'info',
+                        '{} Pushed {} lines with {}'.format(
+                            host,
+                            len(pushlines),
+                            file_transfer
+                        )
+                    )
+                )
+                continue
+            result[host]['all_commands_ok'] = False
+            if abort_on_error and not state['ignore-error']:
+                result[host]['status_ok'] = False
+            result[host]['commands'].append(
+                {
+                    copy: None
+                }
+            )
+            result[host]['logs'].append(
+                (
+                    'error',
+                    '{} Command {} Failed with error : {}'.format(
+                        host,
+                        copy,
+                        error
+                    )
+                )
+            )
+            if abort_on_error and not state['ignore-error']:
+                return result
+            continue
+        elif keyword == '--multiline-stop':
             state['multiline'] = False
             result[host]['logs'].append(
                 (
@@ -314,10 +783,11 @@ def run_commands(host, login, password, driver=None, commands=["show version"],
             )
             try:
                 connection.execute('')
-                resp = connection.response.replace('\r', '').split('\n')[1:-1]
                 result[host]['commands'].append(
                     {
-                        ' :: '.join(state['multilines']): '\n'.join(resp)
+                        ' :: '.join(state['multilines']): spill.keep(
+                            trim_response(connection.response)
+                        )
                     }
                 )
                 state['multilines'] = []
@@ -363,9 +833,9 @@ def run_commands(host, login, password, driver=None, commands=["show version"],
                     return result
             continue
         elif keyword.startswith('--sleep-'):
-            timer = keyword.replace('--sleep-', '')
+            seconds = keyword.replace('--sleep-', '')
             try:
-                timer = int(timer)
+                seconds = int(seconds)
             except ValueError:
                 result[host]['logs'].append(
                     (
@@ -373,19 +843,28 @@ def run_commands(host, login, password, driver=None, commands=["show version"],
                         (
                             '{} Wrong timer value {} I will pause for 5 '
                             'seconds.'
-                        ).format(host, timer)
+                        ).format(host, seconds)
                     )
                 )
-                timer = 5
+                seconds = 5
             result[host]['logs'].append(
                 (
                     'info',
-                    '{} sleeping for {} seconds'.format(host, timer)
+                    '{} sleeping for {} seconds'.format(host, seconds)
                 )
             )
-            time.sleep(timer)
+            sleeper(seconds)
             continue
         elif keyword == '--multiline-start':
+            if state['parse']:
+                result[host]['logs'].append(
+                    (
+                        'warning',
+                        '{} --parse {} ignored, multiline blocks are not '
+                        'parsed'.format(host, state['parse'])
+                    )
+                )
+                state['parse'] = None
             state['multiline'] = True
             state['multilines'] = []
             result[host]['logs'].append(
@@ -395,6 +874,54 @@ def run_commands(host, login, password, driver=None, commands=["show version"],
                 )
             )
             continue
+        elif keyword == '--file-push-start':
+            if state['parse']:
+                result[host]['logs'].append(
+                    (
+                        'warning',
+                        '{} --parse {} ignored, file push blocks are not '
+                        'parsed'.format(host, state['parse'])
+                    )
+                )
+                state['parse'] = None
+            state['file-push'] = True
+            state['pushlines'] = []
+            result[host]['logs'].append(
+                (
+                    'debug',
+                    '{} Entering file push'.format(host)
+                )
+            )
+            continue
+        elif keyword == '--pipeline-start':
+            try:
+                # the prompt tells where the answer of a command ends
+                connection.execute('')
+                state['prompt'] = connection.response.replace(
+                    '\r', ''
+                ).split('\n')[-1].rstrip()
+            except Exception as exc:
+                result[host]['status_ok'] = False
+                result[host]['logs'].append(
+                    (
+                        'critical',
+                        (
+                            '{} Command Failed with unknown Exception : {}'
+                        ).format(host, str(exc))
+                    )
+                )
+                if abort_on_error:
+                    return result
+                continue
+            state['pipeline'] = True
+            state['pipelined'] = []
+            result[host]['logs'].append(
+                (
+                    'debug',
+                    '{} Entering pipeline'.format(host)
+                )
+            )
+            continue
         elif keyword == '--pause':
             pause()
             continue
@@ -410,6 +937,17 @@ def run_commands(host, login, password, driver=None, commands=["show version"],
         elif keyword == '--print-next':
             state['print-next'] = True
             continue
+        elif keyword.startswith('--parse '):
+            if state['multiline'] or state['file-push']:
+                result[host]['logs'].append(
+                    (
+                        'warning',
+                        '{} {} ignored inside a block'.format(host, keyword)
+                    )
+                )
+                continue
+            state['parse'] = keyword[len('--parse '):].strip()
+            continue
         elif keyword.startswith('--'):
             result[host]['logs'].append(
                 (
@@ -423,6 +961,29 @@ def run_commands(host, login, password, driver=None, commands=["show version"],
             continue
         ######################################################################
         # really executing the commands
+        if state['file-push']:
+            state['pushlines'].append(command)
+            continue
+        if state['parse'] and not state['multiline']:
+            if parses is not None:
+                # pipelined commands get their entry once flushed
+                parses.append(
+                    (
+                        len(result[host]['commands']) +
+                        len(state['pipelined']),
+                        command,
+                        state['parse']
+                    )
+                )
+            state['parse'] = None
+        if state['pipeline']:
+            state['pipelined'].append((command, state['ignore-error']))
+            state['ignore-error'] = False
+            if len(state['pipelined']) >= pipeline_window:
+                if flush_pipeline(connection, result, host, state,
+                                  abort_on_error, spill):
+                    return result
+            continue
         try:
             if state['multiline']:
                 state['multilines'].append(command + '\n')
@@ -430,19 +991,21 @@ def run_commands(host, login, password, driver=None, commands=["show version"],
                 continue
             else:
                 connection.execute(command)
-                resp = connection.response.replace('\r', '').split('\n')[1:-1]
-                result[host]['commands'].append(
-                    {
-                        command: '\n'.join(resp)
-                    }
-                )
+                output = trim_response(connection.response)
                 if state['print-next']:
                     print(
                         '{} retuned:\n    {}'.format(
                             command,
-                            '\n    '.join(resp)
+                            output.replace('\n', '\n    ')
                         )
                     )
+                result[host]['commands'].append(
+                    {
+                        command: spill.keep(output)
+                    }
+                )
+                # not held until the next command
+                del output
         except InvalidCommandException as cmdex:
             result[host]['all_commands_ok'] = False
             if abort_on_error and not state['ignore-error']:
@@ -490,11 +1053,141 @@ def run_commands(host, login, password, driver=None, commands=["show version"],
                 'ignore-error': False
             }
         )
+    if flush_pipeline(connection, result, host, state, abort_on_error,
+                      spill):
+        return result
     if pause_end:
         pause()
     return result
 
 
+def pipeline_execute(connection, commands, prompt):
+    '''
+    Sends commands without waiting for the prompt between them, then reads
+    the answers and splits them by prompt.
+
+    The commands must not change the prompt, as entering configuration mode
+    does, they are meant to be show commands.
+
+    Parameters
+    ----------
+    connection : Exscript.protocols.SSH2
+        connection waiting at the prompt.
+
+    commands : list
+        commands to send.
+
+    prompt : str
+        prompt of the device, as found on the last line of a response.
+
+    Returns
+    -------
+    outputs: list
+        (output, error) of every command, error being None or the answer of
+        the device when it matched an error prompt of the driver.
+    '''
+    for command in commands:
+        connection.send(command + '\r')
+    received = []
+    prompts = 0
+    # every answer ends with a prompt, the device may have printed several
+    # of them by the time the buffer is read
+    while prompts < len(commands):
+        connection.expect(connection.get_prompt())
+        chunk = connection.response.replace('\r', '')
+        received.append(chunk)
+        prompts += len(
+            [line for line in chunk.split('\n') if line.startswith(prompt)]
+        )
+    # first line of an answer is the echo of the command, the prompt in
+    # front of it apart from the first one
+    answers = [[]]
+    for line in ''.join(received).split('\n'):
+        if line.startswith(prompt):
+            answers.append([])
+        answers[-1].append(line)
+    error_prompts = connection.get_error_prompt()
+    outputs = []
+    for answer in answers[:len(commands)]:
+        error = None
+        for line in answer[1:]:
+            if any(regex.search(line) for regex in error_prompts):
+                error = 'Device said:\n' + '\n'.join(answer)
+                break
+        outputs.append(('\n'.join(answer[1:]), error))
+    return outputs
+
+
+def flush_pipeline(connection, result, host, state, abort_on_error,
+                   spill=None):
+    '''
+    Runs the commands buffered in state by a --pipeline-start block and
+    records them in result like the ones sent one by one, spill, a
+    :class:`ciscomation_spill.OutputSpill`, getting their outputs.
+
+    Returns True when the execution must stop on host.
+    '''
+    pipelined = state['pipelined']
+    state['pipelined'] = []
+    if not pipelined:
+        return False
+    try:
+        outputs = pipeline_execute(
+            connection,
+            [command for command, ignore_error in pipelined],
+            state['prompt']
+        )
+    except Exception as exc:
+        result[host]['status_ok'] = False
+        result[host]['logs'].append(
+            (
+                'critical',
+                (
+                    '{} Command Failed with unknown Exception : {}'
+                ).format(host, str(exc))
+            )
+        )
+        result[host]['logs'].append(
+            (
+                'debug',
+                '{} details:\n{}'.format(host, exc_txt(sys.exc_info()))
+            )
+        )
+        return abort_on_error
+    abort = False
+    for (command, ignore_error), (output, error) in zip(pipelined, outputs):
+        if error is None:
+            if spill is not None:
+                output = spill.keep(output)
+            result[host]['commands'].append(
+                {
+                    command: output
+                }
+            )
+            continue
+        result[host]['all_commands_ok'] = False
+        # the rest of the window already ran, it is recorded anyway
+        if abort_on_error and not ignore_error:
+            result[host]['status_ok'] = False
+            abort = True
+        result[host]['commands'].append(
+            {
+                command: None
+            }
+        )
+        result[host]['logs'].append(
+            (
+                'error',
+                '{} Command {} Failed with error : {}'.format(
+                    host,
+                    command,
+                    error
+                )
+            )
+        )
+    return abort
+
+
 def logconfig(args):
     '''
     Function to create a global LOGGER for the module.
@@ -551,7 +1244,51 @@ def logconfig(args):
     LOGGER.debug('Log file opened')
 
 
-def run_maint(maint_data, credentials, procnum=1):
+def maint_jobs(actions, credentials, done=(), **extra_kwargs):
+    '''
+    Yields the run_commands jobs of maintenance actions, as expected by the
+    engines, extra_kwargs being added to the arguments of every job.
+
+    actions can be a generator, see
+    :func:`ciscomation_xml.iter_maintenance`, jobs are then read as the
+    engine asks for them. Actions whose (index, swname) is in done are
+    skipped.
+    '''
+    for index, switch in enumerate(actions):
+        if (index, switch['swname']) in done:
+            continue
+        kwargs = {
+            'commands': switch['commands'],
+            'abort_on_error': True,
+            'conf_mode': False,
+            'save': False,
+            'continue_on_login_failure': True,
+            'pause_end': switch['pause'],
+            'address': switch['ip'],
+            'job': index,
+            'unresolved': switch.get('unresolved', False)
+        }
+        kwargs.update(extra_kwargs)
+        job = {
+            'args': [
+                switch['swname'],
+                credentials[0],
+                credentials[1]
+            ],
+            'kwargs': kwargs
+        }
+        if switch.get('group'):
+            # see ciscomation_sched.GroupLimits
+            job['group'] = switch['group']
+        yield job
+
+
+def run_maint(maint_data, credentials, procnum=1, dispatch='shared',
+              engine='mp', pool=None, driver_cache=None,
+              pipeline_window=None, file_transfer=None, on_result=None,
+              done=(), diff_only=False, config_cache=None, gate=None,
+              port=None, history=None, longest_first=False, limits=None,
+              spill=None):
     '''
     Execute a maintenance, uing specified credentials for SSH access, and
     attempts to run it with multiprocess, if maintenance as been recognized
@@ -561,13 +1298,133 @@ def run_maint(maint_data, credentials, procnum=1):
     ----------
     maint_data : dict
         maintenance file detail like so :
+        actions may be a generator, see
+        :func:`ciscomation_xml.xml_to_maintenance`, 'count' then tells how
+        many actions to expect.
+
+    procnum : int, optional
+        number of processes, or of sessions in flight for the async engine.
+
+    dispatch : str, optional
+        how hosts are handed to the processes, see
+        :func:`ciscomation_mp.mp_manager`.
+
+    engine : str, optional
+        'mp' runs the hosts in procnum processes, 'async' keeps procnum
+        sessions in flight from the current process, see
+        :func:`ciscomation_async.async_manager`, 'threads' runs them in a
+        pool of procnum threads, see
+        :func:`ciscomation_threads.thread_manager`.
+
+    pool : dict, optional
+        settings of the session pool, see :func:`run_commands`. Sessions are
+        kept in the process running the hosts, so successive run_maint calls
+        (pre checks, change, post checks) reuse them with the sequential,
+        async and threads engines.
+
+    driver_cache : dict, optional
+        settings of the driver cache, see :func:`run_commands`.
+
+    pipeline_window : int, optional
+        commands of a --pipeline-start block sent ahead, see
+        :func:`run_commands`.
+
+    file_transfer : str, optional
+        how --file-push-start blocks are uploaded, see :func:`run_commands`.
+
+    on_result : callable, optional
+        called with the result of every host as soon as it is done, see
+        :class:`ciscomation_report.ResultWriter`. Results are then not kept
+        and an empty dict is returned.
+
+    done : set, optional
+        (index, swname) of the actions already done by an interrupted run,
+        they are skipped, see :func:`ciscomation_report.resume_journal`.
+
+    diff_only : bool, optional
+        send only the configuration lines missing on the switches, see
+        :func:`run_commands`.
+
+    config_cache : dict, optional
+        settings of the running configuration snapshots, see
+        :func:`run_commands`.
+
+    gate : ciscomation_sched.WaveGate, optional
+        runs the hosts by waves and stops starting new ones once too many
+        failed, the hosts in flight finish. Needs the shared dispatch with
+        the mp engine, roundrobin is replaced by it.
+
+    port : int, optional
+        SSH port of the switches, defaults to 22.
+
+    history : dict, optional
+        settings of the duration history, see
+        :class:`ciscomation_history.DurationHistory`, fed with the results
+        of every host.
+
+    longest_first : bool, optional
+        starts the hosts expected to last the longest first, from history
+        or else from their number of commands, instead of the xml order.
+        Needs the actions as a list.
+
+    limits : ciscomation_sched.GroupLimits, optional
+        caps the hosts in flight per group of switches, the capacity left
+        going to the other ones. Needs the shared dispatch with the mp
+        engine, roundrobin is replaced by it.
+
+    spill : dict, optional
+        settings of the outputs written to disk, see :func:`run_commands`.
     '''
     results = []
     LOGGER = logging.getLogger(__SCRIPT__)
+    if 'count' in maint_data:
+        count = maint_data['count']
+    else:
+        count = len(maint_data['actions'])
+    extra_kwargs = {}
+    if pool is not None:
+        extra_kwargs['pool'] = pool
+    if driver_cache is not None:
+        extra_kwargs['driver_cache'] = driver_cache
+    if pipeline_window is not None:
+        extra_kwargs['pipeline_window'] = pipeline_window
+    if file_transfer is not None:
+        extra_kwargs['file_transfer'] = file_transfer
+    if diff_only:
+        extra_kwargs['diff_only'] = True
+    if config_cache is not None:
+        extra_kwargs['config_cache'] = config_cache
+    if port is not None:
+        extra_kwargs['port'] = port
+    if spill is not None:
+        extra_kwargs['spill'] = spill
+    history = DurationHistory(**(history or {}))
+    if on_result is not None:
+        # results are not kept, they are learnt as they come
+        on_result = history.recording(on_result)
+    if longest_first and not isinstance(maint_data['actions'], list):
+        LOGGER.warning('Longest first needs the whole xml, kept its order.')
+        longest_first = False
     if procnum == 1 or not maint_data['mp_compat']:
-        pbar = init_progess_bar('hosts proc=1 ', len(maint_data['actions']))
+        pbar = init_progess_bar('hosts proc=1 ', count)
         pbar.start()
-        for hostid, switch in enumerate(maint_data['actions']):
+        actions = enumerate(maint_data['actions'])
+        if longest_first:
+            actions = history.longest_first(
+                actions,
+                lambda action: (
+                    action[1]['swname'],
+                    len(action[1]['commands'])
+                )
+            )
+        for position, (hostid, switch) in enumerate(actions):
+            if (hostid, switch['swname']) in done:
+                pbar.update(position + 1)
+                continue
+            if gate is not None:
+                if not gate.can_start():
+                    break
+                gate.start()
             data = run_commands(
                 switch['swname'],
                 credentials[0],
@@ -577,44 +1434,107 @@ def run_maint(maint_data, credentials, procnum=1):
                 conf_mode=False,
                 save=False,
                 continue_on_login_failure=True,
-                pause_end=switch['pause']
+                pause_end=switch['pause'],
+                address=switch['ip'],
+                job=hostid,
+                unresolved=switch.get('unresolved', False),
+                **extra_kwargs
             )
-            results.append(data)
-            pbar.update(hostid + 1)
+            if gate is not None:
+                gate.record(data)
+            if on_result is None:
+                results.append(data)
+            else:
+                on_result(data)
+            pbar.update(position + 1)
             if 'logs' in data[data.keys()[0]]:
                 for log in data[data.keys()[0]]['logs']:
                     LOGGER.log(logging.getLevelName(log[0].upper()), log[1])
         pbar.finish()
     elif procnum > 1 and maint_data['mp_compat']:
+        if engine not in ENGINES:
+            raise CiscomationException('unknown engine {}'.format(engine))
+        if gate is not None and engine == 'mp' and dispatch != 'shared':
+            LOGGER.warning('Waves need the shared dispatch, using it.')
+            dispatch = 'shared'
+        if limits is not None and engine == 'mp' and dispatch != 'shared':
+            LOGGER.warning('Group limits need the shared dispatch, using it.')
+            dispatch = 'shared'
+        if done and isinstance(maint_data['actions'], list):
+            # skipped actions never come back from the engine
+            count -= len(
+                [
+                    index
+                    for index, switch in enumerate(maint_data['actions'])
+                    if (index, switch['swname']) in done
+                ]
+            )
         pbar = init_progess_bar(
-            'hosts proc={} '.format(procnum),
-            len(maint_data['actions'])
+            'hosts {}={} '.format(
+                {
+                    'mp': 'proc',
+                    'async': 'sessions',
+                    'threads': 'threads'
+                }[engine],
+                procnum
+            ),
+            count
         )
         pbar.start()
-        args_list = []
-        for switch in maint_data['actions']:
-            args_list.append(
-                {
-                    'args': [
-                        switch['swname'],
-                        credentials[0],
-                        credentials[1]
-                    ],
-                    'kwargs': {
-                        'commands': switch['commands'],
-                        'abort_on_error': True,
-                        'conf_mode': False,
-                        'save': False,
-                        'continue_on_login_failure': True,
-                        'pause_end': switch['pause']
-                    }
-                }
+        if engine in ('async', 'threads'):
+            extra_kwargs['sleeper'] = cancellable_sleep
+        else:
+            # imported once here rather than in every forked child
+            import Exscript.protocols  # noqa
+        args_list = maint_jobs(
+            maint_data['actions'],
+            credentials,
+            done,
+            **extra_kwargs
+        )
+        if longest_first:
+            args_list = history.longest_first(
+                args_list,
+                lambda job: (job['args'][0], len(job['kwargs']['commands']))
             )
         func = run_commands
-        results = mp_manager(func, args_list, threads_count=procnum, pbar=pbar)
+        if engine == 'async':
+            results = async_manager(
+                func,
+                args_list,
+                sessions=procnum,
+                pbar=pbar,
+                on_result=on_result,
+                gate=gate,
+                limits=limits
+            )
+        elif engine == 'threads':
+            results = thread_manager(
+                func,
+                args_list,
+                threads_count=procnum,
+                pbar=pbar,
+                on_result=on_result,
+                gate=gate,
+                limits=limits
+            )
+        else:
+            results = mp_manager(
+                func,
+                args_list,
+                threads_count=procnum,
+                pbar=pbar,
+                dispatch=dispatch,
+                on_result=on_result,
+                gate=gate,
+                limits=limits
+            )
         pbar.finish()
     else:
         raise CiscomationException('procum parameter cannot be null')
+    for data in results:
+        history.record(data)
+    flush_caches()
     dict_result = {}
     for data in results:
         dict_result.update(data)
@@ -625,6 +1545,8 @@ def arg_conf(description):
     '''
     Reading argument given to the script.
     '''
+    import configargparse
+    from configargparse import YAMLConfigFileParser
     parser = configargparse.ArgParser(
         default_config_files=[
             '/etc/%s.yml' % __SCRIPT__,
@@ -662,7 +1584,316 @@ def arg_conf(description):
         default=1,
         help=(
             'Number of process if maintenance is compatible with multi '
-            'process.'
+            'process, or of sessions in flight with --engine async or '
+            'threads.'
+        )
+    )
+    parser.add(
+        '--engine',
+        type=str,
+        dest='engine',
+        default='mp',
+        choices=ENGINES,
+        help=(
+            'mp runs hosts in several processes, async runs up to procnum '
+            'sessions from a single process, threads runs them in a pool of '
+            'procnum threads.'
+        )
+    )
+    parser.add(
+        '--dispatch',
+        type=str,
+        dest='dispatch',
+        default='shared',
+        choices=DISPATCH_MODES,
+        help=(
+            'How hosts are given to processes: shared makes idle processes '
+            'pick the next host, roundrobin splits hosts between processes '
+            'before starting.'
+        )
+    )
+    parser.add(
+        '--cache-dir',
+        type=str,
+        dest='cache_dir',
+        default=CACHE_DIR,
+        help='Path of the directory keeping caches between maintenances'
+    )
+    parser.add(
+        '--dns-workers',
+        type=int,
+        dest='dns_workers',
+        default=16,
+        help='Number of concurrent DNS lookups while reading the xml file.'
+    )
+    parser.add(
+        '--dns-ttl',
+        type=int,
+        dest='dns_ttl',
+        default=86400,
+        help=(
+            'Seconds a resolved switch name is kept in the DNS cache, 0 '
+            'disables the cache.'
+        )
+    )
+    parser.add(
+        '--driver-ttl',
+        type=int,
+        dest='driver_ttl',
+        default=604800,
+        help=(
+            'Seconds the driver detected on a switch is kept in the driver '
+            'cache, 0 disables the cache and runs show version on every '
+            'login.'
+        )
+    )
+    parser.add(
+        '--history-ttl',
+        type=int,
+        dest='history_ttl',
+        default=2592000,
+        help=(
+            'Seconds the durations of a switch are kept in the history used '
+            'by --longest-first, 0 disables the history.'
+        )
+    )
+    parser.add(
+        '--longest-first',
+        dest='longest_first',
+        action='store_true',
+        default=False,
+        help=(
+            'Start the switches expected to last the longest first, from '
+            'the history of past maintenances or else from their number of '
+            'commands, instead of the xml order.'
+        )
+    )
+    parser.add(
+        '--trust-xml-ip',
+        dest='trust_xml_ip',
+        action='store_true',
+        default=False,
+        help=(
+            'Use the <ip> given for a switch in the xml file without '
+            'resolving its name.'
+        )
+    )
+    parser.add(
+        '--reuse-sessions',
+        dest='reuse_sessions',
+        action='store_true',
+        default=False,
+        help=(
+            'Keep SSH sessions open and reuse them when the same host comes '
+            'again in the maintenance.'
+        )
+    )
+    parser.add(
+        '--session-max-idle',
+        type=int,
+        dest='session_max_idle',
+        default=300,
+        help='Seconds an unused session is kept with --reuse-sessions.'
+    )
+    parser.add(
+        '--session-max-age',
+        type=int,
+        dest='session_max_age',
+        default=3600,
+        help='Seconds after login a session stops being reused.'
+    )
+    parser.add(
+        '--session-per-host',
+        type=int,
+        dest='session_per_host',
+        default=1,
+        help='Number of idle sessions kept for a host.'
+    )
+    parser.add(
+        '--stream',
+        dest='stream',
+        action='store_true',
+        default=False,
+        help=(
+            'Read the xml file while the maintenance runs instead of loading '
+            'it first, for very large maintenances.'
+        )
+    )
+    parser.add(
+        '--diff-only',
+        dest='diff_only',
+        action='store_true',
+        default=False,
+        help=(
+            'Read the running configuration of every switch and send only '
+            'the configuration lines it does not have yet.'
+        )
+    )
+    parser.add(
+        '--config-ttl',
+        type=int,
+        dest='config_ttl',
+        default=0,
+        help=(
+            'Seconds the running configuration read by --diff-only is kept '
+            'and used instead of reading it again, 0 always reads it.'
+        )
+    )
+    parser.add(
+        '--resume',
+        dest='resume',
+        default=None,
+        help=(
+            'dump_*.jsonl file of an interrupted run of the same xml file, '
+            'switches it shows as done without error are skipped.'
+        )
+    )
+    parser.add(
+        '--pipeline-window',
+        type=int,
+        dest='pipeline_window',
+        default=PIPELINE_WINDOW,
+        help=(
+            'Number of commands of a --pipeline-start block sent before '
+            'reading their answers.'
+        )
+    )
+    parser.add(
+        '--file-transfer',
+        dest='file_transfer',
+        choices=TRANSFERS,
+        default='scp',
+        help=(
+            'How --file-push-start blocks are uploaded to the switches, the '
+            'matching server must be enabled on them.'
+        )
+    )
+    parser.add(
+        '--table-format',
+        dest='table_format',
+        choices=TABLE_FORMATS,
+        default='xlsx',
+        help=(
+            'Format of the table of hosts, csv does not need openpyxl and '
+            'is faster for large maintenances.'
+        )
+    )
+    parser.add(
+        '--constant-memory-xlsx',
+        dest='constant_memory_xlsx',
+        action='store_true',
+        default=False,
+        help=(
+            'Streams the rows of the xlsx table of hosts to disk instead of '
+            'holding the sheet in memory until the end.'
+        )
+    )
+    parser.add(
+        '--spill-threshold',
+        type=int,
+        dest='spill_threshold',
+        default=SPILL_THRESHOLD,
+        help=(
+            'Command outputs larger than that many bytes are written to '
+            'outputs_<date>/<switch>.txt as soon as read and referred to in '
+            'the results, 0 keeps them all in memory.'
+        )
+    )
+    parser.add(
+        '--login-rate',
+        type=float,
+        dest='login_rate',
+        default=0,
+        help=(
+            'Logins per second across all processes and threads, to stay '
+            'under the rate limits of the AAA servers, 0 does not limit '
+            'them.'
+        )
+    )
+    parser.add(
+        '--login-burst',
+        type=int,
+        dest='login_burst',
+        default=5,
+        help='Logins allowed at once with --login-rate.'
+    )
+    parser.add(
+        '--login-max-rejects',
+        type=int,
+        dest='login_max_rejects',
+        default=0,
+        help=(
+            'Switches rejecting all their login attempts across the '
+            'maintenance after which no login is attempted, so a wrong '
+            'password does not lock the account. Once a switch rejected '
+            'them, logins in flight count as rejected, 0 never stops.'
+        )
+    )
+    parser.add(
+        '--canary',
+        type=int,
+        dest='canary',
+        default=0,
+        help=(
+            'Number of hosts run first, the next waves growing by '
+            '--wave-growth times and starting once the previous one is '
+            'over, 0 runs all hosts at once.'
+        )
+    )
+    parser.add(
+        '--wave-growth',
+        type=int,
+        dest='wave_growth',
+        default=2,
+        help='Size ratio between a wave of hosts and the previous one.'
+    )
+    parser.add(
+        '--max-failure-rate',
+        type=float,
+        dest='max_failure_rate',
+        default=None,
+        help=(
+            'Failure rate, between 0 and 1, above which no new host is '
+            'started, the hosts in flight finish.'
+        )
+    )
+    parser.add(
+        '--breaker-min-hosts',
+        type=int,
+        dest='breaker_min_hosts',
+        default=5,
+        help='Number of finished hosts before --max-failure-rate applies.'
+    )
+    parser.add(
+        '--breaker-on',
+        dest='breaker_on',
+        choices=FAILURE_FIELDS,
+        default='status_ok',
+        help=(
+            'status_ok counts hosts stopped by an error as failed, '
+            'all_commands_ok also counts the ones with ignored errors.'
+        )
+    )
+    parser.add(
+        '--group-limit',
+        dest='group_limits',
+        action='append',
+        metavar='GROUP=N',
+        help=(
+            'At most N switches of GROUP in flight, their group being the '
+            'group attribute of their <switch> element or else the name '
+            'matched by --group-regex. * applies to every group without its '
+            'own limit. Can be repeated.'
+        )
+    )
+    parser.add(
+        '--group-regex',
+        dest='group_regex',
+        default=None,
+        help=(
+            'Regular expression searched in the switch names without group '
+            'attribute, its first parenthesized group, or else the whole '
+            'match, names their group.'
         )
     )
     return parser.parse_args()
@@ -684,63 +1915,134 @@ def main():
     )
     logconfig(ARGS)
     DATE = datetime.datetime.now()
-    MAINT = xml_to_maintenance(ARGS.xml_file)
-    with open('./maintenance.txt', 'wb') as dumpfile:
-        json.dump(MAINT, dumpfile, indent=4)
-    RESULTS = run_maint(MAINT, CREDENTIALS, procnum=int(ARGS.procnum))
-    DUMPFILE = 'dump_{}.txt'.format(DATE.strftime("%y%m%d_%H%M%S"))
+    DNS_CACHE = None
+    if ARGS.dns_ttl > 0:
+        DNS_CACHE = TTLCache(
+            cache_path(ARGS.cache_dir, 'dns.json'),
+            ttl=ARGS.dns_ttl
+        )
+    MAINT = xml_to_maintenance(
+        ARGS.xml_file,
+        dns_workers=ARGS.dns_workers,
+        dns_cache=DNS_CACHE,
+        trust_ip=ARGS.trust_xml_ip,
+        stream=ARGS.stream
+    )
+    if not ARGS.stream:
+        with open('./maintenance.txt', 'wb') as dumpfile:
+            json.dump(MAINT, dumpfile, indent=4)
+    POOL = None
+    if ARGS.reuse_sessions:
+        POOL = {
+            'max_idle': ARGS.session_max_idle,
+            'max_age': ARGS.session_max_age,
+            'per_host': ARGS.session_per_host
+        }
+    DRIVER_CACHE = None
+    if ARGS.driver_ttl > 0:
+        DRIVER_CACHE = {
+            'filename': cache_path(ARGS.cache_dir, 'drivers.json'),
+            'ttl': ARGS.driver_ttl
+        }
+    HISTORY = None
+    if ARGS.history_ttl > 0:
+        HISTORY = {
+            'filename': cache_path(ARGS.cache_dir, HISTORY_FILE),
+            'ttl': ARGS.history_ttl
+        }
+    DUMPFILE = 'dump_{}.jsonl'.format(DATE.strftime("%y%m%d_%H%M%S"))
     CMDFILE = 'cmd_{}.txt'.format(DATE.strftime("%y%m%d_%H%M%S"))
-    XLSXFILE = '{}_{}.xlsx'.format(
+    SUMMARYFILE = 'summary_{}.txt'.format(DATE.strftime("%y%m%d_%H%M%S"))
+    TIMINGFILE = 'timings_{}.txt'.format(DATE.strftime("%y%m%d_%H%M%S"))
+    COMMANDSFILE = 'commands_{}.csv'.format(DATE.strftime("%y%m%d_%H%M%S"))
+    # {} is the name of the template
+    PARSEDFILE = 'parsed_{{}}_{}.csv'.format(DATE.strftime("%y%m%d_%H%M%S"))
+    TABLEFILE = '{}_{}.{}'.format(
         ARGS.xml_file.replace('\\', '/').split('/')[-1],
         DATE.strftime("%y%m%d_%H%M%S"),
+        ARGS.table_format
     )
-    with open(DUMPFILE, 'wb') as dumpfile:
-        json.dump(RESULTS, dumpfile, indent=4)
-    # writing report
-    RESULTS_COPY = copy.deepcopy(RESULTS)
-    for hostname, feedback in RESULTS_COPY.items():
-        feedback['commands'] = len(feedback['commands'])
-        maintlogs = {
-            'debug': 0,
-            'info': 0,
-            'warning': 0,
-            'error': 0,
-            'critical': 0
+    SPILL = None
+    if ARGS.spill_threshold > 0:
+        SPILL = {
+            'directory': 'outputs_{}'.format(DATE.strftime("%y%m%d_%H%M%S")),
+            'threshold': ARGS.spill_threshold
         }
-        for thislog in feedback['logs']:
-            maintlogs[thislog[0]] += 1
-        feedback.update(maintlogs)
-        del feedback['logs']
-    TABLE_REPORT = pd.DataFrame(RESULTS_COPY).T
-    TABLE_REPORT = TABLE_REPORT.rename(
-        columns={
-            'debug': 'log_debug',
-            'info': 'log_info',
-            'warning': 'log_warning',
-            'error': 'log_error',
-            'critical': 'log_critical'
+    CONFIG_CACHE = None
+    if ARGS.diff_only and ARGS.config_ttl > 0:
+        CONFIG_CACHE = {
+            'directory': cache_path(ARGS.cache_dir, 'configs'),
+            'ttl': ARGS.config_ttl
         }
+    install_limiter(
+        LoginLimiter(
+            rate=ARGS.login_rate,
+            burst=ARGS.login_burst,
+            max_rejected=ARGS.login_max_rejects
+        )
+    )
+    GATE = None
+    if ARGS.canary > 0 or ARGS.max_failure_rate is not None:
+        GATE = WaveGate(
+            canary=ARGS.canary,
+            growth=ARGS.wave_growth,
+            max_failure_rate=ARGS.max_failure_rate,
+            min_finished=ARGS.breaker_min_hosts,
+            failure_on=ARGS.breaker_on
+        )
+    LIMITS = None
+    if ARGS.group_limits:
+        LIMITS = GroupLimits(
+            parse_group_limits(ARGS.group_limits),
+            pattern=ARGS.group_regex
+        )
+    # every host is written as soon as done, reports are built from the file
+    RESULTS = ResultWriter(DUMPFILE, tablefile=COMMANDSFILE)
+    DONE = set()
+    if ARGS.resume:
+        DONE = resume_journal(ARGS.resume, RESULTS)
+        logging.getLogger(__SCRIPT__).info(
+            'Resuming {}, {} switches already done'.format(
+                ARGS.resume,
+                len(DONE)
+            )
+        )
+    try:
+        run_maint(
+            MAINT,
+            CREDENTIALS,
+            procnum=int(ARGS.procnum),
+            dispatch=ARGS.dispatch,
+            engine=ARGS.engine,
+            pool=POOL,
+            driver_cache=DRIVER_CACHE,
+            pipeline_window=ARGS.pipeline_window,
+            file_transfer=ARGS.file_transfer,
+            on_result=RESULTS.write,
+            done=DONE,
+            diff_only=ARGS.diff_only,
+            config_cache=CONFIG_CACHE,
+            gate=GATE,
+            history=HISTORY,
+            longest_first=ARGS.longest_first,
+            limits=LIMITS,
+            spill=SPILL
+        )
+    finally:
+        RESULTS.close()
+        if POOL:
+            get_pool(**POOL).close_all()
+    # writing reports, in one pass over the results file
+    build_reports(
+        DUMPFILE,
+        cmdfile=CMDFILE,
+        summaryfile=SUMMARYFILE,
+        timingfile=TIMINGFILE,
+        tablefile=TABLEFILE,
+        parsedfile=PARSEDFILE,
+        table_format=ARGS.table_format,
+        constant_memory=ARGS.constant_memory_xlsx
     )
-    TABLE_REPORT[sorted(list(TABLE_REPORT.columns))].to_excel(XLSXFILE)
-    with open(CMDFILE, 'wb') as cmdresult:
-        for hostname, feedback in RESULTS.items():
-            cmdresult.write('Host : {}\n'.format(hostname))
-            indent = '    '
-            for command in feedback['commands']:
-                cmdresult.write(
-                    '{}CMD: {}\n'.format(
-                        indent,
-                        command.keys()[0]
-                    )
-                )
-                if command[command.keys()[0]]:
-                    for line in command[command.keys()[0]].splitlines():
-                        cmdresult.write(
-                            '{}{}\n'.format(
-                                indent*2,
-                                line
-                            )
-                        )
 
 
 if __name__ == '__main__':
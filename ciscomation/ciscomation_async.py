@@ -0,0 +1,184 @@
+'''
+Single process engine keeping many SSH sessions in flight.
+
+Exscript sessions are blocking and python 2.7 has no asyncio, so every
+session runs in its own light thread (small stack, mostly waiting on its
+socket). The --sleep-xx keywords wait on an event instead of blocking the
+process, see :func:`ciscomation_threads.cancellable_sleep`, so thousands of
+sessions can share one interpreter.
+'''
+import Queue
+import logging
+import signal
+import threading
+from ciscomation.ciscomation_exc import CiscomationException
+from ciscomation.ciscomation_threads import CANCEL
+from ciscomation.ciscomation_threads import install_killer
+
+# stack size of the session threads and of the paramiko transports they start
+SESSION_STACK_SIZE = 512 * 1024
+
+
+def session_wrapper(func, args, kwargs, slots, outqueue, limits=None,
+                    gate=None):
+    '''
+    Runs one job and sends its result, or the error it raised, to outqueue.
+    The result is counted by gate before the slot is released, so a tripped
+    breaker is seen by the next launch.
+    '''
+    import traceback
+    data = None
+    try:
+        data = func(*args, **kwargs)
+        outqueue.put(data)
+    except Exception:
+        outqueue.put(('ERROR', traceback.format_exc()))
+    finally:
+        if gate is not None:
+            gate.record(data)
+        if limits is not None:
+            limits.done(args[0])
+        slots.release()
+
+
+def async_manager(func, args_list, sessions=256, pbar=None,
+                  on_result=None, gate=None, limits=None):
+    '''
+    Runs func for every job of args_list from the current process, keeping up
+    to sessions jobs in flight.
+
+    Parameters
+    ----------
+    func : callable
+        function run for every job, usually run_commands.
+
+    args_list : iterable
+        dicts with 'args' and 'kwargs' keys, one per job.
+
+    sessions : int
+        maximum number of jobs in flight.
+
+    pbar : progressbar.ProgressBar, optional
+        updated each time a result comes back.
+
+    on_result : callable, optional
+        called with each result as it comes back, results are then not
+        kept and an empty list is returned.
+
+    gate : ciscomation_sched.WaveGate, optional
+        decides when the next job may start. Once its breaker tripped, no
+        session is started and the running ones finish.
+
+    limits : ciscomation_sched.GroupLimits, optional
+        caps the sessions in flight per group.
+
+    Returns
+    -------
+    result: list
+        results of func, in completion order.
+    '''
+    logger = logging.getLogger()
+    if sessions < 1:
+        raise CiscomationException('sessions parameter cannot be null')
+    slots = threading.BoundedSemaphore(sessions)
+    out_queue = Queue.Queue()
+    previous_handler = install_killer()
+
+    def launcher():
+        '''
+        Starts a session each time a slot is free, then tells how many were
+        started.
+        '''
+        count = 0
+        jobs = iter(args_list)
+        while True:
+            if gate is not None:
+                # a timeout keeps the wait interruptible by Ctrl-C
+                while not (gate.wait(1) or gate.tripped or CANCEL.is_set()):
+                    pass
+                if gate.tripped:
+                    break
+            slots.acquire()
+            args_data = None
+            while args_data is None and not CANCEL.is_set():
+                try:
+                    if limits is None:
+                        args_data = next(jobs)
+                    else:
+                        args_data = limits.take(jobs)
+                except StopIteration:
+                    break
+                if args_data is None:
+                    # the jobs left wait for room in their group
+                    limits.wait(1)
+            if args_data is None:
+                slots.release()
+                break
+            if gate is not None and gate.tripped:
+                # tripped while waiting for the slot or the group
+                slots.release()
+                if limits is not None:
+                    limits.done(args_data['args'][0])
+                break
+            if gate is not None:
+                gate.start()
+            session = threading.Thread(
+                target=session_wrapper,
+                args=(
+                    func,
+                    args_data['args'],
+                    args_data['kwargs'],
+                    slots,
+                    out_queue,
+                    limits,
+                    gate,
+                )
+            )
+            session.daemon = True
+            session.start()
+            count += 1
+        out_queue.put(('END', count))
+
+    previous_stack_size = threading.stack_size(SESSION_STACK_SIZE)
+    try:
+        feeder = threading.Thread(target=launcher)
+        feeder.daemon = True
+        feeder.start()
+        logger.debug('Async engine started with %d sessions' % sessions)
+        result = []
+        expected = None
+        done = 0
+        while expected is None or done < expected:
+            try:
+                # a timeout keeps the wait interruptible by Ctrl-C
+                data = out_queue.get(True, 1)
+            except Queue.Empty:
+                continue
+            if type(data) is tuple:
+                if data[0] == 'END':
+                    expected = data[1]
+                    logger.debug(
+                        'Async engine launched %d sessions' % expected
+                    )
+                else:
+                    done += 1
+                    logger.critical('Session crashed:\n{}'.format(data[1]))
+                continue
+            done += 1
+            if on_result is None:
+                result.append(data)
+            else:
+                on_result(data)
+            if pbar:
+                pbar.update(done)
+            if 'logs' in data[data.keys()[0]]:
+                for log in data[data.keys()[0]]['logs']:
+                    logger.log(logging.getLevelName(log[0].upper()), log[1])
+    finally:
+        threading.stack_size(previous_stack_size)
+        if previous_handler is not None:
+            signal.signal(signal.SIGINT, previous_handler)
+    if CANCEL.is_set():
+        logger.warning('Interrupted, hosts not started yet were skipped.')
+    logger.debug('Async engine done')
+    return result
@@ -0,0 +1,192 @@
+'''
+Small on disk caches kept between maintenances.
+'''
+import json
+import os
+import threading
+import time
+
+# where the caches live unless told otherwise
+CACHE_DIR = '~/.ciscomation'
+# number of changes after which a cache is written without waiting for flush
+SAVE_EVERY = 100
+# caches of the current process, see get_cache
+CACHES = {}
+CACHES_LOCK = threading.Lock()
+
+
+def cache_path(cache_dir, filename):
+    '''
+    Returns the full path of a cache file, creating cache_dir if needed.
+    '''
+    cache_dir = os.path.expanduser(cache_dir or CACHE_DIR)
+    if not os.path.isdir(cache_dir):
+        os.makedirs(cache_dir)
+    return os.path.join(cache_dir, filename)
+
+
+class TTLCache(object):
+    '''
+    JSON file backed key/value store whose entries expire after ttl seconds.
+
+    Entries are read once when the cache is opened. Changes are kept apart
+    and merged into the file as it is on disk when saving, so several
+    processes can share the same file.
+
+    Parameters
+    ----------
+    filename : str
+        path of the JSON file, created on first save.
+
+    ttl : int, optional
+        lifetime of entries in seconds, None or 0 means they never expire.
+    '''
+    def __init__(self, filename, ttl=None):
+        self.filename = os.path.expanduser(filename)
+        self.ttl = ttl
+        self.pid = os.getpid()
+        self.lock = threading.RLock()
+        self.entries = self._read()
+        self.changes = {}
+
+    def _read(self):
+        try:
+            with open(self.filename, 'rb') as cachefile:
+                return json.load(cachefile)
+        except (IOError, ValueError):
+            return {}
+
+    def get(self, key):
+        '''
+        Returns the value stored for key, or None if missing or expired.
+        '''
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        if self.ttl and time.time() - entry['stamp'] > self.ttl:
+            return None
+        return entry['value']
+
+    def set(self, key, value):
+        entry = {'value': value, 'stamp': time.time()}
+        with self.lock:
+            self.entries[key] = entry
+            self.changes[key] = entry
+            if len(self.changes) >= SAVE_EVERY:
+                self.save()
+
+    def invalidate(self, key):
+        with self.lock:
+            self.entries.pop(key, None)
+            self.changes[key] = None
+
+    def save(self):
+        '''
+        Writes the changes made since the last save.
+        '''
+        with self.lock:
+            if not self.changes:
+                return
+            entries = self._read()
+            for key, entry in self.changes.items():
+                if entry is None:
+                    entries.pop(key, None)
+                else:
+                    entries[key] = entry
+            tmpname = '{}.{}.tmp'.format(self.filename, os.getpid())
+            with open(tmpname, 'wb') as cachefile:
+                json.dump(entries, cachefile)
+            try:
+                os.rename(tmpname, self.filename)
+            except OSError:
+                # windows does not replace existing files on rename
+                os.remove(self.filename)
+                os.rename(tmpname, self.filename)
+            self.entries = entries
+            self.changes = {}
+
+
+def get_cache(filename, ttl=None):
+    '''
+    Returns the TTLCache of the current process for filename, opened on
+    first call. Changes are written every SAVE_EVERY changes and by
+    flush_caches.
+    '''
+    with CACHES_LOCK:
+        cache = CACHES.get(filename)
+        if cache is None or cache.pid != os.getpid() or cache.ttl != ttl:
+            cache = TTLCache(filename, ttl)
+            CACHES[filename] = cache
+        return cache
+
+
+def flush_caches():
+    '''
+    Writes the pending changes of the caches opened by get_cache.
+    '''
+    with CACHES_LOCK:
+        caches = list(CACHES.values())
+    for cache in caches:
+        if cache.pid == os.getpid():
+            cache.save()
+
+
+class SnapshotCache(object):
+    '''
+    Text snapshots kept one file per key in a directory, such as the
+    running configurations used by --diff-only. Too big to share a JSON
+    file, their age is the one of their file.
+
+    Parameters
+    ----------
+    directory : str
+        directory of the snapshots, created if needed.
+
+    ttl : int, optional
+        lifetime of snapshots in seconds, None or 0 means they never expire.
+    '''
+    def __init__(self, directory, ttl=None):
+        self.directory = os.path.expanduser(directory)
+        self.ttl = ttl
+        if not os.path.isdir(self.directory):
+            try:
+                os.makedirs(self.directory)
+            except OSError:
+                # created meanwhile by another process
+                pass
+
+    def _path(self, key):
+        return os.path.join(
+            self.directory, '{}.txt'.format(key.replace(os.sep, '_'))
+        )
+
+    def get(self, key):
+        '''
+        Returns the snapshot of key, or None if missing or expired.
+        '''
+        path = self._path(key)
+        try:
+            if self.ttl and time.time() - os.path.getmtime(path) > self.ttl:
+                return None
+            with open(path, 'rb') as snapfile:
+                return snapfile.read()
+        except (IOError, OSError):
+            return None
+
+    def set(self, key, value):
+        path = self._path(key)
+        tmpname = '{}.{}.tmp'.format(path, os.getpid())
+        with open(tmpname, 'wb') as snapfile:
+            snapfile.write(value)
+        try:
+            os.rename(tmpname, path)
+        except OSError:
+            # windows does not replace existing files on rename
+            os.remove(path)
+            os.rename(tmpname, path)
+
+    def invalidate(self, key):
+        try:
+            os.remove(self._path(key))
+        except OSError:
+            pass
@@ -0,0 +1,228 @@
+'''
+Diff-only mode: configuration lines already in the running configuration of
+a switch are removed from its commands before they are sent.
+
+Lines are compared with their parent context, the same description under
+two interfaces being two different lines. In the commands, children are
+recognized by their indentation or, when the block is not indented, as the
+lines following a parent line (interface, router, line...) until exit,
+end, or the next parent line.
+'''
+import re
+from ciscomation.ciscomation_spill import trim_response
+
+# lines entering configuration mode
+CONF_START_RE = re.compile(r'^conf(?:igure)?(?: t(?:erminal)?)?$')
+# top level lines opening a sub mode, besides the ones having children in
+# the running configuration
+PARENT_RE = re.compile(
+    r'^(?:interface|router|line|vlan \d|ip(?:v6)? access-list|'
+    r'(?:policy|class|route)-map|ip vrf|vrf (?:definition|context)|'
+    r'key chain|ip dhcp pool|ip sla \d|track \d|control-plane|'
+    r'spanning-tree mst configuration|aaa group server|monitor session)\b'
+)
+# keywords changing how the next command runs
+MODIFIER_RE = re.compile(r'^--(?:ignore-error|print-next|parse )')
+
+
+def normalize(line):
+    return ' '.join(line.split())
+
+
+def config_tree(running):
+    '''
+    Returns the lines of a configuration, every one as the tuple of its
+    parent lines and itself.
+    '''
+    paths = set()
+    stack = []
+    for raw in running.splitlines():
+        line = normalize(raw)
+        if not line or line.startswith('!'):
+            continue
+        indent = len(raw) - len(raw.lstrip())
+        while stack and stack[-1][0] >= indent:
+            stack.pop()
+        path = tuple(parent for level, parent in stack) + (line,)
+        paths.add(path)
+        stack.append((indent, line))
+    return paths
+
+
+def diff_commands(commands, running):
+    '''
+    Removes from commands the configuration lines found in running.
+
+    Only lines between configure terminal and end, or in a --file-push-start
+    block, are compared. A parent line present on the switch is sent only
+    if one of its children is, exit lines closing a parent that was not sent
+    are dropped. Other commands, keywords and --multiline-start blocks are
+    kept as they are. A 'no' line is dropped only if the running
+    configuration shows it as is. Keywords changing the next command,
+    --ignore-error, --print-next and --parse, are dropped with a dropped
+    line and otherwise moved right before the line, after its parents.
+
+    Parameters
+    ----------
+    commands : list
+        commands of a switch, as given to run_commands.
+
+    running : str
+        output of show running-config.
+
+    Returns
+    -------
+    commands, sent, skipped: tuple
+        commands left, numbers of configuration lines kept and dropped.
+
+    Examples
+    --------
+    >>> diff_commands(
+    ...     ['conf t', '--ignore-error', 'ntp server 10.0.0.1',
+    ...      'snmp-server community X RO', 'end'],
+    ...     'ntp server 10.0.0.1'
+    ... )
+    (['conf t', 'snmp-server community X RO', 'end'], 1, 1)
+    '''
+    paths = config_tree(running)
+    parents = set(path[:-1] for path in paths)
+    result = []
+    sent = 0
+    skipped = 0
+    config = False
+    verbatim = False
+    push_start = None
+    # context of the current line, (indent, line, sent, modifiers) entries
+    stack = []
+    # modifier keywords waiting for the configuration line they apply to
+    pending = []
+
+    def send(command):
+        result.extend(pending)
+        del pending[:]
+        result.append(command)
+
+    for command in commands:
+        line = normalize(command)
+        if verbatim:
+            result.append(command)
+            verbatim = line != '--multiline-stop'
+            continue
+        if line == '--multiline-start':
+            verbatim = True
+            send(command)
+            continue
+        elif line == '--file-push-start':
+            send(command)
+            config = True
+            stack = []
+            push_start = len(result) - 1
+            continue
+        elif line == '--file-push-stop':
+            config = False
+            stack = []
+            if push_start == len(result) - 1:
+                # nothing left to push
+                result.pop()
+                del pending[:]
+                continue
+            send(command)
+            continue
+        if config and MODIFIER_RE.match(line):
+            pending.append(command)
+            continue
+        if line.startswith('--') or not line:
+            result.append(command)
+            continue
+        if not config:
+            send(command)
+            if CONF_START_RE.match(line):
+                config = True
+                stack = []
+            continue
+        if line == 'end':
+            send(command)
+            config = False
+            stack = []
+            continue
+        if line == 'exit':
+            if stack and stack.pop()[2]:
+                send(command)
+            else:
+                del pending[:]
+            continue
+        indent = len(command) - len(command.lstrip())
+        if indent:
+            while stack and stack[-1][0] >= indent:
+                stack.pop()
+        else:
+            # deepest context already holding the line, if any
+            depth = len(stack)
+            while depth and (
+                tuple(entry[1] for entry in stack[:depth]) + (line,)
+                not in paths
+            ):
+                depth -= 1
+            if depth or (line,) in paths or PARENT_RE.match(line):
+                del stack[depth:]
+        path = tuple(entry[1] for entry in stack) + (line,)
+        is_parent = path in parents or (
+            not stack and PARENT_RE.match(line) is not None
+        )
+        if path in paths:
+            if is_parent:
+                # its modifiers go with it if a child makes it sent
+                stack.append((indent, line, False, list(pending)))
+            skipped += 1
+            del pending[:]
+            continue
+        # missing line, the parents not sent yet go first
+        for index, (level, parent, parent_sent, modifiers) in enumerate(
+            stack
+        ):
+            if not parent_sent:
+                result.extend(modifiers)
+                result.append(' ' * level + parent)
+                stack[index] = (level, parent, True, [])
+                skipped -= 1
+                sent += 1
+        send(command)
+        sent += 1
+        if is_parent:
+            stack.append((indent, line, True, []))
+    result.extend(pending)
+    return result, sent, skipped
+
+
+def diff_only_commands(connection, host, commands, snapshots=None):
+    '''
+    Applies diff_commands to the commands of host, with its running
+    configuration taken from snapshots or read on connection.
+
+    Parameters
+    ----------
+    connection : Exscript.protocols.SSH2
+        connection to host, at the exec prompt.
+
+    snapshots : ciscomation_cache.SnapshotCache, optional
+        running configurations of previous runs. A configuration read on the
+        switch is stored when nothing is sent, the snapshot of a switch
+        receiving lines is dropped.
+
+    Returns
+    -------
+    commands, sent, skipped, fetched: tuple
+        see diff_commands, fetched being False when the snapshot was used.
+    '''
+    running = snapshots.get(host) if snapshots else None
+    fetched = running is None
+    if fetched:
+        connection.execute('show running-config')
+        running = trim_response(connection.response)
+    commands, sent, skipped = diff_commands(commands, running)
+    if snapshots:
+        if sent:
+            snapshots.invalidate(host)
+        elif fetched:
+            snapshots.set(host, running)
+    return commands, sent, skipped, fetched
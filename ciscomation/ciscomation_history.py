@@ -0,0 +1,130 @@
+'''
+Durations of the hosts in past maintenances, used to start the longest
+expected hosts first so a few big switches do not end the maintenance alone.
+
+A host is modelled as a session setup (dns, connect, login, driver) followed
+by its commands at a per command rate. Both are learnt from the results of
+every run, hosts never seen are given the median of the fleet.
+'''
+from ciscomation.ciscomation_cache import get_cache
+
+# file of the history in the cache directory
+HISTORY_FILE = 'durations.json'
+# weight of the last run in the learnt values
+ALPHA = 0.5
+# estimates used while the history is empty, only their ratio matters
+SETUP_SECONDS = 2.0
+COMMAND_SECONDS = 0.5
+SETUP_PHASES = ('dns', 'connect', 'login', 'driver')
+COMMAND_PHASES = ('diff', 'commands')
+
+
+def median(values, default):
+    values = sorted(values)
+    if not values:
+        return default
+    return values[len(values) // 2]
+
+
+class DurationHistory(object):
+    '''
+    Setup seconds and seconds per command of every host, kept in a
+    :class:`ciscomation_cache.TTLCache` saved with the other caches.
+
+    Parameters
+    ----------
+    filename : str, optional
+        path of the history, None keeps nothing and estimates every host
+        from its number of commands.
+
+    ttl : int, optional
+        seconds after which the values of a host not seen are forgotten.
+    '''
+    def __init__(self, filename=None, ttl=None):
+        self.cache = None
+        if filename is not None:
+            self.cache = get_cache(filename, ttl)
+
+    def record(self, result):
+        '''
+        Learns from a result of run_commands. Failed hosts are skipped, their
+        duration says nothing of the next run.
+        '''
+        if self.cache is None:
+            return
+        for hostname, feedback in result.items():
+            timings = feedback.get('timings', {})
+            if not feedback['status_ok'] or not feedback['commands']:
+                continue
+            learnt = dict(self.cache.get(hostname) or {})
+            # a reused session has no setup phases
+            if 'connect' in timings:
+                learnt['setup'] = self._mix(
+                    learnt.get('setup'),
+                    sum(timings.get(phase, 0) for phase in SETUP_PHASES)
+                )
+            learnt['per_command'] = self._mix(
+                learnt.get('per_command'),
+                sum(timings.get(phase, 0) for phase in COMMAND_PHASES) /
+                len(feedback['commands'])
+            )
+            self.cache.set(hostname, learnt)
+
+    def recording(self, on_result):
+        '''
+        Returns on_result learning from every result before passing it on.
+        '''
+        def record_and_pass(data):
+            self.record(data)
+            on_result(data)
+        return record_and_pass
+
+    @staticmethod
+    def _mix(previous, value):
+        if previous is None:
+            return round(value, 4)
+        return round(ALPHA * value + (1 - ALPHA) * previous, 4)
+
+    def estimator(self):
+        '''
+        Returns a function giving the expected seconds of a host from its
+        name and number of commands.
+        '''
+        known = {}
+        if self.cache is not None:
+            for hostname in list(self.cache.entries):
+                learnt = self.cache.get(hostname)
+                if learnt is not None:
+                    known[hostname] = learnt
+        setup = median(
+            [
+                learnt['setup'] for learnt in known.values()
+                if 'setup' in learnt
+            ],
+            SETUP_SECONDS
+        )
+        per_command = median(
+            [learnt['per_command'] for learnt in known.values()],
+            COMMAND_SECONDS
+        )
+
+        def estimate(hostname, commands):
+            learnt = known.get(hostname, {})
+            return (
+                learnt.get('setup', setup) +
+                learnt.get('per_command', per_command) * commands
+            )
+        return estimate
+
+    def longest_first(self, items, describe):
+        '''
+        Returns items as a list sorted by decreasing expected duration,
+        describe giving the (hostname, number of commands) of an item. Items
+        expected as long keep their order.
+        '''
+        estimate = self.estimator()
+        return sorted(
+            items,
+            key=lambda item: estimate(*describe(item)),
+            reverse=True
+        )
@@ -0,0 +1,117 @@
+'''
+Login rate limiter shared by all the workers of a maintenance, processes or
+threads, so they do not burst the AAA servers, and breaker stopping every
+login once the credentials were rejected on too many switches.
+'''
+import multiprocessing
+import time
+from ciscomation.ciscomation_exc import CiscomationLoginFailed
+
+# limiter of the current process, see install_limiter
+LIMITER = None
+# seconds between two checks of a login waiting for the ones in flight
+POLL = 0.05
+
+
+class LoginLimiter(object):
+    '''
+    Token bucket of logins. Its state lives in shared memory, processes
+    started after its creation share it when given the limiter, see
+    :func:`ciscomation_mp.mp_manager`.
+
+    Parameters
+    ----------
+    rate : float, optional
+        logins per second across the maintenance, 0 does not limit them.
+
+    burst : int, optional
+        logins allowed at once after a quiet period.
+
+    max_rejected : int, optional
+        switches rejecting every login attempt across the maintenance after
+        which no login is attempted any more, 0 disables the breaker. Logins
+        are not held back until a first switch rejected them, then logins in
+        flight count as rejected until they are done, so at most
+        max_rejected switches can be given up with the same wrong password.
+    '''
+    def __init__(self, rate=0, burst=1, max_rejected=0):
+        self.rate = rate
+        self.burst = max(burst, 1)
+        self.max_rejected = max_rejected
+        self.lock = multiprocessing.Lock()
+        self.tokens = multiprocessing.Value('d', self.burst, lock=False)
+        self.stamp = multiprocessing.Value('d', time.time(), lock=False)
+        self.rejected = multiprocessing.Value('i', 0, lock=False)
+        self.inflight = multiprocessing.Value('i', 0, lock=False)
+
+    def check(self):
+        '''
+        Raises CiscomationLoginFailed once the breaker tripped.
+        '''
+        if self.max_rejected and self.rejected.value >= self.max_rejected:
+            raise CiscomationLoginFailed(
+                (
+                    '{} logins rejected in this maintenance, no more login '
+                    'attempted to protect the account'
+                ).format(self.rejected.value)
+            )
+
+    def _take_token(self):
+        '''
+        Takes a token if one is there and returns 0, or returns the seconds
+        until the next one.
+        '''
+        if not self.rate:
+            return 0
+        now = time.time()
+        self.tokens.value = min(
+            self.burst,
+            self.tokens.value + (now - self.stamp.value) * self.rate
+        )
+        self.stamp.value = now
+        if self.tokens.value < 1:
+            return (1 - self.tokens.value) / self.rate
+        self.tokens.value -= 1
+        return 0
+
+    def acquire(self):
+        '''
+        Waits for a login token, raising CiscomationLoginFailed once the
+        breaker tripped. Every acquire must be followed by a done.
+        '''
+        while True:
+            with self.lock:
+                self.check()
+                wait = POLL
+                if (not self.max_rejected or not self.rejected.value or
+                        self.rejected.value + self.inflight.value <
+                        self.max_rejected):
+                    wait = self._take_token()
+                    if not wait:
+                        self.inflight.value += 1
+                        return
+            time.sleep(wait)
+
+    def done(self, rejected=False):
+        '''
+        Ends a login, rejected telling whether the device refused the
+        credentials on the last attempt of the switch, the attempts it
+        retries counting for nothing.
+        '''
+        with self.lock:
+            self.inflight.value -= 1
+            if rejected:
+                self.rejected.value += 1
+
+
+def install_limiter(limiter):
+    '''
+    Makes limiter the one used by set_connection in the current process,
+    None removes it.
+    '''
+    global LIMITER
+    LIMITER = limiter
+
+
+def get_limiter():
+    return LIMITER
@@ -2,6 +2,15 @@ import multiprocessing
 import signal
 import pprint
 import logging
+import threading
+from ciscomation.ciscomation_cache import flush_caches
+from ciscomation.ciscomation_exc import CiscomationException
+from ciscomation.ciscomation_login import get_limiter
+from ciscomation.ciscomation_login import install_limiter
+
+DISPATCH_MODES = ('shared', 'roundrobin')
+# number of jobs queued ahead per child in shared dispatch mode
+PREFETCH = 2
 
 
 def childkiller(signum, frame):
@@ -39,81 +48,321 @@ def killer(signum, frame):
             exit(1)
 
 
-def child_wrapper(inqueue, outqueue, identity):
+class LogQueueHandler(logging.Handler):
+    '''
+    Sends the records of a child process to the parent, which handles them
+    with its own logging configuration, see log_listener. Python 2 has no
+    logging.handlers.QueueHandler.
+    '''
+    def __init__(self, queue):
+        logging.Handler.__init__(self)
+        self.queue = queue
+
+    def emit(self, record):
+        try:
+            if record.exc_info:
+                # tracebacks cannot be pickled, their text is sent instead
+                record.exc_text = logging.Formatter().formatException(
+                    record.exc_info
+                )
+                record.exc_info = None
+            record.msg = record.getMessage()
+            record.args = None
+            self.queue.put(record)
+        except Exception:
+            self.handleError(record)
+
+
+def log_to_queue(queue, level):
+    '''
+    Sends every record logged in the current process to queue, once, the
+    handlers inherited from the parent being dropped.
+    '''
+    for logger in logging.Logger.manager.loggerDict.values():
+        if isinstance(logger, logging.Logger):
+            logger.handlers = []
+            logger.propagate = True
+    root = logging.getLogger()
+    root.handlers = [LogQueueHandler(queue)]
+    root.setLevel(level)
+
+
+def log_listener(queue):
+    '''
+    Handles the records sent by LogQueueHandler with the loggers of the
+    current process, until None comes.
+    '''
+    while True:
+        record = queue.get()
+        if record is None:
+            return
+        if record.name == 'root':
+            logging.getLogger().handle(record)
+        else:
+            logging.getLogger(record.name).handle(record)
+
+
+def error_result(args, kwargs, text):
+    '''
+    Returns the result of a job whose function raised, shaped like the ones
+    of run_commands so it is reported as a failed host.
+    '''
+    feedback = {
+        'driver': 'default',
+        'version': None,
+        'status_ok': False,
+        'all_commands_ok': False,
+        'commands': [],
+        'logs': [
+            (
+                'critical',
+                '{} Job crashed in child process:\n{}'.format(args[0], text)
+            )
+        ],
+        'timings': {},
+        'command_times': []
+    }
+    if 'job' in kwargs:
+        feedback['job'] = kwargs['job']
+    return {args[0]: feedback}
+
+
+def child_wrapper(inqueue, outqueue, identity, limiter=None, log_queue=None,
+                  log_level=logging.WARNING, stop=None):
     '''
     Wrapper for child process executing the functions passing through the input
     queues.
+
+    The logs of every result are logged here, and shipped with the other
+    records of the child to the parent through log_queue. A job raising an
+    exception gives a failed result, see error_result. Once stop, a
+    multiprocessing.Event, is set the jobs taken are not run, their host is
+    sent back as (identity, 'DROPPED', host).
     '''
     signal.signal(signal.SIGINT, childkiller)
+    install_limiter(limiter)
+    logger = logging.getLogger()
+    if log_queue is not None:
+        log_to_queue(log_queue, log_level)
     import time
     counter = 0
     while True:
         counter += 1
         payload = inqueue.get()
         if (payload == "END"):
+            flush_caches()
             outqueue.put((identity, "END"))
             return
-        result = payload[0](*payload[1], **payload[2])
+        if stop is not None and stop.is_set():
+            outqueue.put((identity, 'DROPPED', payload[1][0]))
+            continue
+        try:
+            result = payload[0](*payload[1], **payload[2])
+        except Exception:
+            import traceback
+            result = error_result(
+                payload[1], payload[2], traceback.format_exc()
+            )
+        feedback = result[result.keys()[0]]
+        if 'logs' in feedback:
+            for log in feedback['logs']:
+                logger.log(logging.getLevelName(log[0].upper()), log[1])
         outqueue.put(result)
         time.sleep(0.01)
 
 
-def mp_manager(func, args_list, threads_count=4, pbar=None):
+def mp_manager(func, args_list, threads_count=4, pbar=None,
+               dispatch='shared', on_result=None, gate=None, limits=None):
     '''
     Father and orchestartor of all processes.
+
+    Parameters
+    ----------
+    func : callable
+        function executed by the children, must be picklable.
+
+    args_list : iterable
+        dicts with 'args' and 'kwargs' keys, one per job.
+
+    threads_count : int
+        number of children processes.
+
+    pbar : progressbar.ProgressBar, optional
+        updated each time a result comes back.
+
+    dispatch : str, optional
+        'shared' (default) makes every child pull its next job from one
+        common queue, so an idle child always takes the next host and a slow
+        host only delays its own worker. The queue is topped up as results
+        come back, with at most PREFETCH jobs per child waiting.
+        'roundrobin' is the former static sharding where job n is bound to
+        child n % threads_count before the run starts.
+
+    on_result : callable, optional
+        called with each result as it comes back, results are then not
+        kept and an empty list is returned.
+
+    gate : ciscomation_sched.WaveGate, optional
+        decides when the next job may start, needs the shared dispatch.
+        Once its breaker tripped, the jobs taken by a child from then on
+        are dropped and the running ones finish.
+
+    limits : ciscomation_sched.GroupLimits, optional
+        caps the hosts in flight per group, needs the shared dispatch. The
+        jobs waiting in the shared queue count as in flight.
+
+    Results go through the parent untouched. The logs of the results and
+    the records of the children reach the handlers of the parent through a
+    queue, handled by a listener thread. At debug level every result is
+    also dumped to the log.
     '''
     logger = logging.getLogger()
+    if dispatch not in DISPATCH_MODES:
+        raise CiscomationException(
+            'unknown dispatch mode {}'.format(dispatch)
+        )
+    if gate is not None and dispatch != 'shared':
+        raise CiscomationException('waves need the shared dispatch mode')
+    if limits is not None and dispatch != 'shared':
+        raise CiscomationException('group limits need the shared dispatch')
     signal.signal(signal.SIGINT, killer)
-    logs = []
     global processes
     # preparing queues and process lists
     in_queues = list()
     processes = list()
     out_queue = multiprocessing.Queue()
     out_queue.cancel_join_thread
+    if dispatch == 'shared':
+        shared_queue = multiprocessing.Queue()
+    log_queue = multiprocessing.Queue()
+    # set when the breaker trips, see child_wrapper
+    stop = multiprocessing.Event()
+    listener = threading.Thread(target=log_listener, args=(log_queue,))
+    listener.daemon = True
+    listener.start()
     # Staging Jobs jobs
     for count in range(threads_count):
         # creating in queues and puting them in queue list
-        in_queues.append(multiprocessing.Queue())
+        if dispatch == 'shared':
+            in_queues.append(shared_queue)
+        else:
+            in_queues.append(multiprocessing.Queue())
+        # the login limiter is shared with the children, see
+        # ciscomation_login.LoginLimiter
         processes.append(multiprocessing.Process(target=child_wrapper, args=(
-            (in_queues[count]), out_queue, count,)))
+            (in_queues[count]), out_queue, count, get_limiter(), log_queue,
+            logging.getLogger().getEffectiveLevel(), stop,)))
     logger.debug('Starting Update %d Threads' % threads_count)
     # startring Jobs
     [processes[x].start() for x in range(threads_count)]
     logger.debug('Satrted Update %d Threads' % threads_count)
-    # assigning subnets to queues
-    for (index, args_data) in enumerate(args_list):
-        in_queues[(index % threads_count)].put(
-            (
-                func,
-                args_data['args'],
-                args_data['kwargs'],
+    jobs = iter(args_list)
+    feeding = [True]
+    # jobs in the shared queue or running
+    queued = [0]
+
+    def stop_feeding():
+        feeding[0] = False
+        [shared_queue.put("END") for x in range(threads_count)]
+        logger.debug(
+            'Queue poison pill sent for  %d Threads' % threads_count
+        )
+
+    def feed():
+        '''
+        Tops the shared queue up to PREFETCH jobs per child, and puts the
+        poison pills once all jobs are queued or the breaker tripped.
+        '''
+        if not feeding[0]:
+            return
+        while queued[0] < threads_count * PREFETCH:
+            if gate is not None and not gate.can_start():
+                if gate.tripped:
+                    # the jobs already queued come back as dropped
+                    stop.set()
+                    stop_feeding()
+                return
+            try:
+                if limits is None:
+                    args_data = next(jobs)
+                else:
+                    args_data = limits.take(jobs)
+            except StopIteration:
+                stop_feeding()
+                return
+            if args_data is None:
+                # the jobs left wait for room in their group
+                return
+            if gate is not None:
+                gate.start()
+            shared_queue.put(
+                (
+                    func,
+                    args_data['args'],
+                    args_data['kwargs'],
+                )
             )
+            queued[0] += 1
+
+    if dispatch == 'shared':
+        feed()
+    else:
+        # assigning subnets to queues
+        for (index, args_data) in enumerate(jobs):
+            in_queues[(index % threads_count)].put(
+                (
+                    func,
+                    args_data['args'],
+                    args_data['kwargs'],
+                )
+            )
+        logger.debug('Queue filled for  %d Threads' % threads_count)
+        # marking the end of the queues
+        [in_queues[x].put("END") for x in range(threads_count)]
+        logger.debug(
+            'Queue poison pill sent for  %d Threads' % threads_count
         )
-    logger.debug('Queue filled for  %d Threads' % threads_count)
-    # marking the end of the queues
-    [in_queues[x].put("END") for x in range(threads_count)]
-    logger.debug('Queue poison pill sent for  %d Threads' % threads_count)
     result = []
+    received = 0
     status = []
     while True:
         logger.debug('---- Received from output queue for Update:')
         data = out_queue.get()
-        text = pprint.pformat(data, indent=4, width=80, depth=None)
-        text = [' ' * 16 + x for x in text.split('\n')]
-        logs.append(('debug', '\n'.join(text)))
+        if type(data) is not tuple and logger.isEnabledFor(logging.DEBUG):
+            text = pprint.pformat(data, indent=4, width=80, depth=None)
+            logger.debug(
+                '\n'.join([' ' * 16 + x for x in text.split('\n')])
+            )
+        if type(data) is tuple and data[1] == 'DROPPED':
+            queued[0] -= 1
+            if limits is not None:
+                limits.done(data[2])
+            continue
         if type(data) is tuple:
             logger.debug('Process %s sent Poison pill.' % str(data[0]))
-            logger.debug('Update result size is %d.' % len(result))
+            logger.debug('Update result size is %d.' % received)
             status.append(data)
             logger.debug('Process End Status Size is %d.' % len(status))
             if len(status) == threads_count:
                 break
         else:
-            result.append(data)
-            pbar.update(len(result))
-            if 'logs' in data[data.keys()[0]]:
-                for log in data[data.keys()[0]]['logs']:
-                    logger.log(logging.getLevelName(log[0].upper()), log[1])
+            if dispatch == 'shared':
+                queued[0] -= 1
+                if gate is not None:
+                    gate.record(data)
+                if limits is not None:
+                    limits.done(data.keys()[0])
+                feed()
+            received += 1
+            if on_result is None:
+                result.append(data)
+            else:
+                on_result(data)
+            if pbar:
+                pbar.update(received)
     logger.debug("UPdate Joinning Processes")
+    # children flush their last records before exiting
+    [process.join() for process in processes]
+    log_queue.put(None)
+    listener.join()
     return result
@@ -0,0 +1,208 @@
+'''
+Parsing of command outputs into rows, asked for by a --parse <template> line
+before a command. Outputs are parsed in the process running the host, the
+rows travel in the result as 'parsed' entries and are written as one table
+per template by :func:`ciscomation_report.build_reports`.
+
+Templates use the single state subset of TextFSM, enough for the usual
+show command templates:
+
+    Value INTF (\\S+)
+    Value Required IPADDR (\\S+)
+    Value STATUS (up|down|administratively down)
+
+    Start
+      ^${INTF}\\s+${IPADDR}\\s+\\S+\\s+\\S+\\s+${STATUS} -> Record
+
+Value options are Filldown, Required and Key (ignored), rule actions Next,
+Continue, Record and their combinations. A record is also made at the end of
+the output. Other states and actions are refused.
+'''
+import os
+import re
+from ciscomation.ciscomation_exc import CiscomationException
+from ciscomation.ciscomation_report import command_entries
+from ciscomation.ciscomation_spill import output_lines
+
+# compiled templates of the current process, path -> (mtime, template)
+TEMPLATES = {}
+VALUE_RE = re.compile(r'^Value\s+(?:(\S+)\s+)?(\w+)\s+(\(.*\))\s*$')
+VALUE_OPTIONS = ('Filldown', 'Required', 'Key')
+ACTIONS = ('', 'Next', 'Record', 'Next.Record', 'Continue',
+           'Continue.Record')
+
+
+class Template(object):
+    '''
+    Compiled template, see the module documentation for the syntax.
+
+    Parameters
+    ----------
+    text : str
+        text of the template.
+
+    name : str, optional
+        name used in the error messages.
+    '''
+    def __init__(self, text, name='template'):
+        self.name = name
+        self.columns = []
+        self.filldown = set()
+        self.required = set()
+        # (compiled rule, record, continue)
+        self.rules = []
+        patterns = {}
+        state = None
+        for number, line in enumerate(text.splitlines(), 1):
+            if not line.strip() or line.lstrip().startswith('#'):
+                continue
+            if line.startswith('Value'):
+                match = VALUE_RE.match(line)
+                if match is None:
+                    self._error(number, 'invalid Value line')
+                options, column, pattern = match.groups()
+                for option in (options or '').split(','):
+                    if option and option not in VALUE_OPTIONS:
+                        self._error(
+                            number, 'unsupported option {}'.format(option)
+                        )
+                if 'Filldown' in (options or ''):
+                    self.filldown.add(column)
+                if 'Required' in (options or ''):
+                    self.required.add(column)
+                self.columns.append(column)
+                patterns[column] = pattern
+            elif not line[0].isspace():
+                state = line.strip()
+                if state != 'Start':
+                    self._error(number, 'only the Start state is supported')
+            elif state is None:
+                self._error(number, 'rule outside of the Start state')
+            else:
+                rule, _, action = line.strip().partition(' -> ')
+                action = action.strip()
+                if not rule.startswith('^') or action not in ACTIONS:
+                    self._error(
+                        number, 'unsupported rule {}'.format(line.strip())
+                    )
+                try:
+                    compiled = re.compile(
+                        re.sub(
+                            r'\$\{(\w+)\}',
+                            lambda ref: '(?P<{}>{})'.format(
+                                ref.group(1), patterns[ref.group(1)]
+                            ),
+                            rule
+                        ).replace('$$', '$')
+                    )
+                except (KeyError, re.error) as exc:
+                    self._error(number, 'invalid rule: {}'.format(exc))
+                self.rules.append(
+                    (compiled, 'Record' in action, 'Continue' in action)
+                )
+        if not self.columns or not self.rules:
+            raise CiscomationException(
+                '{}: no Value or no rule'.format(self.name)
+            )
+
+    def _error(self, number, message):
+        raise CiscomationException(
+            '{} line {}: {}'.format(self.name, number, message)
+        )
+
+    def parse(self, output):
+        '''
+        Returns the rows found in output, a string or a spilled output
+        reference, lists of strings in the order of columns.
+        '''
+        rows = []
+        values = dict((column, '') for column in self.columns)
+
+        def record():
+            if not any(
+                values[column] for column in self.columns
+                if column not in self.filldown
+            ):
+                return
+            if all(values[column] for column in self.required):
+                rows.append([values[column] for column in self.columns])
+            for column in self.columns:
+                if column not in self.filldown:
+                    values[column] = ''
+
+        for line in output_lines(output):
+            for compiled, records, goes_on in self.rules:
+                match = compiled.match(line)
+                if match is None:
+                    continue
+                for column, value in match.groupdict().items():
+                    if value is not None:
+                        values[column] = value
+                if records:
+                    record()
+                if not goes_on:
+                    break
+        record()
+        return rows
+
+
+def get_template(path):
+    '''
+    Returns the compiled template of path, compiled once per process and
+    again when the file changes.
+    '''
+    mtime = os.path.getmtime(path)
+    cached = TEMPLATES.get(path)
+    if cached is None or cached[0] != mtime:
+        with open(path, 'rb') as template:
+            cached = (mtime, Template(template.read(), path))
+        TEMPLATES[path] = cached
+    return cached[1]
+
+
+def template_name(path):
+    '''
+    Returns the name of a template, its file name without extension.
+    '''
+    return os.path.splitext(os.path.basename(path))[0]
+
+
+def parse_outputs(host, feedback, requests):
+    '''
+    Parses the outputs of feedback asked for by requests, (seq, command,
+    template path) triples, seq being the index of the command in
+    feedback['commands'], and adds the rows to feedback['parsed']. Failed
+    commands and commands not run are skipped.
+    '''
+    requests = dict((seq, (cmd, path)) for seq, cmd, path in requests)
+    for seq, cmd, output in command_entries(feedback):
+        if seq not in requests:
+            continue
+        requested, path = requests[seq]
+        if cmd != requested or output is None:
+            continue
+        try:
+            template = get_template(path)
+            rows = template.parse(output)
+        except (CiscomationException, IOError, OSError) as exc:
+            feedback['logs'].append(
+                (
+                    'error',
+                    '{} Parsing {} Failed : {}'.format(host, cmd, str(exc))
+                )
+            )
+            continue
+        feedback.setdefault('parsed', []).append(
+            {
+                'command': cmd,
+                'template': template_name(path),
+                'columns': template.columns,
+                'rows': rows
+            }
+        )
+        feedback['logs'].append(
+            (
+                'debug',
+                '{} Parsed {} rows from {}'.format(host, len(rows), cmd)
+            )
+        )
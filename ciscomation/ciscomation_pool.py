@@ -0,0 +1,144 @@
+'''
+Pool of authenticated SSH sessions, reused by the run_commands calls of a
+process instead of logging in again on the same host.
+'''
+import logging
+import os
+import threading
+import time
+
+# pool of the current process, see get_pool
+POOL = None
+POOL_LOCK = threading.Lock()
+
+
+def close_connection(connection):
+    '''
+    Closes an Exscript connection, ignoring errors from dead sessions.
+    '''
+    try:
+        connection.close(force=True)
+    except Exception:
+        pass
+
+
+class ConnectionPool(object):
+    '''
+    Keeps idle sessions by key, a key being the host and the credentials used
+    to log on it.
+
+    Parameters
+    ----------
+    max_idle : int
+        seconds an unused session is kept.
+
+    max_age : int
+        seconds after which a session is closed instead of being reused,
+        counted from the login.
+
+    per_host : int
+        maximum number of idle sessions kept for a key.
+
+    keepalive : int
+        interval of the SSH keepalives sent on idle sessions.
+    '''
+    def __init__(self, max_idle=300, max_age=3600, per_host=1, keepalive=30):
+        self.max_idle = max_idle
+        self.max_age = max_age
+        self.per_host = per_host
+        self.keepalive = keepalive
+        self.pid = os.getpid()
+        self.lock = threading.Lock()
+        self.idle = {}
+
+    def _expired(self, entry, now):
+        return (
+            now - entry['released'] > self.max_idle or
+            now - entry['created'] > self.max_age
+        )
+
+    def acquire(self, key):
+        '''
+        Returns a (connection, specific_version, created) tuple for key,
+        or None when no live session is available.
+        '''
+        logger = logging.getLogger()
+        now = time.time()
+        expired = []
+        found = None
+        with self.lock:
+            entries = self.idle.get(key, [])
+            while entries and found is None:
+                entry = entries.pop()
+                if self._expired(entry, now):
+                    expired.append(entry)
+                else:
+                    found = entry
+        for entry in expired:
+            close_connection(entry['connection'])
+        if found is None:
+            return None
+        connection = found['connection']
+        try:
+            # checks the session is alive, and leaves configuration mode
+            # if a previous run stopped there
+            connection.execute('')
+            if '(config' in connection.response.split('\n')[-1]:
+                connection.execute('end')
+        except Exception:
+            logger.debug('{} pooled session is dead'.format(key[0]))
+            close_connection(connection)
+            return None
+        return (connection, found['specific_version'], found['created'])
+
+    def release(self, key, connection, specific_version, created):
+        '''
+        Gives back a session, it is closed if too old or if key has already
+        enough idle sessions.
+        '''
+        now = time.time()
+        entry = {
+            'connection': connection,
+            'specific_version': specific_version,
+            'created': created,
+            'released': now
+        }
+        with self.lock:
+            entries = self.idle.setdefault(key, [])
+            keep = (
+                len(entries) < self.per_host and
+                not self._expired(entry, now)
+            )
+            if keep:
+                entries.append(entry)
+        if not keep:
+            close_connection(connection)
+            return
+        try:
+            connection.client.set_keepalive(self.keepalive)
+        except Exception:
+            pass
+
+    def close_all(self):
+        '''
+        Closes every idle session.
+        '''
+        with self.lock:
+            idle = self.idle
+            self.idle = {}
+        for entries in idle.values():
+            for entry in entries:
+                close_connection(entry['connection'])
+
+
+def get_pool(**settings):
+    '''
+    Returns the pool of the current process, created with settings on first
+    call. Every process, children of mp_manager included, has its own, the
+    sessions of a forked parent are never reused.
+    '''
+    global POOL
+    with POOL_LOCK:
+        if POOL is None or POOL.pid != os.getpid():
+            POOL = ConnectionPool(**settings)
+        return POOL
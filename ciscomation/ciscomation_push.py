@@ -0,0 +1,137 @@
+'''
+Configuration blocks pushed as a file instead of typed line by line. The file
+is uploaded on the SSH session already open, then merged into the running
+configuration with copy <file> running-config.
+'''
+import re
+from ciscomation.ciscomation_exc import CiscomationException
+
+TRANSFERS = ('scp', 'sftp')
+# file system receiving the pushed file and command removing it, by driver
+PUSH_TARGETS = {
+    'ios': {
+        'filesystem': 'flash:',
+        'delete': 'delete /force {}'
+    },
+    'nxos': {
+        'filesystem': 'bootflash:',
+        'delete': 'delete {} no-prompt'
+    }
+}
+PUSH_FILENAME = 'ciscomation-push.cfg'
+# IOS asks to confirm the destination of the copy
+COPY_CONFIRM_RE = re.compile(r'\[running-config\]\? ?$')
+
+
+def scp_ack(channel):
+    '''
+    Reads the answer of a SCP sink, raising CiscomationException on refusal.
+    '''
+    answer = channel.recv(1)
+    if answer == '\0':
+        return
+    message = answer
+    while not message.endswith('\n'):
+        data = channel.recv(1)
+        if not data:
+            break
+        message += data
+    raise CiscomationException(
+        'SCP transfer refused: {}'.format(
+            message[1:].strip() or 'connection closed'
+        )
+    )
+
+
+def scp_upload(transport, path, data, timeout=60):
+    '''
+    Writes data to path on the device, with scp -t on a new channel of the
+    paramiko transport.
+    '''
+    channel = transport.open_session()
+    try:
+        channel.settimeout(timeout)
+        channel.exec_command('scp -t {}'.format(path))
+        scp_ack(channel)
+        channel.sendall('C0644 {} {}\n'.format(len(data), PUSH_FILENAME))
+        scp_ack(channel)
+        channel.sendall(data)
+        channel.sendall('\0')
+        scp_ack(channel)
+        channel.shutdown_write()
+    finally:
+        channel.close()
+
+
+def sftp_upload(transport, path, data):
+    '''
+    Writes data to path on the device, with the SFTP subsystem of the
+    paramiko transport.
+    '''
+    import paramiko
+    sftp = paramiko.SFTPClient.from_transport(transport)
+    try:
+        remote = sftp.open(path, 'wb')
+        try:
+            remote.write(data)
+        finally:
+            remote.close()
+    finally:
+        sftp.close()
+
+
+def push_file(connection, lines, transfer='scp'):
+    '''
+    Uploads lines as a file and merges it into the running configuration.
+
+    Parameters
+    ----------
+    connection : Exscript.protocols.SSH2
+        connection waiting at the exec prompt, with an ios or nxos driver.
+
+    lines : list
+        configuration lines, as they would be typed in configuration mode.
+
+    transfer : str, optional
+        'scp' or 'sftp', the server the device runs.
+
+    Returns
+    -------
+    command, output, error: tuple
+        copy command run on the device, its output and None, or the answer
+        of the device when it matched an error prompt of the driver. The
+        lines before the failing one are merged anyway.
+    '''
+    from Exscript.protocols.Exception import InvalidCommandException
+    if transfer not in TRANSFERS:
+        raise CiscomationException('unknown transfer {}'.format(transfer))
+    target = PUSH_TARGETS[connection.get_driver().name]
+    path = target['filesystem'] + PUSH_FILENAME
+    data = ''.join(line + '\n' for line in lines)
+    if transfer == 'sftp':
+        sftp_upload(connection.client, path, data)
+    else:
+        scp_upload(connection.client, path, data)
+    command = 'copy {} running-config'.format(path)
+    connection.send(command + '\r')
+    index, match = connection.expect(
+        [COPY_CONFIRM_RE] + list(connection.get_prompt())
+    )
+    response = connection.response
+    if index == 0:
+        connection.send('\r')
+        connection.expect(connection.get_prompt())
+        response += connection.response
+    try:
+        connection.execute(target['delete'].format(path))
+    except InvalidCommandException:
+        # a file left behind is overwritten by the next push
+        pass
+    response = response.replace('\r', '')
+    error = None
+    error_prompts = connection.get_error_prompt()
+    for line in response.split('\n')[1:]:
+        if any(regex.search(line) for regex in error_prompts):
+            error = 'Device said:\n' + response
+            break
+    return command, '\n'.join(response.split('\n')[1:-1]), error
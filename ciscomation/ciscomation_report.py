@@ -0,0 +1,623 @@
+'''
+Results of a maintenance written host by host as they come back, one JSON
+document per line, and the reports built from that file in a single pass
+once the maintenance is over, see :func:`build_reports`.
+
+Command outputs are content addressed: an output is written once, on a blob
+line keyed by its sha1, and hosts refer to it as {'blob': key}. The same
+show command run on thousands of switches mostly costs one blob and a
+reference per switch. Outputs spilled to disk while the host ran, see
+:mod:`ciscomation_spill`, are kept as references to their file.
+'''
+import csv
+import hashlib
+import json
+from ciscomation.ciscomation_spill import is_spilled
+from ciscomation.ciscomation_spill import output_lines
+from ciscomation.ciscomation_timing import PERCENTILES
+from ciscomation.ciscomation_timing import PHASES
+from ciscomation.ciscomation_timing import percentiles
+
+LOG_LEVELS = ('debug', 'info', 'warning', 'error', 'critical')
+# key of the lines holding blobs, [key, output]
+BLOB_LINE = '__blob__'
+# outputs shorter than a reference are kept in place
+BLOB_MIN_SIZE = 64
+# fields of the results shown in the table of hosts, with the counters
+HOST_FIELDS = ('driver', 'version', 'status_ok', 'all_commands_ok', 'job',
+               'lines_sent', 'lines_skipped')
+TABLE_FORMATS = ('xlsx', 'csv')
+# columns of the table of commands, see CommandTable
+COMMAND_COLUMNS = (
+    ('host', 'job', 'seq', 'command', 'output_ref', 'output_bytes', 'ok',
+     'duration', 'status_ok') +
+    tuple('log_{}'.format(level) for level in LOG_LEVELS)
+)
+
+
+def blob_key(output):
+    '''
+    Returns the sha1 of a command output.
+    '''
+    if isinstance(output, unicode):
+        output = output.encode('utf-8')
+    return hashlib.sha1(output).hexdigest()
+
+
+def output_key(output):
+    '''
+    Returns the sha1 of an output, a string, a blob or a spilled output
+    reference, None for a failed command.
+    '''
+    if output is None:
+        return None
+    if is_spilled(output):
+        return output['sha1']
+    if isinstance(output, dict):
+        return output['blob']
+    return blob_key(output)
+
+
+def output_size(output):
+    '''
+    Returns the length of an output, a string or a spilled output reference,
+    None for a failed command.
+    '''
+    if output is None:
+        return None
+    if is_spilled(output):
+        return output['bytes']
+    return len(output)
+
+
+def command_entries(feedback):
+    '''
+    Yields the (seq, command, output) of the commands of a result, output
+    being None for a failed command.
+    '''
+    for seq, command in enumerate(feedback['commands']):
+        for cmd, output in command.items():
+            yield seq, cmd, output
+
+
+class CommandTable(object):
+    '''
+    Appends one CSV row per command of every host as the hosts are done,
+    see COMMAND_COLUMNS, a table read as is by csv, pandas or arrow. The
+    output is referred to by its sha1, the key of its blob in the results
+    file when written as a blob. duration comes from command_times, the
+    status and log counts of the host are repeated on its rows.
+
+    Parameters
+    ----------
+    filename : str
+        path of the table, appended to if it exists.
+    '''
+    def __init__(self, filename):
+        self.tablefile = open(filename, 'ab')
+        self.writer = csv.writer(self.tablefile)
+        if not self.tablefile.tell():
+            self.writer.writerow(COMMAND_COLUMNS)
+
+    def write(self, hostname, feedback, keys=None):
+        '''
+        Writes the rows of a host, keys being the sha1 of its outputs if
+        already known.
+        '''
+        levels = dict((level, 0) for level in LOG_LEVELS)
+        for thislog in feedback['logs']:
+            levels[thislog[0]] += 1
+        host_values = [feedback['status_ok']] + [
+            levels[level] for level in LOG_LEVELS
+        ]
+        times = feedback.get('command_times', [])
+        for seq, cmd, output in command_entries(feedback):
+            if keys is not None:
+                key = keys[seq]
+            else:
+                key = output_key(output)
+            row = [
+                hostname,
+                feedback.get('job'),
+                seq,
+                cmd,
+                key,
+                output_size(output),
+                output is not None,
+                times[seq] if seq < len(times) else None
+            ] + host_values
+            self.writer.writerow(
+                [
+                    '' if value is None else unicode(value).encode('utf-8')
+                    for value in row
+                ]
+            )
+        self.tablefile.flush()
+
+    def close(self):
+        self.tablefile.close()
+
+
+class ResultWriter(object):
+    '''
+    Appends results of run_commands to a JSON lines file. Every line is
+    flushed when written, a crash only loses the hosts in flight.
+
+    Parameters
+    ----------
+    filename : str
+        path of the results file, appended to if it exists.
+
+    blobs : bool, optional
+        if True (default) command outputs are written once as blobs and
+        referenced by the hosts.
+
+    tablefile : str, optional
+        path of a :class:`CommandTable` written along, the outputs being
+        hashed once for both.
+    '''
+    def __init__(self, filename, blobs=True, tablefile=None):
+        self.filename = filename
+        self.blobs = blobs
+        self.keys = set()
+        self.count = 0
+        self.resultfile = open(filename, 'ab')
+        self.table = None
+        if tablefile:
+            self.table = CommandTable(tablefile)
+
+    def _reference(self, output, key):
+        # a spilled output is already a reference
+        if output is None or is_spilled(output):
+            return output
+        if len(output) < BLOB_MIN_SIZE:
+            return output
+        if key not in self.keys:
+            self.resultfile.write(json.dumps({BLOB_LINE: [key, output]}))
+            self.resultfile.write('\n')
+            self.keys.add(key)
+        return {'blob': key}
+
+    def write(self, result):
+        if self.blobs or self.table is not None:
+            document = {}
+            for hostname, feedback in result.items():
+                keys = [
+                    output_key(output)
+                    for _, _, output in command_entries(feedback)
+                ]
+                if self.table is not None:
+                    self.table.write(hostname, feedback, keys)
+                if self.blobs:
+                    feedback = dict(
+                        feedback,
+                        commands=[
+                            {cmd: self._reference(output, keys[seq])}
+                            for seq, cmd, output in command_entries(feedback)
+                        ]
+                    )
+                document[hostname] = feedback
+            result = document
+        self.resultfile.write(json.dumps(result) + '\n')
+        self.resultfile.flush()
+        self.count += 1
+
+    def close(self):
+        self.resultfile.close()
+        if self.table is not None:
+            self.table.close()
+
+
+def iter_lines(filename):
+    '''
+    Yields the documents of a results file, skipping a last line cut by a
+    crash.
+    '''
+    with open(filename, 'rb') as resultfile:
+        for line in resultfile:
+            try:
+                yield json.loads(line)
+            except ValueError:
+                continue
+
+
+def iter_results(filename):
+    '''
+    Yields (hostname, feedback) pairs from a results file, blob references
+    being replaced by the outputs. Spilled outputs stay references, see
+    :func:`ciscomation_spill.output_lines`.
+    '''
+    blobs = {}
+    for document in iter_lines(filename):
+        if BLOB_LINE in document:
+            key, output = document[BLOB_LINE]
+            blobs[key] = output
+            continue
+        for hostname, feedback in document.items():
+            for command in feedback['commands']:
+                for cmd, output in command.items():
+                    if isinstance(output, dict) and 'blob' in output:
+                        command[cmd] = blobs[output['blob']]
+            yield hostname, feedback
+
+
+def resume_journal(filename, writer=None):
+    '''
+    Reads the results file of an interrupted maintenance and returns the
+    (job, hostname) of the switches done without error. Their results are
+    copied to writer, so the results file of the new run covers the whole
+    maintenance. Failed switches and the ones in flight when the run stopped
+    are left to run again.
+    '''
+    done = set()
+    for hostname, feedback in iter_results(filename):
+        if 'job' not in feedback or not feedback['status_ok']:
+            continue
+        if (feedback['job'], hostname) in done:
+            continue
+        done.add((feedback['job'], hostname))
+        if writer is not None:
+            writer.write({hostname: feedback})
+    return done
+
+
+class CmdReport(object):
+    '''
+    Writes the commands passed to every host and the console returns. An
+    output already written for another host is replaced by the name of that
+    host.
+    '''
+    indent = '    '
+
+    def __init__(self, cmdfile):
+        self.cmdresult = open(cmdfile, 'wb')
+        # host of the first occurrence of every blob
+        self.seen = {}
+
+    def add(self, hostname, feedback, blobs):
+        indent = self.indent
+        self.cmdresult.write(u'Host : {}\n'.format(hostname).encode('utf-8'))
+        for _, cmd, output in command_entries(feedback):
+            self.cmdresult.write(
+                u'{}CMD: {}\n'.format(indent, cmd).encode('utf-8')
+            )
+            if isinstance(output, dict):
+                key = output_key(output)
+                if key in self.seen:
+                    self.cmdresult.write(
+                        u'{}= same output as {}\n'.format(
+                            indent*2,
+                            self.seen[key]
+                        ).encode('utf-8')
+                    )
+                    continue
+                self.seen[key] = hostname
+                if not is_spilled(output):
+                    output = blobs.pop(key)
+            if output:
+                for line in output_lines(output):
+                    self.cmdresult.write(
+                        u'{}{}\n'.format(indent*2, line).encode('utf-8')
+                    )
+
+    def close(self):
+        self.cmdresult.close()
+
+
+class SummaryReport(object):
+    '''
+    Writes, for every command, the hosts grouped by identical output, the
+    most common output first. Hosts of the other groups are listed, which
+    shows the outliers.
+    '''
+    def __init__(self, summaryfile):
+        self.summaryfile = summaryfile
+        self.groups = {}
+
+    def add(self, hostname, feedback, blobs):
+        for _, cmd, output in command_entries(feedback):
+            key = output_key(output)
+            self.groups.setdefault(cmd, {}).setdefault(key, []).append(
+                hostname
+            )
+
+    def close(self):
+        indent = '    '
+        with open(self.summaryfile, 'wb') as summary:
+            for cmd in sorted(self.groups):
+                summary.write(u'CMD: {}\n'.format(cmd).encode('utf-8'))
+                outputs = sorted(
+                    self.groups[cmd].items(),
+                    key=lambda item: len(item[1]),
+                    reverse=True
+                )
+                for rank, (key, hostnames) in enumerate(outputs):
+                    if key is None:
+                        label = 'failed'
+                    else:
+                        label = 'with output {}, as on {}'.format(
+                            key[:12], hostnames[0]
+                        )
+                    summary.write(
+                        u'{}{} hosts {}\n'.format(
+                            indent, len(hostnames), label
+                        ).encode('utf-8')
+                    )
+                    if rank or key is None:
+                        summary.write(
+                            u'{}{}\n'.format(
+                                indent*2, ', '.join(sorted(hostnames))
+                            ).encode('utf-8')
+                        )
+
+
+class TimingStats(object):
+    '''
+    Collects the durations of every phase and of every command text, see
+    :mod:`ciscomation_timing`.
+    '''
+    def __init__(self):
+        self.phases = {}
+        self.commands = {}
+
+    def add(self, hostname, feedback, blobs):
+        for phase, seconds in feedback.get('timings', {}).items():
+            self.phases.setdefault(phase, []).append(seconds)
+        for (_, cmd, _), seconds in zip(
+            command_entries(feedback), feedback.get('command_times', [])
+        ):
+            self.commands.setdefault(cmd, []).append(seconds)
+
+    def rows(self):
+        '''
+        Returns (kind, name, count, percentiles..., max) for every phase and
+        then every command text.
+        '''
+        rows = []
+        for kind, times, names in (
+            (
+                'phase',
+                self.phases,
+                [phase for phase in PHASES if phase in self.phases]
+            ),
+            ('command', self.commands, sorted(self.commands))
+        ):
+            for name in names:
+                rows.append(
+                    tuple([kind, name, len(times[name])]) +
+                    tuple(percentiles(times[name])) +
+                    (max(times[name]),)
+                )
+        return rows
+
+    def close(self):
+        pass
+
+
+class TimingReport(object):
+    '''
+    Writes the percentiles of the duration of every phase of the sessions
+    and of every command text, across the hosts.
+    '''
+    def __init__(self, timingfile, stats):
+        self.timingfile = timingfile
+        self.stats = stats
+
+    def add(self, hostname, feedback, blobs):
+        pass
+
+    def close(self):
+        header = ['count'] + [
+            'p{}'.format(rank) for rank in PERCENTILES
+        ] + ['max']
+        line = u'{:>7}' + u' {:>9}' * (len(header) - 1) + u'  {}\n'
+        with open(self.timingfile, 'wb') as timings:
+            kind = None
+            for row in self.stats.rows():
+                if row[0] != kind:
+                    kind = row[0]
+                    timings.write(
+                        line.format(
+                            *(header + [kind.upper()])
+                        ).encode('utf-8')
+                    )
+                values = [row[2]] + [
+                    '{:.4f}'.format(value) for value in row[3:]
+                ]
+                timings.write(
+                    line.format(*(values + [row[1]])).encode('utf-8')
+                )
+
+
+def host_columns():
+    '''
+    Returns the columns of the table of hosts, in their order.
+    '''
+    return sorted(
+        list(HOST_FIELDS) + ['commands'] +
+        ['log_{}'.format(level) for level in LOG_LEVELS] +
+        ['time_{}'.format(phase) for phase in PHASES]
+    )
+
+
+def host_row(feedback):
+    '''
+    Returns the row of a host in the table of hosts, the fields of its
+    result with the number of commands, of logs by level and the phase
+    durations. Outputs are not copied.
+    '''
+    row = dict((field, feedback.get(field)) for field in HOST_FIELDS)
+    row['commands'] = len(feedback['commands'])
+    for level in LOG_LEVELS:
+        row['log_{}'.format(level)] = 0
+    for thislog in feedback['logs']:
+        row['log_{}'.format(thislog[0])] += 1
+    for phase in PHASES:
+        row['time_{}'.format(phase)] = feedback.get('timings', {}).get(phase)
+    return row
+
+
+class HostTable(object):
+    '''
+    Writes the table of hosts successes, failures, log statistics and phase
+    durations, one row per host as they are read.
+
+    Parameters
+    ----------
+    tablefile : str
+        path of the table.
+
+    stats : TimingStats, optional
+        timing statistics written on the timings sheet of an xlsx table.
+
+    table_format : str, optional
+        'xlsx' (default) or 'csv'.
+
+    constant_memory : bool, optional
+        if True the xlsx rows are streamed to a temporary file instead of
+        being kept until the end, at the cost of openpyxl write only mode
+        limits (no cell read back, sheets written in one go).
+    '''
+    def __init__(self, tablefile, stats=None, table_format='xlsx',
+                 constant_memory=False):
+        self.tablefile = tablefile
+        self.stats = stats
+        self.table_format = table_format
+        self.columns = host_columns()
+        if table_format == 'csv':
+            self.table = open(tablefile, 'wb')
+            self.writer = csv.writer(self.table)
+            self.writer.writerow([''] + self.columns)
+            return
+        from openpyxl import Workbook
+        self.workbook = Workbook(write_only=constant_memory)
+        if constant_memory:
+            self.sheet = self.workbook.create_sheet('hosts')
+        else:
+            self.sheet = self.workbook.active
+            self.sheet.title = 'hosts'
+        self.sheet.append([''] + self.columns)
+
+    def add(self, hostname, feedback, blobs):
+        row = host_row(feedback)
+        if self.table_format == 'csv':
+            self.writer.writerow(
+                [hostname.encode('utf-8')] + [
+                    '' if row[column] is None
+                    else unicode(row[column]).encode('utf-8')
+                    for column in self.columns
+                ]
+            )
+            return
+        self.sheet.append(
+            [hostname] + [row[column] for column in self.columns]
+        )
+
+    def close(self):
+        if self.table_format == 'csv':
+            self.table.close()
+            return
+        if self.stats is not None:
+            timings = self.workbook.create_sheet('timings')
+            timings.append(
+                ['kind', 'name', 'count'] + [
+                    'p{}'.format(rank) for rank in PERCENTILES
+                ] + ['max']
+            )
+            for row in self.stats.rows():
+                timings.append(list(row))
+        self.workbook.save(self.tablefile)
+
+
+class ParsedTables(object):
+    '''
+    Writes the rows parsed on every host, see :mod:`ciscomation_parse`, as
+    one CSV table per template with the host and command columns first.
+
+    Parameters
+    ----------
+    parsedfile : str
+        path of the tables, {} being replaced by the template name.
+    '''
+    def __init__(self, parsedfile):
+        self.parsedfile = parsedfile
+        # template -> (file, csv writer)
+        self.tables = {}
+
+    def _writer(self, parsed):
+        if parsed['template'] not in self.tables:
+            table = open(self.parsedfile.format(parsed['template']), 'wb')
+            writer = csv.writer(table)
+            writer.writerow(['host', 'command'] + parsed['columns'])
+            self.tables[parsed['template']] = (table, writer)
+        return self.tables[parsed['template']][1]
+
+    def add(self, hostname, feedback, blobs):
+        for parsed in feedback.get('parsed', ()):
+            writer = self._writer(parsed)
+            prefix = [hostname, parsed['command']]
+            for row in parsed['rows']:
+                writer.writerow(
+                    [unicode(value).encode('utf-8') for value in prefix + row]
+                )
+
+    def close(self):
+        for table, _ in self.tables.values():
+            table.close()
+
+
+def build_reports(filename, cmdfile=None, summaryfile=None, timingfile=None,
+                  tablefile=None, table_format='xlsx', constant_memory=False,
+                  parsedfile=None):
+    '''
+    Builds the reports asked for from a results file in a single pass. Only
+    counters, output keys and durations are kept for the whole maintenance,
+    an output is held from its blob line until the first host using it is
+    written to cmdfile.
+
+    Parameters
+    ----------
+    filename : str
+        results file, see :class:`ResultWriter`.
+
+    cmdfile, summaryfile, timingfile, tablefile, parsedfile : str, optional
+        paths of the reports to write, see :class:`CmdReport`,
+        :class:`SummaryReport`, :class:`TimingReport`, :class:`HostTable`
+        and :class:`ParsedTables`.
+
+    table_format, constant_memory : optional
+        see :class:`HostTable`.
+    '''
+    stats = TimingStats()
+    reports = [stats]
+    if cmdfile:
+        reports.append(CmdReport(cmdfile))
+    if summaryfile:
+        reports.append(SummaryReport(summaryfile))
+    if timingfile:
+        reports.append(TimingReport(timingfile, stats))
+    if parsedfile:
+        reports.append(ParsedTables(parsedfile))
+    if tablefile:
+        reports.append(
+            HostTable(
+                tablefile,
+                stats=stats,
+                table_format=table_format,
+                constant_memory=constant_memory
+            )
+        )
+    blobs = {}
+    try:
+        for document in iter_lines(filename):
+            if BLOB_LINE in document:
+                if cmdfile:
+                    key, output = document[BLOB_LINE]
+                    blobs[key] = output
+                continue
+            for hostname, feedback in document.items():
+                for report in reports:
+                    report.add(hostname, feedback, blobs)
+    finally:
+        for report in reports:
+            report.close()
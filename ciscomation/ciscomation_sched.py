@@ -0,0 +1,271 @@
+'''
+Canary waves and failure rate breaker deciding when the engines may start
+the next host, and caps of the hosts in flight per group deciding which one.
+'''
+import collections
+import logging
+import re
+import threading
+from ciscomation.ciscomation_exc import CiscomationException
+
+FAILURE_FIELDS = ('status_ok', 'all_commands_ok')
+# group limit applying to the groups without their own
+DEFAULT_GROUP = '*'
+# jobs held back while their group is full, the next ones wait to be read
+HOLD_MAX = 10000
+
+
+class WaveGate(object):
+    '''
+    Hosts go by waves: canary hosts first, then waves growth times bigger
+    than the previous one, a wave starting once the previous one is over.
+    The breaker stops starting hosts as soon as more than max_failure_rate of
+    the finished hosts failed, the hosts in flight being left to finish.
+
+    The engines call can_start before taking a host, start when they do,
+    and record with its result.
+
+    Parameters
+    ----------
+    canary : int, optional
+        size of the first wave, 0 disables the waves.
+
+    growth : int, optional
+        size ratio between a wave and the previous one.
+
+    max_failure_rate : float, optional
+        failure rate, between 0 and 1, above which no new host is started.
+        None disables the breaker.
+
+    min_finished : int, optional
+        number of finished hosts before the failure rate is checked.
+
+    failure_on : str, optional
+        field of the results telling a host failed when False, 'status_ok'
+        or 'all_commands_ok'.
+    '''
+    def __init__(self, canary=0, growth=2, max_failure_rate=None,
+                 min_finished=1, failure_on='status_ok'):
+        self.growth = max(growth, 1)
+        self.max_failure_rate = max_failure_rate
+        self.min_finished = max(min_finished, 1)
+        self.failure_on = failure_on
+        self.condition = threading.Condition()
+        self.started = 0
+        self.finished = 0
+        self.failed = 0
+        self.tripped = False
+        self.wave = 1
+        self.wave_size = canary
+        # number of started hosts closing the current wave
+        self.wave_end = canary or None
+
+    def _waiting(self):
+        return self.wave_end is not None and self.started >= self.wave_end
+
+    def can_start(self):
+        '''
+        Returns True if a host may start now.
+        '''
+        with self.condition:
+            return not self.tripped and not self._waiting()
+
+    def wait(self, timeout=None):
+        '''
+        Waits up to timeout seconds for the current wave to end, then returns
+        can_start.
+        '''
+        with self.condition:
+            if not self.tripped and self._waiting():
+                self.condition.wait(timeout)
+            return not self.tripped and not self._waiting()
+
+    def start(self):
+        with self.condition:
+            self.started += 1
+
+    def record(self, result):
+        '''
+        Counts a finished host, result being what run_commands returned or
+        None if it crashed.
+        '''
+        logger = logging.getLogger()
+        with self.condition:
+            self.finished += 1
+            if result is None or not all(
+                feedback.get(self.failure_on, False)
+                for feedback in result.values()
+            ):
+                self.failed += 1
+            rate = float(self.failed) / self.finished
+            if (self.max_failure_rate is not None and not self.tripped and
+                    self.finished >= self.min_finished and
+                    rate > self.max_failure_rate):
+                self.tripped = True
+                logger.critical(
+                    (
+                        'Breaker tripped, {} of {} finished hosts failed, no '
+                        'new host is started.'
+                    ).format(self.failed, self.finished)
+                )
+            if self.wave_end is not None and self.finished >= self.wave_end:
+                logger.info(
+                    'Wave {} of {} hosts done, {} of {} hosts failed.'.format(
+                        self.wave,
+                        self.wave_size,
+                        self.failed,
+                        self.finished
+                    )
+                )
+                self.wave += 1
+                self.wave_size *= self.growth
+                self.wave_end += self.wave_size
+            self.condition.notify_all()
+
+
+def parse_group_limits(values):
+    '''
+    Returns the group -> cap dict of GROUP=N strings, see GroupLimits.
+    '''
+    caps = {}
+    for value in values or ():
+        group, _, cap = value.rpartition('=')
+        try:
+            cap = int(cap)
+        except ValueError:
+            cap = 0
+        if not group or cap < 1:
+            raise CiscomationException(
+                'invalid group limit {}, expected GROUP=N with N > 0'.format(
+                    value
+                )
+            )
+        caps[group] = cap
+    return caps
+
+
+class GroupLimits(object):
+    '''
+    Caps the hosts in flight per group, such as the switches of a site
+    behind a small WAN link. Jobs whose group is full are held back and the
+    next ones are taken, so the capacity left goes to the other groups. The
+    held jobs start in their order as soon as their group has room.
+
+    The group of a job is its 'group' key, set from the group attribute of
+    the <switch> element, else the name matched by pattern in its host name,
+    the first argument of the job. Hosts without group are not capped.
+
+    The engines call take to get the next job and done with the host name
+    of every finished one.
+
+    Parameters
+    ----------
+    caps : dict
+        group -> maximum hosts in flight, the DEFAULT_GROUP key applying to
+        the groups not listed.
+
+    pattern : str, optional
+        regular expression searched in the host names, its first group, or
+        the whole match, names the group of the host.
+    '''
+    def __init__(self, caps, pattern=None):
+        self.caps = dict(caps)
+        self.pattern = re.compile(pattern) if pattern else None
+        self.condition = threading.Condition()
+        self.running = {}
+        # host name -> groups of its jobs in flight
+        self.hosts = {}
+        # group -> deque of (position, job) held back
+        self.held = {}
+        self.held_count = 0
+        self.position = 0
+        self.exhausted = False
+        # set when take found nothing to start, until a job is done
+        self.stalled = False
+
+    def group_of(self, job):
+        if job.get('group'):
+            return job['group']
+        if self.pattern is None:
+            return None
+        match = self.pattern.search(job['args'][0])
+        if match is None:
+            return None
+        return match.group(1) if match.groups() else match.group(0)
+
+    def _cap(self, group):
+        if group is None:
+            return None
+        return self.caps.get(group, self.caps.get(DEFAULT_GROUP))
+
+    def _has_room(self, group):
+        cap = self._cap(group)
+        return cap is None or self.running.get(group, 0) < cap
+
+    def _start(self, group, job):
+        self.running[group] = self.running.get(group, 0) + 1
+        self.hosts.setdefault(job['args'][0], []).append(group)
+        return job
+
+    def take(self, jobs):
+        '''
+        Returns the first job of the held ones, then of the jobs iterator,
+        whose group has room, counting it in flight. Returns None if none can
+        start before a job is done, raises StopIteration when no job is left.
+        At most HOLD_MAX jobs are held, the next ones are not read meanwhile.
+        '''
+        with self.condition:
+            first = None
+            for group, queue in self.held.items():
+                if self._has_room(group) and (
+                    first is None or queue[0][0] < self.held[first][0][0]
+                ):
+                    first = group
+            if first is not None:
+                job = self.held[first].popleft()[1]
+                if not self.held[first]:
+                    del self.held[first]
+                self.held_count -= 1
+                return self._start(first, job)
+            while not self.exhausted and self.held_count < HOLD_MAX:
+                try:
+                    job = next(jobs)
+                except StopIteration:
+                    self.exhausted = True
+                    break
+                group = self.group_of(job)
+                if self._has_room(group):
+                    return self._start(group, job)
+                self.held.setdefault(group, collections.deque()).append(
+                    (self.position, job)
+                )
+                self.position += 1
+                self.held_count += 1
+            if self.exhausted and not self.held_count:
+                raise StopIteration
+            self.stalled = True
+            return None
+
+    def done(self, hostname):
+        '''
+        Frees the place of a finished job of hostname.
+        '''
+        with self.condition:
+            groups = self.hosts.get(hostname)
+            if not groups:
+                return
+            group = groups.pop(0)
+            if not groups:
+                del self.hosts[hostname]
+            self.running[group] -= 1
+            self.stalled = False
+            self.condition.notify_all()
+
+    def wait(self, timeout=None):
+        '''
+        Waits up to timeout seconds for a job to be done, if none was since
+        take last returned None.
+        '''
+        with self.condition:
+            if self.stalled:
+                self.condition.wait(timeout)
@@ -0,0 +1,130 @@
+'''
+Command outputs larger than a threshold are written to a file of their host
+as soon as read, the result only carrying a reference to them:
+
+    {'file': path, 'offset': 0, 'bytes': 52428800, 'sha1': key}
+
+A show tech of tens of megabytes then costs memory in the process running
+the host only while it is read, not in the results queue, the parent or the
+reports, which read it back through mmap, see :func:`output_lines`.
+'''
+import hashlib
+import mmap
+import os
+import re
+
+# outputs larger than that are spilled by default, in bytes
+SPILL_THRESHOLD = 4 * 1024 * 1024
+# characters not kept in the name of a spill file
+UNSAFE_RE = re.compile(r'[^\w.-]')
+
+
+def trim_response(response):
+    '''
+    Returns the output of a command from the response of the device, without
+    the echo of the command on the first line and the prompt on the last
+    one. Same as joining the lines of the response split on newlines minus
+    the first and last ones, without copying every line.
+    '''
+    start = response.find('\n') + 1
+    end = response.rfind('\n')
+    if end < start:
+        return ''
+    return response[start:end].replace('\r', '')
+
+
+def is_spilled(output):
+    '''
+    Returns True if output is a reference to a spilled output.
+    '''
+    return isinstance(output, dict) and 'file' in output
+
+
+class OutputSpill(object):
+    '''
+    Spills the outputs of a host larger than threshold to a file of
+    directory, appended to so a host keeps one file per run.
+
+    Parameters
+    ----------
+    host : str
+        switch the outputs come from.
+
+    directory : str, optional
+        directory of the spill files, created when first needed. None keeps
+        every output in memory.
+
+    threshold : int, optional
+        outputs larger than that many bytes are spilled, 0 keeps every
+        output in memory.
+
+    job : int, optional
+        index of the switch in the maintenance, in the file name so two
+        jobs of the same switch do not share a file.
+    '''
+    def __init__(self, host, directory=None, threshold=SPILL_THRESHOLD,
+                 job=None):
+        self.enabled = bool(directory and threshold)
+        self.threshold = threshold
+        name = UNSAFE_RE.sub('_', host)
+        if job is not None:
+            name = '{}_{}'.format(name, job)
+        self.filename = None
+        if self.enabled:
+            self.filename = os.path.join(directory, name + '.txt')
+
+    def keep(self, output):
+        '''
+        Returns output, or a reference to it once written when it is larger
+        than the threshold.
+        '''
+        if not self.enabled or len(output) <= self.threshold:
+            return output
+        if isinstance(output, unicode):
+            output = output.encode('utf-8')
+        directory = os.path.dirname(self.filename)
+        if directory and not os.path.isdir(directory):
+            try:
+                os.makedirs(directory)
+            except OSError:
+                # created meanwhile by another process
+                if not os.path.isdir(directory):
+                    raise
+        with open(self.filename, 'ab') as spillfile:
+            spillfile.seek(0, os.SEEK_END)
+            offset = spillfile.tell()
+            spillfile.write(output)
+        return {
+            'file': os.path.abspath(self.filename),
+            'offset': offset,
+            'bytes': len(output),
+            # same key as ciscomation_report.blob_key
+            'sha1': hashlib.sha1(output).hexdigest()
+        }
+
+
+def output_lines(output):
+    '''
+    Returns an iterable of the lines of an output, a string or a spilled
+    output reference, the latter read line by line through mmap and decoded
+    from utf-8.
+    '''
+    if not is_spilled(output):
+        return output.splitlines()
+    return _spilled_lines(output)
+
+
+def _spilled_lines(reference):
+    with open(reference['file'], 'rb') as spillfile:
+        mapped = mmap.mmap(spillfile.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            mapped.seek(reference['offset'])
+            end = reference['offset'] + reference['bytes']
+            while mapped.tell() < end:
+                start = mapped.tell()
+                line = mapped.readline()
+                if start + len(line) > end:
+                    line = line[:end - start]
+                yield line.rstrip('\n').decode('utf-8', 'replace')
+        finally:
+            mapped.close()
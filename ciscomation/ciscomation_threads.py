@@ -0,0 +1,199 @@
+'''
+Thread pool engine, and the thread safe Ctrl-C handling shared by the engines
+running sessions inside the current process.
+'''
+import logging
+import os
+import signal
+import threading
+import traceback
+from concurrent.futures import FIRST_COMPLETED
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import wait
+from ciscomation.ciscomation_exc import CiscomationException
+from ciscomation.ciscomation_mp import PREFETCH
+
+# set on Ctrl-C, no new host is started and sleeping sessions wake up
+CANCEL = threading.Event()
+# returned by guarded for a job not run
+DROPPED = object()
+
+
+def thread_killer(signum, frame):
+    '''
+    Thread safe counterpart of killer. The first interruption stops starting
+    new hosts and lets the sessions in flight finish, the second one ends
+    the process at once.
+    '''
+    if CANCEL.is_set():
+        print('Brutal Ending !!')
+        os._exit(1)
+    print('\n\n-----> Request to shutdown received.\n\n')
+    print('Waiting for sessions in flight, Ctrl-C again to force.')
+    CANCEL.set()
+
+
+def install_killer():
+    '''
+    Installs thread_killer for SIGINT and returns the previous handler, or
+    None when not called from the main thread, where signals cannot be
+    handled.
+    '''
+    CANCEL.clear()
+    if threading.current_thread().name != 'MainThread':
+        return None
+    return signal.signal(signal.SIGINT, thread_killer)
+
+
+def cancellable_sleep(seconds):
+    '''
+    Sleep used for --sleep-xx keywords by the in process engines. Only the
+    calling session waits, and it returns early on Ctrl-C.
+    '''
+    CANCEL.wait(seconds)
+
+
+def guarded(gate, func, args, kwargs):
+    '''
+    Runs func unless Ctrl-C was hit or the breaker of gate tripped since the
+    job was submitted, returning DROPPED then. A job waiting in the pool
+    may start before the jobs not started yet are cancelled. The result, or
+    None when func raised, is counted by gate before the thread takes the
+    next job.
+    '''
+    if CANCEL.is_set() or gate is not None and gate.tripped:
+        return DROPPED
+    if gate is None:
+        return func(*args, **kwargs)
+    data = None
+    try:
+        data = func(*args, **kwargs)
+    finally:
+        gate.record(data)
+    return data
+
+
+def thread_manager(func, args_list, threads_count=4, pbar=None,
+                   on_result=None, gate=None, limits=None):
+    '''
+    Runs func for every job of args_list in a pool of threads_count threads.
+
+    Jobs are submitted as threads free up, at most PREFETCH per thread
+    waiting, so a Ctrl-C only has to let the running ones finish.
+
+    Parameters
+    ----------
+    func : callable
+        function run for every job, usually run_commands.
+
+    args_list : iterable
+        dicts with 'args' and 'kwargs' keys, one per job.
+
+    threads_count : int
+        number of threads in the pool.
+
+    pbar : progressbar.ProgressBar, optional
+        updated each time a result comes back.
+
+    on_result : callable, optional
+        called with each result as it comes back, results are then not
+        kept and an empty list is returned.
+
+    gate : ciscomation_sched.WaveGate, optional
+        decides when the next job may start. Once its breaker tripped, the
+        jobs not started yet are cancelled and the running ones finish.
+
+    limits : ciscomation_sched.GroupLimits, optional
+        caps the hosts in flight per group, the jobs submitted to the pool
+        count as in flight.
+
+    Returns
+    -------
+    result: list
+        results of func, in completion order.
+    '''
+    logger = logging.getLogger()
+    if threads_count < 1:
+        raise CiscomationException('threads_count parameter cannot be null')
+    previous_handler = install_killer()
+    executor = ThreadPoolExecutor(max_workers=threads_count)
+    logger.debug('Started pool of %d Threads' % threads_count)
+    jobs = iter(args_list)
+    feeding = True
+    pending = set()
+    # host name of every submitted job
+    hosts = {}
+    result = []
+    received = 0
+    try:
+        while True:
+            while (feeding and not CANCEL.is_set() and
+                   len(pending) < threads_count * PREFETCH):
+                if gate is not None and not gate.can_start():
+                    break
+                try:
+                    if limits is None:
+                        args_data = next(jobs)
+                    else:
+                        args_data = limits.take(jobs)
+                except StopIteration:
+                    feeding = False
+                    break
+                if args_data is None:
+                    # the jobs left wait for room in their group
+                    break
+                if gate is not None:
+                    gate.start()
+                future = executor.submit(
+                    guarded, gate, func, args_data['args'],
+                    args_data['kwargs']
+                )
+                hosts[future] = args_data['args'][0]
+                pending.add(future)
+            if not pending:
+                break
+            if CANCEL.is_set() or gate is not None and gate.tripped:
+                # only the jobs not started yet can be cancelled
+                [future.cancel() for future in pending]
+            # a timeout keeps the wait interruptible by Ctrl-C
+            done, pending = wait(
+                pending, timeout=1, return_when=FIRST_COMPLETED
+            )
+            for future in done:
+                hostname = hosts.pop(future)
+                if limits is not None:
+                    limits.done(hostname)
+                if future.cancelled():
+                    continue
+                if future.exception() is not None:
+                    logger.critical(
+                        'Thread crashed:\n{}'.format(
+                            ''.join(traceback.format_exception_only(
+                                type(future.exception()), future.exception()
+                            ))
+                        )
+                    )
+                    continue
+                data = future.result()
+                if data is DROPPED:
+                    continue
+                received += 1
+                if on_result is None:
+                    result.append(data)
+                else:
+                    on_result(data)
+                if pbar:
+                    pbar.update(received)
+                if 'logs' in data[data.keys()[0]]:
+                    for log in data[data.keys()[0]]['logs']:
+                        logger.log(
+                            logging.getLevelName(log[0].upper()), log[1]
+                        )
+    finally:
+        executor.shutdown(wait=True)
+        if previous_handler is not None:
+            signal.signal(signal.SIGINT, previous_handler)
+    if CANCEL.is_set():
+        logger.warning('Interrupted, hosts not started yet were skipped.')
+    logger.debug('Thread pool done')
+    return result
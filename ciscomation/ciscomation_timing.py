@@ -0,0 +1,56 @@
+'''
+Durations of the phases of a session and of every command, kept in the
+results as 'timings' and 'command_times', and their percentiles across the
+maintenance.
+'''
+import time
+
+try:
+    from time import monotonic as clock
+except ImportError:
+    # python 2 has no monotonic clock, a wall clock step only skews the
+    # timings taken at that moment
+    clock = time.time
+
+# phases of a session, in the order they run
+PHASES = ('dns', 'connect', 'login_wait', 'login', 'driver', 'diff',
+          'commands')
+PERCENTILES = (50, 95, 99)
+
+
+def elapsed(started):
+    '''
+    Returns the seconds since started, a clock value, rounded to 0.1 ms.
+    '''
+    return round(clock() - started, 4)
+
+
+class CommandTimer(object):
+    '''
+    Fills feedback['command_times'] along feedback['commands']: at each lap
+    the commands recorded since the previous lap share the time elapsed, so
+    the commands of a pipeline window get an even part of it.
+    '''
+    def __init__(self, feedback):
+        self.feedback = feedback
+        feedback.setdefault('command_times', [])
+        self.mark = clock()
+
+    def lap(self):
+        now = clock()
+        times = self.feedback['command_times']
+        new = len(self.feedback['commands']) - len(times)
+        if new > 0:
+            times.extend([round((now - self.mark) / new, 4)] * new)
+        self.mark = now
+
+
+def percentiles(values, ranks=PERCENTILES):
+    '''
+    Returns the nearest rank percentiles of values, in the order of ranks.
+    '''
+    values = sorted(values)
+    return [
+        values[max(-(-rank * len(values) // 100) - 1, 0)]
+        for rank in ranks
+    ]
@@ -1,6 +1,7 @@
 import logging
 import socket
 import xml.etree.ElementTree as ET
+from concurrent.futures import ThreadPoolExecutor
 from xml.etree.ElementTree import ParseError
 from ciscomation.ciscomation_exc import CiscomationException
 
@@ -38,6 +39,45 @@ KEYWORDS = {
     '--ignore-error': {
         'mp_compat': True,
         'descr': 'Will ignore any error generated by following command.'
+    },
+    '--pipeline-start': {
+        'mp_compat': True,
+        'descr': (
+            'sends the following commands without waiting for the prompt '
+            'between them, then splits the answers by prompt. For show '
+            'commands only, as they must not change the prompt. You have to '
+            'use --pipeline-stop if you are using --pipeline-start.'
+        )
+    },
+    '--pipeline-stop': {
+        'mp_compat': True,
+        'descr': (
+            'stops --pipeline-start mode and waits for the answers of the '
+            'commands still in flight.'
+        )
+    },
+    '--file-push-start': {
+        'mp_compat': True,
+        'descr': (
+            'following lines are configuration lines uploaded as a file and '
+            'merged with copy <file> running-config, instead of being typed '
+            'one by one. You have to use --file-push-stop if you are using '
+            '--file-push-start.'
+        )
+    },
+    '--parse': {
+        'mp_compat': True,
+        'descr': (
+            'parses the output of the next command with the template whose '
+            'path follows, the rows go to a parsed_<template> table.'
+        )
+    },
+    '--file-push-stop': {
+        'mp_compat': True,
+        'descr': (
+            'stops --file-push-start mode, uploads the buffered lines with '
+            'SCP or SFTP and applies them.'
+        )
     }
 }
 
@@ -53,6 +93,8 @@ def check_mp_commands(commands):
         if cln_cmd.startswith('--'):
             if cln_cmd.startswith('--sleep-'):
                 cln_cmd = cln_cmd[0:8]
+            elif cln_cmd.startswith('--parse '):
+                cln_cmd = '--parse'
             try:
                 mp_compat = mp_compat and KEYWORDS[cln_cmd]['mp_compat']
             except KeyError as e:
@@ -71,12 +113,240 @@ def hostname_resolves(hostname):
         return (False, None)
 
 
-def xml_to_maintenance(filname):
+def resolve_hosts(hostnames, workers=16, cache=None):
+    '''
+    Resolves hostnames with up to workers lookups in flight.
+
+    Parameters
+    ----------
+    hostnames : list
+        names to resolve, duplicates are resolved once.
+
+    workers : int
+        maximum number of concurrent lookups.
+
+    cache : ciscomation_cache.TTLCache, optional
+        names found there are not looked up, successful lookups are stored
+        there. Saving it is left to the caller, besides the saves made by
+        the cache itself every SAVE_EVERY changes.
+
+    Returns
+    -------
+    resolved: dict
+        hostname -> (valid_host, ip) as returned by hostname_resolves.
+    '''
+    logger = logging.getLogger()
+    resolved = {}
+    lookups = []
+    # same names as lookups, for the membership tests
+    pending = set()
+    for hostname in hostnames:
+        if hostname in resolved or hostname in pending:
+            continue
+        ip = cache.get(hostname) if cache else None
+        if ip:
+            resolved[hostname] = (True, ip)
+        else:
+            lookups.append(hostname)
+            pending.add(hostname)
+    logger.debug(
+        '{} hosts found in dns cache, {} to resolve'.format(
+            len(resolved), len(lookups)
+        )
+    )
+    if not lookups:
+        return resolved
+    executor = ThreadPoolExecutor(
+        max_workers=max(1, min(workers, len(lookups)))
+    )
+    try:
+        answers = executor.map(hostname_resolves, lookups)
+        for hostname, answer in zip(lookups, answers):
+            resolved[hostname] = answer
+            if cache and answer[0]:
+                cache.set(hostname, answer[1])
+    finally:
+        executor.shutdown(wait=True)
+    return resolved
+
+
+def read_switch(child):
+    '''
+    Reads a <switch> element.
+
+    Returns
+    -------
+    switch, mp_compat: tuple
+        the action dict, with the ip given in the xml and the group
+        attribute of the element if any, and whether its commands are
+        compatible with multi processing.
+    '''
+    logger = logging.getLogger()
+    commands = ''
+    pause = False
+    ip = None
+    mp_compat = True
+    for prop in child:
+        if prop.tag == 'name':
+            name = prop.text
+        elif prop.tag == 'ip':
+            ip = prop.text.strip()
+        elif prop.tag == 'commands':
+            commands = [li for li in prop.text.splitlines()]
+            if not commands[0].strip():
+                commands = commands[1:]
+                logger.debug(
+                    "{} First command was empty.".format(name)
+                )
+            mp_compat = mp_compat and check_mp_commands(commands)
+        elif prop == 'pause':
+            pause = True
+            mp_compat = False
+    switch = {
+        'swname': name,
+        'ip': ip,
+        'commands': commands,
+        'pause': pause,
+        'group': child.get('group')
+    }
+    return (switch, mp_compat)
+
+
+def resolve_switches(switches, dns_workers=16, dns_cache=None,
+                     trust_ip=False):
+    '''
+    Resolves the names of switches, see resolve_hosts, and returns them with
+    their ip set. Switches that did not resolve are kept, marked unresolved,
+    to be reported as failed hosts, see :func:`ciscomate.run_commands`.
+    '''
+    logger = logging.getLogger()
+    resolved = resolve_hosts(
+        [
+            switch['swname'] for switch in switches
+            if not (trust_ip and switch['ip'])
+        ],
+        workers=dns_workers,
+        cache=dns_cache
+    )
+    actions = []
+    for switch in switches:
+        if not (trust_ip and switch['ip']):
+            valid_host, switch['ip'] = resolved[switch['swname']]
+            if not valid_host:
+                logger.critical(
+                    'Could not resolve {}. It will be failed.'.format(
+                        switch['swname']
+                    )
+                )
+                switch['unresolved'] = True
+        actions.append(switch)
+        logger.info(
+            'Maintenance now includes host {}'.format(switch['swname'])
+        )
+    return actions
+
+
+def iter_switch_elements(filname):
+    '''
+    Yields the <switch> elements of a maintenance file as they are parsed,
+    and frees each of them once processed, so memory does not grow with the
+    size of the file.
+    '''
+    logger = logging.getLogger()
+    root = None
+    depth = 0
+    try:
+        for event, elem in ET.iterparse(filname, events=('start', 'end')):
+            if event == 'start':
+                if root is None:
+                    root = elem
+                depth += 1
+                continue
+            depth -= 1
+            if depth != 1:
+                continue
+            if elem.tag != 'switch':
+                raise CiscomationException(
+                    'unknown xml tag {}'.format(elem.tag)
+                )
+            yield elem
+            root.clear()
+    except ParseError as e:
+        logger.critical("Impossible to read xml file")
+        print("last successful: {0}".format(e))
+        raise e
+
+
+def prescan_maintenance(filname):
+    '''
+    Goes through a maintenance file without keeping it, to count the switches
+    and check the commands before a streamed maintenance starts.
+
+    Returns
+    -------
+    maintenance: dict
+        with 'count' and 'mp_compat' keys.
+    '''
+    maintenance = {
+        'count': 0,
+        'mp_compat': True
+    }
+    for child in iter_switch_elements(filname):
+        switch, mp_compat = read_switch(child)
+        maintenance['count'] += 1
+        maintenance['mp_compat'] = maintenance['mp_compat'] and mp_compat
+    return maintenance
+
+
+def iter_maintenance(filname, dns_workers=16, dns_cache=None,
+                     trust_ip=False):
+    '''
+    Yields the actions of a maintenance file while it is being parsed. Names
+    are resolved by batches of dns_workers switches, dns_cache is saved once
+    the file is read or the maintenance stops reading it.
+    '''
+    batch = []
+    try:
+        for child in iter_switch_elements(filname):
+            batch.append(read_switch(child)[0])
+            if len(batch) >= max(1, dns_workers):
+                for action in resolve_switches(
+                    batch, dns_workers, dns_cache, trust_ip
+                ):
+                    yield action
+                batch = []
+        for action in resolve_switches(
+            batch, dns_workers, dns_cache, trust_ip
+        ):
+            yield action
+    finally:
+        if dns_cache:
+            dns_cache.save()
+
+
+def xml_to_maintenance(filname, dns_workers=16, dns_cache=None,
+                       trust_ip=False, stream=False):
     '''
     Reading xml to prepare a maintenance. Then plays teh maintenance. Get the
     feedback. and give a general status + detailed status.
+
+    Switch names are resolved once the whole file is read, concurrently, see
+    resolve_hosts. With trust_ip the address given in an optional <ip>
+    element of the switch is used as is, and its name is not resolved.
+
+    With stream, the file is only prescanned, see prescan_maintenance, and
+    maintenance['actions'] is a generator reading the switches while the
+    maintenance runs, see iter_maintenance.
     '''
     logger = logging.getLogger()
+    if stream:
+        maintenance = prescan_maintenance(filname)
+        maintenance['actions'] = iter_maintenance(
+            filname, dns_workers, dns_cache, trust_ip
+        )
+        if not maintenance['mp_compat']:
+            logger.warning('Maintenance not compliant with multi processing')
+        return maintenance
     maintenance = {
         'actions': [],
         'mp_compat': True
@@ -89,43 +359,20 @@ def xml_to_maintenance(filname):
         print("last successful: {0}".format(e))
         raise e
 
-    mp_compat = True
+    switches = []
     for child in root:
-        commands = ''
-        pause = False
         if child.tag == 'switch':
-            for prop in child:
-                if prop.tag == 'name':
-                    name = prop.text
-                    valid_host, ip = hostname_resolves(name)
-                    if not valid_host:
-                        logger.critical(
-                            'Could not resolve {}. Ignoring it.'.format(name)
-                        )
-                        break
-                elif prop.tag == 'commands':
-                    commands = [li for li in prop.text.splitlines()]
-                    if not commands[0].strip():
-                        commands = commands[1:]
-                        logger.debug(
-                            "{} First command was empty.".format(name)
-                        )
-                    mp_compat = mp_compat and check_mp_commands(commands)
-                elif prop == 'pause':
-                    pause = True
-                    mp_compat = False
+            switch, mp_compat = read_switch(child)
             maintenance['mp_compat'] = maintenance['mp_compat'] and mp_compat
-            maintenance['actions'].append(
-                {
-                    'swname': name,
-                    'ip': ip,
-                    'commands': commands,
-                    'pause': pause
-                }
-            )
-            logger.info('Maintenance now includes host {}'.format(name))
+            switches.append(switch)
         else:
             raise CiscomationException('unknown xml tag {}'.format(child.tag))
+    maintenance['actions'] = resolve_switches(
+        switches, dns_workers, dns_cache, trust_ip
+    )
+    if dns_cache:
+        dns_cache.save()
+    maintenance['count'] = len(maintenance['actions'])
     if not maintenance['mp_compat']:
         logger.warning('Maintenance not compliant with multi processing')
     return maintenance
@@ -75,7 +75,9 @@ setup(
     install_requires=[
         'Exscript>=2.1.503',
         'configargparse>=0.11.0',
-        'progressbar>=2.0'
+        'progressbar>=2.0',
+        'openpyxl>=2.4',
+        'futures>=3.0; python_version < "3"'
     ],
 
     # List additional groups of dependencies here (e.g. development